@@ -1,15 +1,24 @@
 # app.py
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g
 from functools import wraps
 import os
+import time
 from datetime import datetime
 
-from modules import user_manager, auth_service, webauthn_helpers, typing_analyzer
+from modules import behavioral_analyzer
+from modules import api_access, assets, auth_flow, auth_log, metrics, profiling, rate_limit, session_store
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
 
+auth_log.configure(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'], secret=app.config['SECRET_KEY'])
+metrics.configure(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+app.wsgi_app = profiling.RequestProfiler(app, app.wsgi_app)
+session_store.init_app(app)
+rate_limit.init_app(app)
+assets.init_app(app)
+
 with app.app_context():
     os.makedirs(os.path.dirname(app.config['USER_DB_PATH']), exist_ok=True)
 
@@ -17,6 +26,34 @@ with app.app_context():
 def inject_now():
     return {'now': datetime.utcnow}
 
+# --- Request Metrics ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        metrics.REQUESTS.inc(route, request.method, str(response.status_code))
+    return response
+
+# --- Replies ---
+# The views read the request and hand it to a step of modules/auth_flow.py,
+# which is shared with asgi.py; reply() turns the step's outcome into a response.
+def reply(outcome):
+    if outcome.flash:
+        flash(*outcome.flash)
+    if isinstance(outcome, auth_flow.Redirect):
+        return redirect(url_for(outcome.endpoint))
+    values = dict(outcome.values)
+    values.update((key, url_for(endpoint) if endpoint else None) for key, endpoint in outcome.links.items())
+    if isinstance(outcome, auth_flow.Json):
+        return jsonify(values), outcome.status, outcome.headers or {}
+    return render_template(outcome.template, **values), outcome.status, outcome.headers or {}
+
 # --- Decorators ---
 def login_required(f):
     @wraps(f)
@@ -36,6 +73,34 @@ def registration_in_progress(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def login_throttled(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        refused = auth_flow.throttle(session, request.form.get('email'), request.method == 'POST',
+                                     request.remote_addr, request.url_rule.rule, request.is_json)
+        if refused is not None:
+            return reply(refused)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def api_refusal(token_key, anonymous_key):
+    """None if the caller may use a machine-facing route (see modules/api_access.py), else the error reply."""
+    refused = api_access.refusal(app.config.get(token_key), app.config[anonymous_key],
+                                 request.headers.get('Authorization'), request.remote_addr)
+    if refused is None:
+        return None
+    message, status = refused
+    return jsonify({'error': message}), status
+
+def api_token_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        refused = api_refusal('BEHAVIOR_API_TOKEN', 'BEHAVIOR_API_ALLOW_ANONYMOUS')
+        if refused is not None:
+            return refused
+        return f(*args, **kwargs)
+    return decorated_function
+
 # --- Main Routes ---
 @app.route('/')
 def index():
@@ -51,203 +116,111 @@ def logout():
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        email = request.form.get('email')
-        if not email:
-            flash('Email is required.', 'error')
-            return redirect(url_for('register'))
-        if user_manager.get_user(email):
-            flash('An account with this email already exists.', 'error')
-            return redirect(url_for('register'))
-        session['registration_email'] = email
-        user_manager.create_user_profile(email)
-        return redirect(url_for('register_fingerprint'))
+        return reply(auth_flow.start_registration(session, request.form.get('email')))
     return render_template('register.html')
 
 @app.route('/register/fingerprint')
 @registration_in_progress
 def register_fingerprint():
-    email = session['registration_email']
-    options = webauthn_helpers.get_registration_options(email)
-    session['webauthn_challenge'] = options['challenge']
-    return render_template('fingerprint_prompt.html', title="Step 1: Register Fingerprint",
-                           instruction="Your browser will prompt you to scan your fingerprint.",
-                           options=options, form_action_url=url_for('verify_fingerprint_registration'),
-                           failure_redirect_url=None)
+    return reply(auth_flow.registration_fingerprint(session))
 
 @app.route('/register/verify_fingerprint', methods=['POST'])
 @registration_in_progress
 def verify_fingerprint_registration():
-    email = session['registration_email']
-    challenge = session.get('webauthn_challenge')
-    credential = request.get_json()
-    if auth_service.verify_webauthn_registration(credential, challenge):
-        user_manager.save_webauthn_credential(email, credential)
-        session.pop('webauthn_challenge', None)
-        return jsonify({'success': True, 'redirect_url': url_for('register_clicks')})
-    else:
-        return jsonify({'success': False, 'error': 'Fingerprint verification failed. Please try again.'}), 400
+    return reply(auth_flow.verify_fingerprint_registration(session, request.get_json(silent=True)))
 
 @app.route('/register/clicks')
 @registration_in_progress
 def register_clicks():
-    return render_template('click_challenge.html', title="Step 2: Create Click Pattern",
-                           instruction="Click on 3 distinct, memorable points on the image.",
-                           form_action_url=url_for('save_click_profile'))
+    return reply(auth_flow.registration_clicks())
 
 @app.route('/register/save_clicks', methods=['POST'])
 @registration_in_progress
 def save_click_profile():
-    email = session['registration_email']
-    data = request.get_json()
-    if not data:
-        return jsonify({'success': False, 'error': 'Invalid request format.'}), 400
-    clicks = data.get('clicks')
-    if isinstance(clicks, list) and len(clicks) == 3:
-        user_manager.save_click_profile(email, clicks)
-        return jsonify({'success': True, 'redirect_url': url_for('register_typing_baseline')})
-    else:
-        return jsonify({'success': False, 'error': 'You must select exactly 3 points. Please reset and try again.'}), 400
+    return reply(auth_flow.save_click_profile(session, request.get_json(silent=True)))
 
 @app.route('/register/typing_baseline', methods=['GET'])
 @registration_in_progress
 def register_typing_baseline():
-    challenge_sentence = "the quick brown fox jumps over the lazy dog"
-    return render_template('typing_challenge.html',
-                           title="Step 3: Create Typing Profile",
-                           challenge_text=challenge_sentence)
+    return reply(auth_flow.registration_typing())
 
 @app.route('/register/save_typing_baseline', methods=['POST'])
 @registration_in_progress
 def save_typing_baseline():
-    email = session['registration_email']
-    durations = request.form.getlist('durations', type=float)
-    if len(durations) == 4:
-        user_manager._update_user_field(email, 'typing_samples', durations)
-        average_speed = typing_analyzer.calculate_average(durations)
-        if average_speed is not None:
-            user_manager.save_typing_average(email, average_speed)
-        passkey = auth_service.generate_and_save_passkey(email)
-        session['passkey_to_show'] = passkey
-        return redirect(url_for('register_complete'))
-    else:
-        flash('There was an error collecting typing samples. Please try again.', 'error')
-        return redirect(url_for('register_typing_baseline'))
+    return reply(auth_flow.save_typing_baseline(session, request.form.getlist('durations', type=float),
+                                                request.form.getlist('keystrokes')))
 
 @app.route('/register/complete')
 @registration_in_progress
 def register_complete():
-    passkey = session.get('passkey_to_show')
-    if not passkey: return redirect(url_for('register'))
-    session.pop('registration_email', None)
-    session.pop('passkey_to_show', None)
-    flash('Registration successful! You can now log in.', 'success')
-    return render_template('registration_complete.html', passkey=passkey)
+    return reply(auth_flow.finish_registration(session))
 
 # --- Login Flow ---
 @app.route('/login', methods=['GET', 'POST'])
+@login_throttled
 def login():
     if request.method == 'POST':
-        email = request.form.get('email')
-        if not user_manager.get_user(email):
-            flash('No account found with that email. Please register first.', 'error')
-            return redirect(url_for('login'))
-        session['login_email'] = email
-        session['login_failures'] = 0
-        return redirect(url_for('login_with_fingerprint'))
+        return reply(auth_flow.start_login(session, request.form.get('email')))
     return render_template('login.html')
 
 @app.route('/login/fingerprint')
 def login_with_fingerprint():
-    email = session.get('login_email')
-    if not email: return redirect(url_for('login'))
-    user_credential = user_manager.get_webauthn_credential(email)
-    if not isinstance(user_credential, dict):
-        flash('No fingerprint registered. Proceeding to step-up challenge.', 'error')
-        return redirect(url_for('login_with_clicks'))
-    options = webauthn_helpers.get_authentication_options(user_credential)
-    session['webauthn_challenge'] = options['challenge']
-    return render_template('fingerprint_prompt.html', 
-                           title="Login: Verify Fingerprint",
-                           instruction="Please use your fingerprint scanner to log in.",
-                           options=options,
-                           form_action_url=url_for('verify_fingerprint_login'),
-                           failure_redirect_url=url_for('login_with_clicks'))
+    return reply(auth_flow.login_fingerprint(session))
 
 @app.route('/login/verify_fingerprint', methods=['POST'])
+@login_throttled
 def verify_fingerprint_login():
-    email = session.get('login_email')
-    challenge = session.get('webauthn_challenge')
-    login_credential = request.get_json()
-    if auth_service.verify_webauthn_authentication(email, login_credential, challenge):
-        session['is_authenticated'] = True
-        session.permanent = True
-        session['login_email'] = email
-        session.pop('webauthn_challenge', None)
-        return jsonify({'success': True, 'redirect_url': url_for('dashboard')})
-    else:
-        return jsonify({'success': False, 'redirect_url': url_for('login_with_clicks')})
+    return reply(auth_flow.verify_fingerprint_login(session, request.get_json(silent=True), request.remote_addr))
 
 @app.route('/login/clicks')
 def login_with_clicks():
-    if not session.get('login_email'): return redirect(url_for('login'))
-    return render_template('click_challenge.html', title="Step-Up Challenge: Image Clicks",
-                           instruction="Fingerprint failed. Please click your 3 secret points.",
-                           form_action_url=url_for('verify_click_login'))
+    return reply(auth_flow.login_clicks(session))
 
 @app.route('/login/verify_clicks', methods=['POST'])
+@login_throttled
 def verify_click_login():
-    email = session.get('login_email')
-    if not email: return jsonify({'success': False, 'error': 'Session expired.'}), 400
-    clicks = request.get_json().get('clicks')
-    if auth_service.verify_clicks(email, clicks):
-        session['is_authenticated'] = True
-        session.permanent = True
-        session['login_email'] = email
-        return jsonify({'success': True, 'redirect_url': url_for('dashboard')})
-    else:
-        # --- THIS IS THE CHANGE ---
-        # Instead of just redirecting, we now also increment the failure counter
-        session['login_failures'] = session.get('login_failures', 0) + 1
-        return jsonify({'success': False, 'redirect_url': url_for('login_step_up')})
+    data = request.get_json(silent=True) or {}
+    return reply(auth_flow.verify_click_login(session, data.get('clicks'), request.remote_addr))
 
 @app.route('/login/step_up', methods=['GET', 'POST'])
+@login_throttled
 def login_step_up():
-    email = session.get('login_email')
-    if not email: return redirect(url_for('login'))
-    
-    # Check for lockout BEFORE processing the form
-    if session.get('login_failures', 0) >= 2:
-        session.pop('login_email', None)
-        return redirect(url_for('locked_out'))
-
     if request.method == 'POST':
-        passkey = request.form.get('passkey')
-        typing_duration = float(request.form.get('typing_duration', '0'))
-        
-        passkey_ok = auth_service.verify_passkey(email, passkey)
-        typing_ok = typing_analyzer.verify_typing_speed(email, typing_duration)
-        
-        if passkey_ok and typing_ok:
-            session['is_authenticated'] = True
-            session.permanent = True
-            session['login_email'] = email
-            session.pop('login_failures', None)
-            flash('Recovery successful!', 'success')
-            return redirect(url_for('dashboard'))
-        else:
-            session['login_failures'] = session.get('login_failures', 0) + 1
-            if session['login_failures'] >= 2:
-                session.pop('login_email', None)
-                return redirect(url_for('locked_out'))
-            
-            flash('Recovery information was incorrect. Please try again.', 'error')
-            return redirect(url_for('login_step_up'))
-
-    # Calculate attempts left to display on the page
-    attempts_left = 2 - session.get('login_failures', 0)
-    return render_template('step_up_challenge.html',
-                           challenge_text="the quick brown fox jumps over the lazy dog",
-                           attempts_left=attempts_left)
+        form = request.form
+        return reply(auth_flow.verify_step_up(session, request.remote_addr, form.get('passkey'),
+                                              form.get('typing_duration'), form.get('keystrokes')))
+    return reply(auth_flow.step_up_page(session, request.remote_addr))
+
+# --- Offline Scoring API ---
+@app.route('/api/behavior/score_batch', methods=['POST'])
+@api_token_required
+def score_behavior_batch():
+    """
+    Rescores a batch of behavioral sessions for offline fraud review.
+    Body: {"sessions": [{"typing_duration": 5.2, "keystrokes": "0,95,130,88,..."}, ...]}
+    """
+    sessions, refused = auth_flow.batch_sessions(request.get_json(silent=True))
+    if refused is not None:
+        return reply(refused)
+    try:
+        scored = behavioral_analyzer.analyze_behavior_batch(sessions)
+    except (TypeError, ValueError):
+        return reply(auth_flow.INVALID_DURATION)
+    return reply(auth_flow.batch_scores(scored))
+
+@app.route('/api/behavior/models')
+@api_token_required
+def behavior_models():
+    """Lists the loaded behavioral model versions; the first one is active."""
+    return reply(auth_flow.model_versions())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: every counter and latency histogram, summed over all workers."""
+    refused = api_refusal('METRICS_TOKEN', 'METRICS_ALLOW_ANONYMOUS')
+    if refused is not None:
+        return refused
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @app.route('/locked_out')
 def locked_out():
@@ -0,0 +1,314 @@
+# asgi.py
+#
+# ASGI entry point: the routes of app.py as async views, for an event-loop
+# server such as Hypercorn. Both apps call the same steps of
+# modules/auth_flow.py and only differ in how they read requests and reply.
+#
+#   hypercorn asgi:app --bind 0.0.0.0:8501 --workers 4
+#
+# The Flask app of app.py stays the single home of the configuration, the
+# session interface and the rate limit buckets. Every blocking call into
+# `modules` (user store, sessions, rate limits, factor verification) runs on a
+# bounded thread pool inside that app's context, so the module code is the
+# same for both entry points; batch model scoring has a pool of its own (see
+# modules/offload.py). The event loop only parses requests, renders templates
+# and waits, and a full pool turns into 503 + Retry-After instead of a growing
+# queue. Hashed static files (modules/assets.py) are served as in app.py.
+# Request profiling (modules/profiling.py) wraps the WSGI app and does not
+# apply here.
+
+import time
+from datetime import datetime
+from functools import wraps
+
+from quart import Quart, render_template, request, redirect, url_for, session, flash, jsonify, g, send_from_directory
+from quart.sessions import SessionInterface
+
+from app import app as flask_app
+from modules import behavioral_analyzer
+from modules import api_access, assets, auth_flow, metrics, offload
+
+app = Quart(__name__)
+app.config.from_object('config.Config')
+
+store_pool = offload.BoundedPool('store', app.config['ASYNC_STORE_WORKERS'], app.config['ASYNC_STORE_MAX_PENDING'])
+model_pool = offload.BoundedPool('model', app.config['ASYNC_MODEL_WORKERS'], app.config['ASYNC_MODEL_MAX_PENDING'],
+                                 processes=app.config['ASYNC_MODEL_PROCESSES'])
+
+def in_flask_context(fn, *args, **kwargs):
+    """Calls fn in the context of app.py's Flask app, where `modules` finds its configuration."""
+    with flask_app.app_context():
+        return fn(*args, **kwargs)
+
+async def blocking(fn, *args, **kwargs):
+    """Runs a blocking `modules` call on the store pool."""
+    return await store_pool.run(in_flask_context, fn, *args, **kwargs)
+
+def current_session():
+    # The session proxy only resolves in this request's task; pool threads
+    # get the session object itself.
+    return session._get_current_object()
+
+class OffloadedSessionInterface(SessionInterface):
+    """Loads and saves sessions through app.py's session interface, on the store pool."""
+
+    async def open_session(self, app, request):
+        try:
+            return await blocking(lambda: flask_app.session_interface.open_session(app, request))
+        except offload.Overloaded as error:
+            # Raised here it would escape Quart's error handling; the request
+            # gets a null session and fails in refuse_when_overloaded instead.
+            g.overloaded = error
+            return None
+
+    async def save_session(self, app, session, response):
+        await blocking(flask_app.session_interface.save_session, app, session, response)
+
+app.session_interface = OffloadedSessionInterface()
+
+# --- Static Files ---
+static_assets = flask_app.extensions['assets']
+
+async def serve_static(filename):
+    found = static_assets.variant(filename, request.accept_encodings)
+    if found is None:
+        return await app.send_static_file(filename)
+    path, encoding = found
+    response = await send_from_directory(app.static_folder, path, mimetype=assets.mimetype(filename))
+    return static_assets.finish(response, encoding)
+
+if static_assets.files:
+    app.url_defaults(static_assets.url_defaults)
+    app.view_functions['static'] = serve_static
+
+@app.context_processor
+def inject_now():
+    return {'now': datetime.utcnow}
+
+@app.after_serving
+async def shutdown_pools():
+    store_pool.shutdown()
+    model_pool.shutdown()
+
+# --- Request Metrics and Backpressure ---
+@app.before_request
+async def refuse_when_overloaded():
+    error = g.pop('overloaded', None)
+    if error is not None:
+        raise error
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        metrics.REQUESTS.inc(route, request.method, str(response.status_code))
+    return response
+
+@app.errorhandler(offload.Overloaded)
+async def overloaded(error):
+    headers = {'Retry-After': str(app.config['ASYNC_RETRY_AFTER'])}
+    message = 'The server is busy. Please try again in a moment.'
+    if request.is_json:
+        return jsonify({'success': False, 'error': message}), 503, headers
+    return message, 503, headers
+
+# --- Replies ---
+async def reply(outcome):
+    """Turns an auth_flow outcome into a response, as reply() does in app.py."""
+    if outcome.flash:
+        await flash(*outcome.flash)
+    if isinstance(outcome, auth_flow.Redirect):
+        return redirect(url_for(outcome.endpoint))
+    values = dict(outcome.values)
+    values.update((key, url_for(endpoint) if endpoint else None) for key, endpoint in outcome.links.items())
+    if isinstance(outcome, auth_flow.Json):
+        return jsonify(values), outcome.status, outcome.headers or {}
+    return await render_template(outcome.template, **values), outcome.status, outcome.headers or {}
+
+async def step(fn, *args):
+    """Runs an auth_flow step with this request's session on the store pool and replies with its outcome."""
+    return await reply(await blocking(fn, current_session(), *args))
+
+# --- Decorators ---
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if not session.get('is_authenticated'):
+            await flash('You must be logged in to view this page.', 'error')
+            return redirect(url_for('login'))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+def registration_in_progress(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if not session.get('registration_email'):
+            await flash('Please start the registration process first.', 'error')
+            return redirect(url_for('register'))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+def login_throttled(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        refused = await blocking(auth_flow.throttle, current_session(), (await request.form).get('email'),
+                                 request.method == 'POST', request.remote_addr, request.url_rule.rule,
+                                 request.is_json)
+        if refused is not None:
+            return await reply(refused)
+        return await f(*args, **kwargs)
+    return decorated_function
+
+def api_refusal(token_key, anonymous_key):
+    """None if the caller may use a machine-facing route (see modules/api_access.py), else the error reply."""
+    refused = api_access.refusal(app.config.get(token_key), app.config[anonymous_key],
+                                 request.headers.get('Authorization'), request.remote_addr)
+    if refused is None:
+        return None
+    message, status = refused
+    return jsonify({'error': message}), status
+
+def api_token_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        refused = api_refusal('BEHAVIOR_API_TOKEN', 'BEHAVIOR_API_ALLOW_ANONYMOUS')
+        if refused is not None:
+            return refused
+        return await f(*args, **kwargs)
+    return decorated_function
+
+# --- Main Routes ---
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/logout')
+async def logout():
+    session.clear()
+    await flash('You have been successfully logged out.', 'success')
+    return redirect(url_for('index'))
+
+# --- Registration Flow ---
+@app.route('/register', methods=['GET', 'POST'])
+async def register():
+    if request.method == 'POST':
+        return await step(auth_flow.start_registration, (await request.form).get('email'))
+    return await render_template('register.html')
+
+@app.route('/register/fingerprint')
+@registration_in_progress
+async def register_fingerprint():
+    return await step(auth_flow.registration_fingerprint)
+
+@app.route('/register/verify_fingerprint', methods=['POST'])
+@registration_in_progress
+async def verify_fingerprint_registration():
+    return await step(auth_flow.verify_fingerprint_registration, await request.get_json(silent=True))
+
+@app.route('/register/clicks')
+@registration_in_progress
+async def register_clicks():
+    return await reply(in_flask_context(auth_flow.registration_clicks))
+
+@app.route('/register/save_clicks', methods=['POST'])
+@registration_in_progress
+async def save_click_profile():
+    return await step(auth_flow.save_click_profile, await request.get_json(silent=True))
+
+@app.route('/register/typing_baseline', methods=['GET'])
+@registration_in_progress
+async def register_typing_baseline():
+    return await reply(auth_flow.registration_typing())
+
+@app.route('/register/save_typing_baseline', methods=['POST'])
+@registration_in_progress
+async def save_typing_baseline():
+    form = await request.form
+    return await step(auth_flow.save_typing_baseline, form.getlist('durations', type=float), form.getlist('keystrokes'))
+
+@app.route('/register/complete')
+@registration_in_progress
+async def register_complete():
+    return await step(auth_flow.finish_registration)
+
+# --- Login Flow ---
+@app.route('/login', methods=['GET', 'POST'])
+@login_throttled
+async def login():
+    if request.method == 'POST':
+        return await step(auth_flow.start_login, (await request.form).get('email'))
+    return await render_template('login.html')
+
+@app.route('/login/fingerprint')
+async def login_with_fingerprint():
+    return await step(auth_flow.login_fingerprint)
+
+@app.route('/login/verify_fingerprint', methods=['POST'])
+@login_throttled
+async def verify_fingerprint_login():
+    return await step(auth_flow.verify_fingerprint_login, await request.get_json(silent=True), request.remote_addr)
+
+@app.route('/login/clicks')
+async def login_with_clicks():
+    return await step(auth_flow.login_clicks)
+
+@app.route('/login/verify_clicks', methods=['POST'])
+@login_throttled
+async def verify_click_login():
+    data = await request.get_json(silent=True) or {}
+    return await step(auth_flow.verify_click_login, data.get('clicks'), request.remote_addr)
+
+@app.route('/login/step_up', methods=['GET', 'POST'])
+@login_throttled
+async def login_step_up():
+    if request.method == 'POST':
+        form = await request.form
+        return await step(auth_flow.verify_step_up, request.remote_addr, form.get('passkey'),
+                          form.get('typing_duration'), form.get('keystrokes'))
+    return await step(auth_flow.step_up_page, request.remote_addr)
+
+# --- Offline Scoring API ---
+@app.route('/api/behavior/score_batch', methods=['POST'])
+@api_token_required
+async def score_behavior_batch():
+    """Rescores a batch of behavioral sessions on the model pool; same body and reply as in app.py."""
+    sessions, refused = in_flask_context(auth_flow.batch_sessions, await request.get_json(silent=True))
+    if refused is not None:
+        return await reply(refused)
+    try:
+        scored = await model_pool.run(behavioral_analyzer.analyze_behavior_batch, sessions)
+    except (TypeError, ValueError):
+        return await reply(auth_flow.INVALID_DURATION)
+    return await reply(auth_flow.batch_scores(scored))
+
+@app.route('/api/behavior/models')
+@api_token_required
+async def behavior_models():
+    """Lists the loaded behavioral model versions; the first one is active."""
+    return await reply(await blocking(auth_flow.model_versions))
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    """Prometheus scrape target: every counter and latency histogram, summed over all workers."""
+    refused = api_refusal('METRICS_TOKEN', 'METRICS_ALLOW_ANONYMOUS')
+    if refused is not None:
+        return refused
+    return await blocking(metrics.render), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/locked_out')
+async def locked_out():
+    return await render_template('locked_out.html')
+
+@app.route('/dashboard')
+@login_required
+async def dashboard():
+    return await render_template('dashboard.html')
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=8501, debug=True)
@@ -1,15 +1,26 @@
 # passwordless_auth_app/models/train_model.py
 
 import pandas as pd
+import numpy as np
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 from sklearn.svm import OneClassSVM
 import joblib
+import json
 import os
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from modules import keystroke_features
 
 print("Starting model training process...")
 
 # Define the path to save the model
 output_dir = os.path.dirname(__file__)
 model_path = os.path.join(output_dir, 'behavioral_model.pkl')
+metadata_path = os.path.join(output_dir, 'behavioral_model.json')
+npz_path = os.path.join(output_dir, 'behavioral_model.npz')
 data_path = os.path.join(output_dir, '..', 'data', 'sample_sessions.csv')
 
 # 1. Load data
@@ -24,8 +35,17 @@ except FileNotFoundError:
     df = pd.DataFrame(normal_behavior)
 
 # 2. Prepare data for the model
-# We are only using 'typing_duration' as a feature.
-X = df[['typing_duration']]
+# Sessions recorded with keystroke timings (a 'keystrokes' column) add the
+# keystroke-dynamics features; otherwise only 'typing_duration' is used.
+if 'keystrokes' in df.columns:
+    keystrokes = keystroke_features.extract_batch(df['keystrokes'].tolist())
+    X = pd.concat([df[['typing_duration']].reset_index(drop=True),
+                   pd.DataFrame(keystrokes, columns=keystroke_features.FEATURE_NAMES)], axis=1)
+    dropped = int(X.isna().any(axis=1).sum())
+    X = X.dropna()
+    print(f"Using keystroke features ({dropped} session(s) without usable timings dropped).")
+else:
+    X = df[['typing_duration']]
 print("Training data features:\n", X)
 
 # 3. Initialize and Train the One-Class SVM model
@@ -33,12 +53,48 @@ print("Training data features:\n", X)
 # and a lower bound of the fraction of support vectors. Essentially, it controls
 # the trade-off between finding all normal points and misclassifying some.
 ocsvm = OneClassSVM(kernel='rbf', gamma='auto', nu=0.05)
-ocsvm.fit(X)
+if X.shape[1] > 1:
+    # The keystroke features mix counts and seconds; standardize them so no
+    # single column dominates the RBF distance.
+    scaler = StandardScaler()
+    model = make_pipeline(scaler, ocsvm)
+else:
+    scaler = None
+    model = ocsvm
+model.fit(X.to_numpy(dtype=np.float64))
 
 # 4. Save the trained model to a file
-joblib.dump(ocsvm, model_path)
+# Write to a temp file and rename it into place: a running app hot-reloads the
+# model when the file changes and must never see a half-written pickle.
+metadata = {
+    "trained_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    "n_samples": len(X),
+    "features": list(X.columns),
+}
+with open(metadata_path + '.tmp', 'w', encoding='utf-8') as f:
+    json.dump(metadata, f, indent=2)
+os.replace(metadata_path + '.tmp', metadata_path)
+joblib.dump(model, model_path + '.tmp')
+os.replace(model_path + '.tmp', model_path)
+
+# 5. Export the RBF decision function as plain arrays (no pickle). The app
+# prefers this file and scores it with NumPy alone, without importing sklearn.
+# The scaler, if any, is exported as the per-feature mean and scale it applies.
+n_features = X.shape[1]
+with open(npz_path + '.tmp', 'wb') as f:
+    np.savez(
+        f,
+        support_vectors=ocsvm.support_vectors_,
+        dual_coef=ocsvm.dual_coef_.ravel(),
+        intercept=np.float64(ocsvm.intercept_[0]),
+        gamma=np.float64(ocsvm._gamma),
+        mean=scaler.mean_ if scaler is not None else np.zeros(n_features),
+        scale=scaler.scale_ if scaler is not None else np.ones(n_features),
+    )
+os.replace(npz_path + '.tmp', npz_path)
 
 print("-" * 30)
 print(f"✅ Model training complete.")
 print(f"Model saved to: '{model_path}'")
-print("You can now run the Streamlit web application.")
+print(f"NumPy export saved to: '{npz_path}' (check it with 'python -m tools.check_model_parity')")
+print("You can now run the web application. A running app picks up the new model within a few seconds.")
@@ -0,0 +1,39 @@
+# modules/api_access.py
+#
+# Access rule of the machine-facing routes: the behavioral scoring API
+# (/api/behavior/...) and /metrics.
+#
+# When a token is configured, callers must send "Authorization: Bearer <token>".
+# Without one, a route only answers clients on the same host (loopback
+# addresses): a scoring oracle, the model metadata and the login counters are
+# not public by default. A deployment that really wants them open sets the
+# route's ALLOW_ANONYMOUS setting.
+
+import hmac
+import ipaddress
+
+
+def is_loopback(address: str | None) -> bool:
+    # Quart reports '<local>' for connections without a peer address (a Unix socket).
+    if address == '<local>':
+        return True
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+def refusal(token: str | None, allow_anonymous: bool, authorization: str | None,
+            remote_addr: str | None) -> tuple[str, int] | None:
+    """Returns None if the caller may use the route, else (error message, HTTP status)."""
+    if token:
+        # Compared as bytes: compare_digest refuses str with non-ASCII characters,
+        # which a client can put in the header.
+        expected = f'Bearer {token}'.encode('utf-8', 'surrogateescape')
+        if authorization is None or not hmac.compare_digest(
+                authorization.encode('utf-8', 'surrogateescape'), expected):
+            return 'Unauthorized.', 401
+        return None
+    if allow_anonymous or is_loopback(remote_addr):
+        return None
+    return 'Forbidden: this route needs a token for remote clients.', 403
@@ -0,0 +1,99 @@
+# modules/assets.py
+#
+# Serving of the fingerprinted static files built by tools/build_assets.py.
+#
+# The build copies every file under static/ to static/dist/ under a name that
+# contains a hash of its content (css/style.3f9a1c2b7d4e.css), writes .br and
+# .gz variants next to the compressible ones, and records the names in
+# static/dist/manifest.json. When the manifest exists:
+#
+#   - url_for('static', filename='css/style.css') returns the hashed URL, so
+#     templates keep using the source names;
+#   - hashed files are served with Cache-Control: immutable for a year (a
+#     changed file gets a new name, so browsers never need to revalidate),
+#     in the best pre-compressed encoding the client accepts.
+#
+# Without a manifest (no build yet) static files are served as before. The
+# manifest is read at start-up, so restart the app after a build.
+
+import json
+import mimetypes
+
+from flask import current_app, request, send_from_directory
+
+MANIFEST_NAME = 'manifest.json'
+DIST_DIR = 'dist'
+
+# Pre-compressed variants, most preferred first: (Content-Encoding, file suffix).
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def load_manifest(path: str) -> dict:
+    """Returns {source name: {'path': hashed name, 'encodings': [...]}}; empty if there is no build."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['files']
+    except FileNotFoundError:
+        return {}
+
+
+class StaticAssets:
+    def __init__(self, manifest_path: str, max_age: int):
+        self.files = load_manifest(manifest_path)
+        self.max_age = max_age
+        self._encodings = {f"{DIST_DIR}/{entry['path']}": entry['encodings'] for entry in self.files.values()}
+
+    def url_defaults(self, endpoint: str, values: dict):
+        """url_defaults hook: points url_for('static') at the hashed copy of a built file."""
+        if endpoint == 'static' and 'filename' in values:
+            entry = self.files.get(values['filename'])
+            if entry is not None:
+                values['filename'] = f"{DIST_DIR}/{entry['path']}"
+
+    def variant(self, filename: str, accept_encodings) -> tuple[str, str | None] | None:
+        """
+        For a hashed file, returns (file to send, Content-Encoding or None)
+        according to the client's Accept-Encoding; None for any other file.
+        """
+        encodings = self._encodings.get(filename)
+        if encodings is None:
+            return None
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and accept_encodings.quality(encoding) > 0:
+                return filename + suffix, encoding
+        return filename, None
+
+    def finish(self, response, encoding: str | None):
+        """Sets the caching and encoding headers of a hashed file's response."""
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        response.cache_control.immutable = True
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def mimetype(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def serve_static(filename: str):
+    """Replacement for Flask's static view that knows about the hashed files."""
+    assets = current_app.extensions['assets']
+    found = assets.variant(filename, request.accept_encodings)
+    if found is None:
+        return current_app.send_static_file(filename)
+    path, encoding = found
+    response = send_from_directory(current_app.static_folder, path, mimetype=mimetype(filename))
+    return assets.finish(response, encoding)
+
+
+def init_app(app):
+    """Loads the manifest named by ASSETS_MANIFEST and, if there is one, serves the hashed files."""
+    assets = StaticAssets(app.config['ASSETS_MANIFEST'], app.config['ASSETS_MAX_AGE'])
+    app.extensions['assets'] = assets
+    if assets.files:
+        app.url_defaults(assets.url_defaults)
+        app.view_functions['static'] = serve_static
@@ -0,0 +1,338 @@
+# modules/auth_flow.py
+#
+# The registration and login steps behind the views of app.py and asgi.py.
+#
+# Each step is a plain function: it takes the session and the request values
+# it needs, does the store, factor, rate limit, logging and metrics work, and
+# returns what to answer as a Redirect, Json or Page. The apps only read the
+# request and turn that outcome into a response of their framework, so an
+# authentication change is made once here. The steps block (they call the
+# stores), need the Flask app context of app.py and take the session object
+# explicitly; asgi.py runs them on its store pool.
+#
+# Outcomes name endpoints rather than URLs, since a pool thread cannot build
+# URLs: `links` maps a JSON key or template variable to the endpoint whose URL
+# the app fills in (None for no URL).
+
+import logging
+import math
+from typing import NamedTuple
+
+from flask import current_app
+
+from . import auth_log, auth_service, behavioral_analyzer, click_matching, metrics, rate_limit, session_store
+from . import typing_analyzer, user_manager, webauthn_helpers
+
+log = auth_log.get_logger(__name__)
+
+CHALLENGE_SENTENCE = "the quick brown fox jumps over the lazy dog"
+
+
+class Redirect(NamedTuple):
+    endpoint: str
+    flash: tuple[str, str] | None = None
+
+
+class Json(NamedTuple):
+    values: dict
+    status: int = 200
+    headers: dict | None = None
+    links: dict = {}
+    flash: tuple[str, str] | None = None
+
+
+class Page(NamedTuple):
+    template: str
+    values: dict = {}
+    status: int = 200
+    headers: dict | None = None
+    links: dict = {}
+    flash: tuple[str, str] | None = None
+
+
+INVALID_DURATION = Json({'error': "Every 'typing_duration' must be a number."}, 400)
+
+
+def _grant(sess, email: str, factor: str, ip: str):
+    auth_log.event(log, logging.INFO, "login granted", email=email, factor=factor)
+    metrics.LOGINS.inc(factor, 'grant')
+    rate_limit.clear_failures(email, ip)
+    session_store.rotate_id(sess)
+    sess['is_authenticated'] = True
+    sess.permanent = True
+    sess['login_email'] = email
+
+
+# --- Login Throttling ---
+# Attempts are counted per client IP and per email, and failed click and
+# step-up challenges per email and client IP, in buckets shared by all workers
+# (see modules/rate_limit.py). The lockout only guards those two challenges:
+# /login and the fingerprint never fail into it, so a guesser cannot keep
+# the owner from signing in.
+
+def throttle(sess, email: str | None, post: bool, ip: str, route: str, wants_json: bool):
+    """None if the login request may go ahead, else the 429 reply."""
+    email = email or sess.get('login_email')
+    if post:
+        wait = rate_limit.login_wait(ip, email)
+        if wait:
+            auth_log.event(log, logging.WARNING, "login throttled", email=email, ip=ip)
+            metrics.THROTTLED.inc(route)
+            headers = {'Retry-After': str(math.ceil(wait))}
+            if wants_json:
+                return Json({'success': False, 'error': 'Too many attempts. Please wait and try again.'}, 429, headers)
+            return Page('locked_out.html', status=429, headers=headers)
+    return None
+
+
+def _locked_out(sess, email: str, ip: str, wants_json: bool = False):
+    """The lockout reply if this client has no challenge attempts left for the account, else None."""
+    if rate_limit.failures_left(email, ip) >= 1:
+        return None
+    sess.pop('login_email', None)
+    if wants_json:
+        return Json({'success': False}, links={'redirect_url': 'locked_out'})
+    return Redirect('locked_out')
+
+
+# --- Registration Flow ---
+
+def start_registration(sess, email: str | None):
+    if not email:
+        return Redirect('register', ('Email is required.', 'error'))
+    if user_manager.get_user(email):
+        return Redirect('register', ('An account with this email already exists.', 'error'))
+    sess['registration_email'] = email
+    user_manager.create_user_profile(email)
+    return Redirect('register_fingerprint')
+
+
+def registration_fingerprint(sess):
+    options = webauthn_helpers.get_registration_options(sess['registration_email'])
+    session_store.issue_challenge('webauthn', options['challenge'], sess)
+    return Page('fingerprint_prompt.html', {
+        'title': "Step 1: Register Fingerprint",
+        'instruction': "Your browser will prompt you to scan your fingerprint.",
+        'options': options,
+    }, links={'form_action_url': 'verify_fingerprint_registration', 'failure_redirect_url': None})
+
+
+def verify_fingerprint_registration(sess, credential):
+    email = sess['registration_email']
+    challenge = session_store.consume_challenge('webauthn', sess)
+    key = auth_service.verify_webauthn_registration(credential, challenge)
+    if key is None:
+        return Json({'success': False, 'error': 'Fingerprint verification failed. Please try again.'}, 400)
+    user_manager.save_webauthn_credential(email, credential)
+    user_manager.save_credential_key(email, key)
+    return Json({'success': True}, links={'redirect_url': 'register_clicks'})
+
+
+def registration_clicks():
+    points = current_app.config['CLICK_POINTS']
+    return Page('click_challenge.html', {
+        'title': "Step 2: Create Click Pattern",
+        'instruction': f"Click on {points} distinct, memorable points on the image.",
+        'click_points': points,
+    }, links={'form_action_url': 'save_click_profile'})
+
+
+def save_click_profile(sess, data):
+    if not data:
+        return Json({'success': False, 'error': 'Invalid request format.'}, 400)
+    points = current_app.config['CLICK_POINTS']
+    clicks = click_matching.to_points(data.get('clicks'), points)
+    if clicks is None:
+        return Json({'success': False,
+                     'error': f'You must select exactly {points} points. Please reset and try again.'}, 400)
+    user_manager.save_click_profile(sess['registration_email'], [{'x': x, 'y': y} for x, y in clicks.tolist()])
+    return Json({'success': True}, links={'redirect_url': 'register_typing_baseline'})
+
+
+def registration_typing():
+    return Page('typing_challenge.html', {
+        'title': "Step 3: Create Typing Profile",
+        'challenge_text': CHALLENGE_SENTENCE,
+    })
+
+
+def save_typing_baseline(sess, durations: list, keystrokes: list):
+    if len(durations) != 4:
+        return Redirect('register_typing_baseline',
+                        ('There was an error collecting typing samples. Please try again.', 'error'))
+    email = sess['registration_email']
+    user_manager._update_user_field(email, 'typing_samples', durations)
+    average_speed = typing_analyzer.calculate_average(durations)
+    if average_speed is not None:
+        user_manager.save_typing_average(email, average_speed)
+        user_manager.save_typing_stats(email, typing_analyzer.build_baseline(durations).to_dict())
+    # Seed the user's personal behavioral model with the baseline samples.
+    if len(keystrokes) != len(durations):
+        keystrokes = [None] * len(durations)
+    behavioral_analyzer.record_sessions(email, [
+        {'typing_duration': d, 'keystrokes': k} for d, k in zip(durations, keystrokes)
+    ])
+    sess['passkey_to_show'] = auth_service.generate_and_save_passkey(email)
+    return Redirect('register_complete')
+
+
+def finish_registration(sess):
+    passkey = sess.get('passkey_to_show')
+    if not passkey:
+        return Redirect('register')
+    sess.pop('registration_email', None)
+    sess.pop('passkey_to_show', None)
+    return Page('registration_complete.html', {'passkey': passkey},
+                flash=('Registration successful! You can now log in.', 'success'))
+
+
+# --- Login Flow ---
+# Each step loads the user once and passes the record to every factor.
+
+def start_login(sess, email: str | None):
+    if not user_manager.load_request_user(email):
+        return Redirect('login', ('No account found with that email. Please register first.', 'error'))
+    sess['login_email'] = email
+    return Redirect('login_with_fingerprint')
+
+
+def login_fingerprint(sess):
+    email = sess.get('login_email')
+    if not email:
+        return Redirect('login')
+    user = user_manager.load_request_user(email)
+    key = auth_service.load_credential_key(email, user) if user else None
+    if key is None:
+        metrics.ESCALATIONS.inc('fingerprint', 'clicks')
+        return Redirect('login_with_clicks', ('No fingerprint registered. Proceeding to step-up challenge.', 'error'))
+    options = webauthn_helpers.get_authentication_options(key.credential_id)
+    session_store.issue_challenge('webauthn', options['challenge'], sess)
+    return Page('fingerprint_prompt.html', {
+        'title': "Login: Verify Fingerprint",
+        'instruction': "Please use your fingerprint scanner to log in.",
+        'options': options,
+    }, links={'form_action_url': 'verify_fingerprint_login', 'failure_redirect_url': 'login_with_clicks'})
+
+
+def verify_fingerprint_login(sess, credential, ip: str):
+    email = sess.get('login_email')
+    challenge = session_store.consume_challenge('webauthn', sess)
+    user = user_manager.load_request_user(email) if email else None
+    if user and auth_service.verify_webauthn_authentication(email, credential, challenge, user=user):
+        _grant(sess, email, 'fingerprint', ip)
+        return Json({'success': True}, links={'redirect_url': 'dashboard'})
+    metrics.LOGINS.inc('fingerprint', 'deny')
+    metrics.ESCALATIONS.inc('fingerprint', 'clicks')
+    return Json({'success': False}, links={'redirect_url': 'login_with_clicks'})
+
+
+def login_clicks(sess):
+    email = sess.get('login_email')
+    if not email:
+        return Redirect('login')
+    # Users keep the number of points they registered with.
+    user = user_manager.load_request_user(email)
+    points = len(user.click_profile or []) if user else 0
+    points = points or current_app.config['CLICK_POINTS']
+    return Page('click_challenge.html', {
+        'title': "Step-Up Challenge: Image Clicks",
+        'instruction': f"Fingerprint failed. Please click your {points} secret points.",
+        'click_points': points,
+    }, links={'form_action_url': 'verify_click_login'})
+
+
+def verify_click_login(sess, clicks, ip: str):
+    email = sess.get('login_email')
+    if not email:
+        return Json({'success': False, 'error': 'Session expired.'}, 400)
+    locked = _locked_out(sess, email, ip, wants_json=True)
+    if locked is not None:
+        return locked
+    user = user_manager.load_request_user(email)
+    if auth_service.verify_clicks(email, clicks, user=user, tolerance=current_app.config['CLICK_TOLERANCE_RADIUS']):
+        _grant(sess, email, 'clicks', ip)
+        return Json({'success': True}, links={'redirect_url': 'dashboard'})
+    # A failed click pattern counts towards the lockout like a failed step-up.
+    rate_limit.record_failure(email, ip)
+    metrics.LOGINS.inc('clicks', 'deny')
+    metrics.ESCALATIONS.inc('clicks', 'step_up')
+    return Json({'success': False}, links={'redirect_url': 'login_step_up'})
+
+
+def step_up_page(sess, ip: str):
+    email = sess.get('login_email')
+    if not email:
+        return Redirect('login')
+    return _locked_out(sess, email, ip) or Page('step_up_challenge.html', {
+        'challenge_text': CHALLENGE_SENTENCE,
+        'attempts_left': rate_limit.failures_left(email, ip),
+    })
+
+
+def verify_step_up(sess, ip: str, passkey: str | None, typing_duration: str | None, keystrokes: str | None):
+    email = sess.get('login_email')
+    if not email:
+        return Redirect('login')
+    locked = _locked_out(sess, email, ip)
+    if locked is not None:
+        return locked
+    # A duration that is not a finite number fails the typing factor like a wrong one.
+    try:
+        typing_duration = float(typing_duration or '0')
+    except (TypeError, ValueError):
+        typing_duration = None
+    if typing_duration is not None and not math.isfinite(typing_duration):
+        typing_duration = None
+    user = user_manager.load_request_user(email)
+    passkey_ok = auth_service.verify_passkey(email, passkey, user=user)
+    typing_ok = typing_duration is not None and typing_analyzer.verify_typing_speed(email, typing_duration, user=user)
+
+    if passkey_ok and typing_ok:
+        typing_analyzer.update_baseline(email, typing_duration, user=user)
+        behavioral_analyzer.record_sessions(email, [{
+            'typing_duration': typing_duration,
+            'keystrokes': keystrokes,
+        }], user=user)
+        _grant(sess, email, 'step_up', ip)
+        return Redirect('dashboard', ('Recovery successful!', 'success'))
+
+    locked = rate_limit.record_failure(email, ip)
+    auth_log.event(log, logging.INFO, "step-up denied", email=email, factor='step_up', ip=ip,
+                   passkey=passkey_ok, typing=typing_ok, failures_left=rate_limit.failures_left(email, ip))
+    metrics.LOGINS.inc('step_up', 'deny')
+    if locked:
+        auth_log.event(log, logging.WARNING, "locked out", email=email, ip=ip)
+        metrics.LOCKOUTS.inc()
+        sess.pop('login_email', None)
+        return Redirect('locked_out')
+    return Redirect('login_step_up', ('Recovery information was incorrect. Please try again.', 'error'))
+
+
+# --- Offline Scoring API ---
+# The apps score the sessions themselves (asgi.py on its model pool) between
+# these two steps; a TypeError or ValueError from scoring is INVALID_DURATION.
+
+def batch_sessions(data) -> tuple[list | None, Json | None]:
+    """The sessions of a score_batch body, or the error reply."""
+    sessions = data.get('sessions') if isinstance(data, dict) else None
+    if not isinstance(sessions, list) or not all(isinstance(s, dict) for s in sessions):
+        return None, Json({'error': "Expected a JSON body with a 'sessions' list."}, 400)
+    limit = current_app.config['BEHAVIOR_BATCH_MAX_SESSIONS']
+    if len(sessions) > limit:
+        return None, Json({'error': f"At most {limit} sessions per request."}, 413)
+    return sessions, None
+
+
+def batch_scores(scored) -> Json:
+    decisions, scores, model_version = scored
+    return Json({
+        'decisions': decisions,
+        'scores': [None if score != score else float(score) for score in scores],
+        'model_version': model_version,
+    })
+
+
+def model_versions() -> Json:
+    """The loaded behavioral model versions; the first one is active."""
+    behavioral_analyzer.REGISTRY.active()
+    return Json({'versions': behavioral_analyzer.REGISTRY.versions()})
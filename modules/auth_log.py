@@ -0,0 +1,121 @@
+# modules/auth_log.py
+#
+# Structured logging for the authentication modules.
+#
+# Modules log through get_logger(__name__) and attach fields with event():
+#
+#   log = auth_log.get_logger(__name__)
+#   auth_log.event(log, logging.DEBUG, "typing checked", email=email, duration=d, decision=ok)
+#
+# event() returns immediately when the level is disabled, before any field is
+# built or hashed; call sites that compute fields only for the log guard with
+# log.isEnabledFor(). An 'email' field is never logged as such: it is replaced
+# by a keyed hash, so one user's events can be correlated without the log
+# holding addresses.
+#
+# configure() puts a queue between the loggers and the output: the request
+# thread only enqueues the record, and a listener thread formats it (JSON lines
+# or text) and writes it.
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+ROOT = 'auth'
+
+_hash_key = b''
+_listener = None
+_configure_lock = threading.Lock()
+
+# Attributes every LogRecord has; anything else was passed as a field.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the 'auth' hierarchy, e.g. 'modules.typing_analyzer' -> 'auth.typing_analyzer'."""
+    return logging.getLogger(f"{ROOT}.{name.rpartition('.')[2]}")
+
+
+def email_hash(email: str | None) -> str | None:
+    if email is None:
+        return None
+    digest = hmac.new(_hash_key, email.strip().lower().encode('utf-8'), hashlib.sha256)
+    return digest.hexdigest()[:16]
+
+
+def event(logger: logging.Logger, level: int, message: str, email: str | None = None, **fields):
+    """Logs `message` with structured fields, if `level` is enabled."""
+    if not logger.isEnabledFor(level):
+        return
+    if email is not None:
+        fields['email_hash'] = email_hash(email)
+    logger.log(level, message, extra=fields, stacklevel=2)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, then the fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with the fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = ' '.join(f'{key}={value}' for key, value in vars(record).items()
+                          if key not in _RECORD_ATTRIBUTES and not key.startswith('_'))
+        return f'{line} {fields}' if fields else line
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats the record on the calling thread before
+    # enqueueing it. The queue here never leaves the process, so the record can
+    # go as is and the listener thread does all the formatting.
+    def prepare(self, record):
+        return record
+
+
+def configure(level: str | int = 'INFO', fmt: str = 'json', stream=None, secret: str | bytes | None = None):
+    """
+    Routes the 'auth' loggers through a queue to a background writer.
+    Calling it again changes the level and the email hash key only.
+    """
+    global _listener, _hash_key
+    if secret is not None:
+        _hash_key = secret.encode('utf-8') if isinstance(secret, str) else secret
+    logger = logging.getLogger(ROOT)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    with _configure_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        records = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+        logger.addHandler(_DeferredQueueHandler(records))
+        logger.propagate = False
@@ -1,9 +1,15 @@
 # modules/auth_service.py
 
+import logging
 import random
 import string
-import math  # Make sure math is imported for the distance calculation
-from . import user_manager, webauthn_helpers
+
+import numpy as np
+
+from . import auth_log, click_matching, metrics, user_manager, webauthn_helpers
+from .user_record import CredentialKey, UserRecord
+
+log = auth_log.get_logger(__name__)
 
 # --- Passkey Generation (Unaltered from your code) ---
 def generate_and_save_passkey(email: str) -> str:
@@ -17,74 +23,118 @@ def generate_and_save_passkey(email: str) -> str:
     user_manager.save_secret_passkey(email, passkey)
     return passkey
 
-# --- WebAuthn Verification (Unaltered from your code) ---
-def verify_webauthn_registration(credential, expected_challenge: str) -> bool:
+# --- WebAuthn Verification ---
+def verify_webauthn_registration(credential, expected_challenge: str) -> CredentialKey | None:
+    """
+    Verifies the registration credential received from the browser.
+    Returns the credential's key to store, or None if verification fails.
+    """
+    if not isinstance(credential, dict) or not expected_challenge:
+        return None
+    key = webauthn_helpers.verify_registration(credential, expected_challenge)
+    auth_log.event(log, logging.DEBUG, "fingerprint registered", factor='fingerprint', decision=key is not None)
+    return key
+
+def load_credential_key(email: str, user: UserRecord | None = None) -> CredentialKey | None:
     """
-    Verifies the registration credential received from the browser. (Placeholder)
+    Returns the user's stored WebAuthn key. Credentials registered before keys
+    were stored are parsed from their attestation object once and upgraded.
     """
-    return credential is not None and expected_challenge is not None
+    if user is None:
+        user = user_manager.get_user(email)
+    if user is None:
+        return None
+    if user.credential_key is not None:
+        return user.credential_key
+    credential = user.webauthn_credential
+    key = webauthn_helpers.key_from_attestation(credential) if isinstance(credential, dict) else None
+    if key is not None:
+        user_manager.save_credential_key(email, key)
+        auth_log.event(log, logging.INFO, "stored key of legacy credential", email=email, factor='fingerprint')
+    return key
 
-def verify_webauthn_authentication(email: str, login_credential, expected_challenge: str) -> bool:
+@metrics.timed(metrics.FACTOR_SECONDS, 'fingerprint')
+def verify_webauthn_authentication(email: str, login_credential, expected_challenge: str,
+                                   user: UserRecord | None = None) -> bool:
     """
-    Verifies the authentication credential received from the browser. (Placeholder)
+    Verifies the authentication credential received from the browser: one
+    signature check with the stored key, plus the sign count.
+    Pass `user` to reuse an already-loaded record instead of fetching it again.
     """
-    return login_credential is not None and expected_challenge is not None
+    key = load_credential_key(email, user)
+    if key is None or not isinstance(login_credential, dict) or not expected_challenge:
+        auth_log.event(log, logging.DEBUG, "fingerprint checked", email=email, factor='fingerprint', decision=False)
+        return False
+    sign_count = webauthn_helpers.verify_authentication(login_credential, expected_challenge, key)
+    accepted = sign_count is not None
+    if accepted and sign_count != key.sign_count:
+        user_manager.save_sign_count(email, sign_count)
+    auth_log.event(log, logging.DEBUG, "fingerprint checked", email=email, factor='fingerprint', decision=accepted)
+    return accepted
 
 
-# --- THIS IS THE UPDATED FUNCTION ---
-def verify_clicks(email: str, new_clicks: list) -> bool:
+# --- Click Pattern Verification ---
+@metrics.timed(metrics.FACTOR_SECONDS, 'clicks')
+def verify_clicks(email: str, new_clicks: list, user: UserRecord | None = None,
+                  tolerance: float = click_matching.TOLERANCE_RADIUS) -> bool:
     """
     Verifies a user's click pattern using a tolerance radius to account for human error.
-    This creates the "average circular round area" you described.
-    
+    Each new point must fall inside the circle of radius `tolerance` around the
+    baseline point with the same index; the number of points is taken from the baseline.
+
     Args:
         email (str): The user's email.
         new_clicks (list): A list of {x, y} dicts from the new login attempt.
+        user (UserRecord, optional): The already-loaded user record. Fetched from the store if omitted.
+        tolerance (float, optional): The radius in pixels.
 
     Returns:
         bool: True if the pattern matches within the tolerance, False otherwise.
     """
-    # Define the radius of the acceptable "circular area" in pixels.
-    # A value of 35 is a good starting point for marginal error.
-    TOLERANCE_RADIUS = 35
+    result = check_clicks(email, new_clicks, user=user, tolerance=tolerance)
+    if log.isEnabledFor(logging.DEBUG):
+        if result is None:
+            auth_log.event(log, logging.DEBUG, "clicks checked", email=email, factor='clicks',
+                           decision=False, reason='missing or malformed points')
+        else:
+            auth_log.event(log, logging.DEBUG, "clicks checked", email=email, factor='clicks',
+                           distances=[round(d, 1) for d in result.distances.tolist()],
+                           tolerance=tolerance, decision=result.matched)
+    return result is not None and result.matched
 
-    baseline_clicks = user_manager.get_click_profile(email)
-
-    # Add robust validation to prevent crashes if data is missing or malformed.
-    if not baseline_clicks or not isinstance(baseline_clicks, list) or len(baseline_clicks) != 3:
-        print(f"Verification failed: Baseline clicks for {email} are missing or invalid.")
-        return False
-    if not new_clicks or not isinstance(new_clicks, list) or len(new_clicks) != 3:
-        print(f"Verification failed: New click attempt is missing or invalid.")
-        return False
-
-    # Iterate through each of the three points, comparing the baseline to the new attempt.
-    for i, (baseline_point, new_point) in enumerate(zip(baseline_clicks, new_clicks)):
-        # Calculate the Euclidean distance between the saved point and the new point.
-        # distance = sqrt((x2 - x1)^2 + (y2 - y1)^2)
-        distance = math.sqrt(
-            (baseline_point["x"] - new_point["x"])**2 + 
-            (baseline_point["y"] - new_point["y"])**2
-        )
-        
-        # If the distance is greater than our allowed tolerance, the check fails immediately.
-        if distance > TOLERANCE_RADIUS:
-            # This print statement is very helpful for debugging in your terminal
-            print(f"Click verification for {email} FAILED on point #{i+1}. Distance was {distance:.1f}px (Max is {TOLERANCE_RADIUS}px).")
-            return False
-            
-    # If the loop completes, it means all points were within the tolerance radius.
-    print(f"Click verification for {email} SUCCEEDED.")
-    return True
+def check_clicks(email: str, new_clicks: list, user: UserRecord | None = None,
+                 tolerance: float = click_matching.TOLERANCE_RADIUS) -> click_matching.ClickMatch | None:
+    """
+    Like verify_clicks, but returns the decision together with the distance of
+    every point from its baseline. Returns None if the user has no valid
+    baseline or the attempt is malformed or has the wrong number of points.
+    """
+    if user is None:
+        user = user_manager.get_user(email)
+    if user is None or not user.click_points:
+        return None
+    # Zero-copy view of the record's packed x0, y0, x1, y1, ... array.
+    baseline = np.frombuffer(user.click_points, dtype=np.float64).reshape(-1, 2)
+    attempt = click_matching.to_points(new_clicks, len(baseline))
+    if attempt is None:
+        return None
+    return click_matching.match(baseline, attempt, tolerance)
 
 
 # --- Passkey Verification (Unaltered from your code) ---
-def verify_passkey(email: str, attempt: str) -> bool:
+@metrics.timed(metrics.FACTOR_SECONDS, 'passkey')
+def verify_passkey(email: str, attempt: str, user: UserRecord | None = None) -> bool:
     """
     Verifies a user's submitted passkey attempt. Case-insensitive and strips whitespace.
+    Pass `user` to reuse an already-loaded record instead of fetching it again.
     """
-    correct_passkey = user_manager.get_secret_passkey(email)
-    if not correct_passkey:
+    if user is None:
+        user = user_manager.get_user(email)
+    correct_passkey = user.secret_passkey if user else None
+    if not correct_passkey or not attempt:
+        auth_log.event(log, logging.DEBUG, "passkey checked", email=email, factor='passkey', decision=False)
         return False
-    
-    return attempt.strip().lower() == correct_passkey.lower()
\ No newline at end of file
+
+    accepted = attempt.strip().lower() == correct_passkey.lower()
+    auth_log.event(log, logging.DEBUG, "passkey checked", email=email, factor='passkey', decision=accepted)
+    return accepted
\ No newline at end of file
@@ -1,44 +1,324 @@
 # passwordless_auth_app/modules/behavioral_analyzer.py
 
-import joblib
-import numpy as np
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from . import auth_log, keystroke_features, metrics, user_manager, user_models
+from .user_record import UserRecord
+
+log = auth_log.get_logger(__name__)
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'behavioral_model.pkl')
+# sklearn-free export of the same model; preferred over the pickle when present.
+MODEL_NPZ_PATH = os.path.splitext(MODEL_PATH)[0] + '.npz'
+# Written next to the model by models/train_model.py.
+MODEL_METADATA_PATH = os.path.splitext(MODEL_PATH)[0] + '.json'
+
+# How often (seconds) the model file is checked for a retrained version.
+MODEL_CHECK_INTERVAL = 2.0
+
+# Used when a session carries no typing duration.
+DEFAULT_TYPING_DURATION = 15.0
+
+# Features of models whose metadata does not list any (trained before keystroke
+# capture).
+DEFAULT_FEATURES = ('typing_duration',)
+
+# Features of the per-user models: the typing duration plus the mean keystroke
+# timings, with the floor (seconds) under each one's standard deviation.
+# Models stored with a different feature count start again from scratch.
+USER_FEATURES = ('typing_duration', 'dwell_mean', 'flight_mean', 'digraph_mean')
+USER_MIN_STD = (user_models.MIN_STD, 0.01, 0.02, 0.02)
+
+
+class NumpyOneClassSVM:
+    """
+    Pure-NumPy decision function of an RBF One-Class SVM.
+
+    Loads the support vectors, dual coefficients, intercept and gamma exported by
+    models/train_model.py into a plain .npz archive (no pickle), and computes
+    sum_i(alpha_i * exp(-gamma * |x - sv_i|^2)) + intercept for a whole batch at once.
+    If the export carries a 'mean' and 'scale' (a StandardScaler in front of the
+    SVM), inputs are standardized with them first.
+    """
+
+    # Rows scored per block, to bound the (rows x support vectors) kernel matrix.
+    CHUNK_ROWS = 65536
+
+    def __init__(self, support_vectors, dual_coef, intercept: float, gamma: float,
+                 mean=None, scale=None):
+        self.support_vectors = np.ascontiguousarray(support_vectors, dtype=np.float64)
+        self.dual_coef = np.ascontiguousarray(dual_coef, dtype=np.float64).ravel()
+        self.intercept = float(intercept)
+        self.gamma = float(gamma)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self._sv_sq_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+        self.n_features_in_ = self.support_vectors.shape[1]
+
+    @classmethod
+    def load(cls, path: str) -> 'NumpyOneClassSVM':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['support_vectors'], data['dual_coef'],
+                       data['intercept'].item(), data['gamma'].item(),
+                       data['mean'] if 'mean' in data.files else None,
+                       data['scale'] if 'scale' in data.files else None)
+
+    def decision_function(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if self.mean is not None:
+            X = (X - self.mean) / self.scale
+        out = np.empty(X.shape[0])
+        for start in range(0, X.shape[0], self.CHUNK_ROWS):
+            block = X[start:start + self.CHUNK_ROWS]
+            # |x - sv|^2 = |x|^2 + |sv|^2 - 2 x.sv, clipped against rounding below zero.
+            sq_dists = np.einsum('ij,ij->i', block, block)[:, None] + self._sv_sq_norms - 2.0 * (block @ self.support_vectors.T)
+            np.maximum(sq_dists, 0.0, out=sq_dists)
+            out[start:start + self.CHUNK_ROWS] = np.exp(-self.gamma * sq_dists) @ self.dual_coef + self.intercept
+        return out
+
+    def predict(self, X) -> np.ndarray:
+        return np.where(self.decision_function(X) > 0, 1, -1)
+
 
-try:
-    MODEL = joblib.load(MODEL_PATH)
-except FileNotFoundError:
-    MODEL = None
-    print(f"Warning: Model file not found at {MODEL_PATH}. The analyzer will deny all requests.")
-    print("Please run 'python models/train_model.py' to generate the model.")
+class ModelVersion:
+    """One loaded model plus what identifies it."""
+
+    __slots__ = ('model', 'engine', 'features', 'version', 'checksum', 'trained_at', 'loaded_at')
+
+    def __init__(self, model, engine: str, checksum: str, trained_at: str,
+                 features: tuple = DEFAULT_FEATURES):
+        self.model = model
+        self.engine = engine
+        self.features = tuple(features)
+        self.checksum = checksum
+        self.version = checksum[:12]
+        self.trained_at = trained_at
+        self.loaded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "engine": self.engine,
+            "features": list(self.features),
+            "checksum": self.checksum,
+            "trained_at": self.trained_at,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """
+    Loads the model lazily on first use and hot-reloads it when the file changes.
 
-def extract_features(data: dict) -> np.ndarray:
+    `paths` lists the model files in order of preference; the first one that
+    exists is used (.npz files with the NumPy engine, anything else through
+    joblib). At most every `check_interval` seconds a caller stats it; if it
+    changed, that caller loads the new version and swaps it in. Other requests
+    keep using the current version meanwhile, and a file that fails to load
+    leaves the current version active. The last `keep` versions are remembered.
+    """
+
+    def __init__(self, paths: list, metadata_path: str, check_interval: float = MODEL_CHECK_INTERVAL,
+                 keep: int = 5):
+        self.paths = paths
+        self.metadata_path = metadata_path
+        self.check_interval = check_interval
+        self._active = None
+        self._file_id = None
+        self._next_check = 0.0
+        self._load_lock = threading.Lock()
+        self._history = deque(maxlen=keep)
+        self._warned_missing = False
+
+    def active(self) -> ModelVersion | None:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._reload_if_changed()
+        return self._active
+
+    def versions(self) -> list:
+        """Known versions, newest first; the first entry is the active one."""
+        return [version.info() for version in reversed(self._history)]
+
+    def _reload_if_changed(self):
+        # Only one thread loads; the others carry on with the current model.
+        if not self._load_lock.acquire(blocking=self._active is None):
+            return
+        try:
+            path = next((p for p in self.paths if os.path.exists(p)), None)
+            if path is None:
+                if not self._warned_missing:
+                    log.warning("Model file not found at %s. The analyzer will deny all requests. "
+                                "Please run 'python models/train_model.py' to generate the model.", self.paths[-1])
+                    self._warned_missing = True
+                return
+            st = os.stat(path)
+            file_id = (path, st.st_mtime_ns, st.st_size)
+            if file_id == self._file_id:
+                return
+            try:
+                version = self._load(path, st)
+            except Exception:
+                log.warning("Could not load model from %s. Keeping the current model.", path, exc_info=True)
+                return
+            self._file_id = file_id
+            self._history.append(version)
+            self._active = version
+            self._warned_missing = False
+            auth_log.event(log, logging.INFO, "model loaded", path=path, **version.info())
+        finally:
+            self._load_lock.release()
+
+    def _load(self, path: str, st) -> ModelVersion:
+        with open(path, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        if path.endswith('.npz'):
+            model, engine = NumpyOneClassSVM.load(path), 'numpy'
+        else:
+            import joblib  # deferred: keeps sklearn off the worker start-up path
+            model, engine = joblib.load(path), 'sklearn'
+        metadata = {}
+        try:
+            with open(self.metadata_path, encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            pass
+        trained_at = metadata.get('trained_at')
+        if trained_at is None:
+            trained_at = datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(timespec='seconds')
+        features = tuple(metadata.get('features') or DEFAULT_FEATURES)
+        expected = getattr(model, 'n_features_in_', len(features))
+        if len(features) != expected:
+            raise ValueError(f"metadata lists {len(features)} features but the model expects {expected}")
+        unknown = set(features) - set(DEFAULT_FEATURES) - set(keystroke_features.FEATURE_NAMES)
+        if unknown:
+            raise ValueError(f"unknown features {sorted(unknown)}")
+        return ModelVersion(model, engine, checksum, trained_at, features)
+
+
+REGISTRY = ModelRegistry([MODEL_NPZ_PATH, MODEL_PATH], MODEL_METADATA_PATH)
+
+def active_model_info() -> dict | None:
+    """Describes the model currently used for scoring, or None if there is none."""
+    version = REGISTRY.active()
+    return version.info() if version else None
+
+def extract_features(data: dict, feature_names: tuple = DEFAULT_FEATURES) -> np.ndarray:
     """
     Converts raw behavioral data into a feature vector for the model.
-    For this demo, we only use typing duration. A real system would use many more features.
     """
-    # Use a default value if 'typing_duration' is missing
-    duration = data.get('typing_duration', 15.0) 
-    # The model expects a 2D array, so we reshape it: [[value]]
-    return np.array([[duration]])
+    return extract_features_batch([data], feature_names)
 
-def analyze_behavior(data: dict) -> str:
+def extract_features_batch(sessions: list, feature_names: tuple = DEFAULT_FEATURES) -> np.ndarray:
+    """
+    Builds one (n_sessions, len(feature_names)) matrix for a list of sessions.
+
+    'typing_duration' comes straight from each session; the keystroke features
+    are computed for the whole batch from the sessions' 'keystrokes' strings.
+    Sessions without usable keystroke data get NaN in those columns.
+    """
+    out = np.empty((len(sessions), len(feature_names)))
+    keystrokes = None
+    for column, name in enumerate(feature_names):
+        if name == 'typing_duration':
+            out[:, column] = np.fromiter(
+                (session.get('typing_duration', DEFAULT_TYPING_DURATION) for session in sessions),
+                dtype=np.float64, count=len(sessions),
+            )
+        else:
+            if keystrokes is None:
+                keystrokes = keystroke_features.extract_batch([session.get('keystrokes') for session in sessions])
+            out[:, column] = keystrokes[:, keystroke_features.FEATURE_NAMES.index(name)]
+    return out
+
+@metrics.timed(metrics.FACTOR_SECONDS, 'behavior')
+def analyze_behavior(data: dict, email: str | None = None, user: UserRecord | None = None) -> str:
     """
     Analyzes the behavioral feature vector using the pre-trained model.
     Returns a decision: 'Grant' or 'Deny'.
+
+    When an email (or an already-loaded user) is given, that user's personal
+    model has seen enough sessions and the session carries keystroke timings,
+    the session is judged against the user's own behavior instead of the
+    global model.
+    """
+    score = behavior_score(data, email, user)
+    decision = "Grant" if score > 0 else "Deny"
+    auth_log.event(log, logging.DEBUG, "behavior checked", email=email or (user.email if user else None),
+                   factor='behavior', score=score, decision=decision)
+    return decision
+
+def behavior_score(data: dict, email: str | None = None, user: UserRecord | None = None) -> float:
+    """
+    The score analyze_behavior decides on: positive means the session looks
+    normal. NaN when there is no model or the session lacks a needed feature.
+    """
+    if user is None and email is not None:
+        user = user_manager.get_user(email)
+    if user is not None:
+        features = extract_features(data, USER_FEATURES)[0]
+        stats = user_models.RunningStats.from_dict(user.behavior_model, len(features))
+        # A session without keystroke timings is left to the global model.
+        if user_models.is_trained(stats) and not np.isnan(features).any():
+            return user_models.score(stats, features.tolist(), USER_MIN_STD)
+    _, scores, _ = analyze_behavior_batch([data])
+    return float(scores[0])
+
+def record_sessions(email: str, sessions: list, user: UserRecord | None = None):
+    """
+    Folds accepted sessions into the user's personal model and saves it.
+    Costs O(n_features) per session and the stored state never grows.
+    Sessions without usable keystroke timings are skipped.
+    """
+    if user is None:
+        user = user_manager.get_user(email)
+    if user is None or not sessions:
+        return
+    features = extract_features_batch(sessions, USER_FEATURES)
+    features = features[~np.isnan(features).any(axis=1)]
+    if not len(features):
+        return
+    stats = user_models.RunningStats.from_dict(user.behavior_model, features.shape[1])
+    for row in features.tolist():
+        stats.update(row, decay=user_models.DECAY)
+    user_manager.save_behavior_model(email, stats.to_dict())
+
+def analyze_behavior_batch(sessions: list) -> tuple[list, np.ndarray, str | None]:
+    """
+    Scores many sessions with a single model call.
+
+    Returns (decisions, scores, model_version): a 'Grant'/'Deny' decision per
+    session, the raw One-Class SVM decision values (positive means inlier) and
+    the version of the model that produced them. Without a model every session
+    is denied, the scores are NaN and the version is None; sessions lacking a
+    feature the model needs are denied with a NaN score.
     """
-    if MODEL is None:
-        return "Deny"  # Fail-safe: if the model isn't loaded, deny access.
+    version = REGISTRY.active()
+    if version is None:
+        return ["Deny"] * len(sessions), np.full(len(sessions), np.nan), None
+    if not sessions:
+        return [], np.empty(0), version.version
 
-    features = extract_features(data)
-    
-    # The One-Class SVM predicts:
-    #  1 for an "inlier" (normal, trusted behavior)
-    # -1 for an "outlier" (anomalous, untrusted behavior)
-    prediction = MODEL.predict(features)
+    features = extract_features_batch(sessions, version.features)
 
-    if prediction[0] == 1:
-        return "Grant"
-    else:
-        return "Deny"
+    # Sessions the model's features cannot be computed for (e.g. no keystroke
+    # timings) are denied with a NaN score rather than scored on made-up values.
+    complete = ~np.isnan(features).any(axis=1)
+    scores = np.full(len(sessions), np.nan)
+    if complete.any():
+        # The One-Class SVM predicts an "inlier" (1, trusted) exactly when the
+        # decision value is positive, so one decision_function call gives both.
+        with metrics.MODEL_INFERENCE_SECONDS.time(version.engine):
+            scores[complete] = version.model.decision_function(features[complete])
+    decisions = np.where(scores > 0, "Grant", "Deny").tolist()
+    return decisions, scores, version.version
@@ -0,0 +1,96 @@
+# modules/click_matching.py
+#
+# Click-pattern matching with NumPy. A pattern is an (n_points, 2) array of
+# x, y pixel coordinates; an attempt matches its baseline when every point lies
+# within the tolerance radius of the baseline point with the same index.
+#
+# The batch functions take stacked (n_attempts, n_points, 2) arrays, so an
+# offline replay of thousands of recorded attempts, and a sweep over candidate
+# radii, are a few array operations (see tools/replay_clicks.py).
+
+from typing import NamedTuple
+
+import numpy as np
+
+# Radius (pixels) of the acceptable circle around each baseline point.
+TOLERANCE_RADIUS = 35.0
+
+
+class ClickMatch(NamedTuple):
+    matched: bool
+    # Distance (pixels) of each attempted point from its baseline point.
+    distances: np.ndarray
+
+
+def to_points(clicks, n_points: int | None = None) -> np.ndarray | None:
+    """
+    Converts a list of {x, y} dicts, or an already flat x0, y0, x1, y1, ...
+    sequence of numbers, to an (n, 2) float array. Returns None when the input
+    is malformed, holds non-finite values, or (if n_points is given) has a
+    different number of points.
+    """
+    if clicks is None or isinstance(clicks, (str, bytes)):
+        return None
+    try:
+        if len(clicks) and isinstance(clicks[0], dict):
+            points = np.array([(point['x'], point['y']) for point in clicks], dtype=np.float64)
+        else:
+            points = np.asarray(clicks, dtype=np.float64).reshape(-1, 2)
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) == 0:
+        return None
+    if n_points is not None and len(points) != n_points:
+        return None
+    if not np.isfinite(points).all():
+        return None
+    return points
+
+
+def match(baseline: np.ndarray, attempt: np.ndarray, tolerance: float = TOLERANCE_RADIUS) -> ClickMatch:
+    """Compares one attempt with its baseline; both must have the same shape."""
+    distances = np.sqrt(np.square(attempt - baseline).sum(axis=-1))
+    return ClickMatch(bool((distances <= tolerance).all()), distances)
+
+
+def stack(patterns: list, n_points: int) -> np.ndarray:
+    """
+    Stacks click patterns (as accepted by to_points) into one
+    (len(patterns), n_points, 2) array. Patterns that are malformed or have a
+    different number of points become rows of NaN, which never match.
+    """
+    out = np.full((len(patterns), n_points, 2), np.nan)
+    for i, pattern in enumerate(patterns):
+        points = to_points(pattern, n_points)
+        if points is not None:
+            out[i] = points
+    return out
+
+
+def match_batch(baselines: np.ndarray, attempts: np.ndarray,
+                tolerance: float = TOLERANCE_RADIUS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compares many attempts with their baselines at once.
+
+    Returns (matched, distances): a bool per attempt and the (n_attempts,
+    n_points) per-point distances. Rows containing NaN never match.
+    """
+    distances = np.sqrt(np.square(attempts - baselines).sum(axis=-1))
+    with np.errstate(invalid='ignore'):
+        matched = (distances <= tolerance).all(axis=1)
+    return matched, distances
+
+
+def acceptance_rates(distances: np.ndarray, radii) -> np.ndarray:
+    """
+    Fraction of attempts that would match at each radius in `radii`, from the
+    per-point distances returned by match_batch. An attempt matches when its
+    farthest point is within the radius, so sorting those once answers every
+    radius with a binary search.
+    """
+    radii = np.asarray(radii, dtype=np.float64)
+    if len(distances) == 0:
+        return np.zeros(radii.shape)
+    # NaN (invalid) rows sort last and are never counted.
+    worst = np.sort(distances.max(axis=1))
+    return np.searchsorted(worst, radii, side='right') / len(worst)
@@ -0,0 +1,96 @@
+# modules/file_lock.py
+
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Cross-process lock on a small side file (e.g. users.csv.lock).
+
+    Acquisition polls a non-blocking lock with exponential backoff and raises
+    TimeoutError after `timeout` seconds. Shared (reader) locks are supported on
+    POSIX; on Windows every lock is exclusive. Re-acquiring a lock the current
+    thread already holds is a no-op, so locked methods may call each other.
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, shared: bool = False):
+        self._thread_lock.acquire()
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            delay = 0.001
+            deadline = time.monotonic() + self.timeout
+            while not self._try_lock(shared):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for lock on '{self.path}'")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.1)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        self._thread_lock.release()
+
+    def _try_lock(self, shared: bool) -> bool:
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def shared(self):
+        return _Held(self, shared=True)
+
+    def exclusive(self):
+        return _Held(self, shared=False)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _Held:
+    def __init__(self, lock: FileLock, shared: bool):
+        self._lock = lock
+        self._shared = shared
+
+    def __enter__(self):
+        self._lock.acquire(shared=self._shared)
+        return self._lock
+
+    def __exit__(self, *exc):
+        self._lock.release()
@@ -0,0 +1,124 @@
+# modules/keystroke_features.py
+#
+# Keystroke-dynamics features from the compact timing string sent by the typing
+# challenges (see static/js/keystrokes.js). Each keystroke is two integers in
+# milliseconds:
+#
+#   delta  time from the previous key-down (0 for the first key)
+#   dwell  how long the key was held (key-up minus key-down)
+#
+# so "0,95,130,88,141,102" is three keystrokes. Because delta already is the
+# down-to-down (digraph) latency, and flight time is delta minus the previous
+# dwell, every feature is a shifted difference plus a per-session sum; the
+# whole batch is processed with a handful of array operations and no Python
+# loop over keystrokes.
+
+import warnings
+
+import numpy as np
+
+# Output columns, all in seconds except keystroke_count.
+FEATURE_NAMES = (
+    'keystroke_duration', 'keystroke_count',
+    'dwell_mean', 'dwell_std',
+    'flight_mean', 'flight_std',
+    'digraph_mean', 'digraph_std',
+)
+
+# Longer sessions are treated as invalid (bounds the work per request).
+MAX_KEYSTROKES = 500
+
+
+def extract_batch(encoded_sessions: list) -> np.ndarray:
+    """
+    Returns an (n_sessions, len(FEATURE_NAMES)) matrix. Rows of sessions that
+    are missing or malformed are NaN.
+    """
+    n = len(encoded_sessions)
+    out = np.full((n, len(FEATURE_NAMES)), np.nan)
+    if n == 0:
+        return out
+
+    # Counting commas is the only per-session work; parsing is one C-level pass.
+    texts = [s if isinstance(s, str) else '' for s in encoded_sessions]
+    lengths = np.fromiter((s.count(',') + 1 if s else 0 for s in texts), dtype=np.int64, count=n)
+    values = _parse(','.join(s for s in texts if s))
+    if values is None or values.size != lengths.sum():
+        # Some session holds a non-number; fall back to validating one by one.
+        return _extract_checked(texts)
+
+    keys = lengths // 2
+    valid = (lengths % 2 == 0) & (keys > 0) & (keys <= MAX_KEYSTROKES)
+    pairs = values.reshape(-1, 2) if values.size % 2 == 0 else None
+    if pairs is None or not valid.all():
+        # Drop sessions with a dangling value so the remaining pairs line up.
+        keep = np.repeat(valid, lengths)
+        pairs = values[keep].reshape(-1, 2)
+        keys = np.where(valid, keys, 0)
+    delta = pairs[:, 0] / 1000.0
+    dwell = pairs[:, 1] / 1000.0
+
+    session = np.repeat(np.arange(n), keys)
+    first = np.zeros(len(session), dtype=bool)
+    starts = np.cumsum(keys) - keys
+    first[starts[keys > 0]] = True
+    broken = (delta < 0) | (dwell < 0) | ~np.isfinite(delta) | ~np.isfinite(dwell)
+    bad = np.bincount(session, weights=broken.astype(np.float64), minlength=n) > 0
+    valid &= ~bad
+
+    # Pairs of consecutive keys inside the same session.
+    follow = ~first
+    digraph = delta[follow]
+    flight = delta[follow] - dwell[np.flatnonzero(follow) - 1]
+    pair_session = session[follow]
+
+    counts = keys.astype(np.float64)
+    last_dwell = np.zeros(n)
+    has_keys = keys > 0
+    last_dwell[has_keys] = dwell[(starts + keys - 1)[has_keys]]
+
+    out[:, 0] = np.bincount(session, weights=delta, minlength=n) + last_dwell
+    out[:, 1] = counts
+    out[:, 2], out[:, 3] = _segment_mean_std(dwell, session, counts, n)
+    out[:, 4], out[:, 5] = _segment_mean_std(flight, pair_session, counts - 1, n)
+    out[:, 6], out[:, 7] = _segment_mean_std(digraph, pair_session, counts - 1, n)
+    out[~valid] = np.nan
+    return out
+
+
+def extract(encoded: str) -> np.ndarray:
+    """Features of a single session (a row of extract_batch)."""
+    return extract_batch([encoded])[0]
+
+
+def _segment_mean_std(values, segment, counts, n):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = np.bincount(segment, weights=values, minlength=n)
+        total_sq = np.bincount(segment, weights=values * values, minlength=n)
+        mean = np.where(counts > 0, total / counts, np.nan)
+        var = np.where(counts > 0, total_sq / counts - mean * mean, np.nan)
+    return mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def _parse(joined: str) -> np.ndarray | None:
+    if not joined:
+        return np.empty(0)
+    try:
+        with warnings.catch_warnings():
+            # NumPy only warns when it stops early at a non-number.
+            warnings.simplefilter('error', DeprecationWarning)
+            return np.fromstring(joined, dtype=np.float64, sep=',')
+    except (ValueError, DeprecationWarning):
+        return None
+
+
+def _extract_checked(texts: list) -> np.ndarray:
+    cleaned = []
+    for s in texts:
+        try:
+            if s:
+                np.array(s.split(','), dtype=np.float64)
+        except ValueError:
+            s = ''
+        cleaned.append(s)
+    return extract_batch(cleaned)
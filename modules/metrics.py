@@ -0,0 +1,360 @@
+# modules/metrics.py
+#
+# In-process metrics registry with Prometheus text output.
+#
+# Counters and histograms keep plain Python numbers per label combination, so
+# recording is a bisect, a dict lookup and an addition under a lock: about a
+# microsecond, and a request records about ten values. Histograms store
+# per-bucket counts and make them cumulative only when rendered.
+#
+# With several worker processes (gunicorn -w N), point METRICS_DIR at a
+# directory shared by the workers. Each process then writes its snapshot to
+# <pid>-<token>.json there from a background thread, and /metrics in any worker
+# sums all snapshots. Snapshots of processes that have exited are folded into
+# archive.json so that counters never go backwards. Worker processes that a
+# process starts itself (modules/offload.py's process pools) are configured
+# from child_settings(), so their snapshots land next to its own.
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from functools import wraps
+
+from .file_lock import FileLock
+
+# Latency buckets in seconds, from 100 microseconds to 10 seconds.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ARCHIVE_NAME = 'archive.json'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def _reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        # Slot i counts values in (buckets[i-1], buckets[i]]; the slot after the
+        # last bucket is +Inf and the final element is the sum.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels) -> '_Timer':
+        """Context manager that observes the time spent in its block."""
+        return _Timer(self, labels)
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {labels: list(series) for labels, series in self._values.items()}
+
+    def _reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._directory = None
+        self._flush_interval = None
+        self._token = uuid.uuid4().hex[:8]
+        self._flusher = None
+        self._configure_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        return self._metrics.setdefault(metric.name, metric)
+
+    # --- Multi-process ---
+
+    def configure(self, directory: str | None, flush_interval: float = 5.0):
+        """Shares this process's metrics through `directory` (None keeps them in-process only)."""
+        with self._configure_lock:
+            self._directory = directory
+            self._flush_interval = flush_interval
+            if directory is None:
+                return
+            os.makedirs(directory, exist_ok=True)
+            if self._flusher is None:
+                atexit.register(self.flush)
+            self._start_flusher()
+
+    def child_settings(self) -> tuple[str, float]:
+        """
+        The (directory, flush interval) for child processes to configure, so
+        that this process's /metrics includes them. Without a directory this
+        process switches to a private temporary one.
+        """
+        if self._directory is None:
+            self.configure(tempfile.mkdtemp(prefix='auth-metrics-'), self._flush_interval or 5.0)
+        return self._directory, self._flush_interval
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self._flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass  # e.g. the directory went away; try again next time
+
+    def _path(self) -> str:
+        return os.path.join(self._directory, f"{os.getpid()}-{self._token}.json")
+
+    def flush(self):
+        """Writes this process's snapshot to the shared directory."""
+        if self._directory is None:
+            return
+        path = self._path()
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._encode(self._snapshot()), f)
+        os.replace(path + '.tmp', path)
+
+    def _after_fork(self):
+        # A forked worker starts from zero (the parent keeps reporting what it
+        # recorded) and needs fresh locks and its own flush thread.
+        self._token = uuid.uuid4().hex[:8]
+        self._configure_lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._reset()
+        if self._directory is not None:
+            self._start_flusher()
+
+    # --- Snapshots ---
+
+    def _snapshot(self) -> dict:
+        return {name: metric._snapshot() for name, metric in self._metrics.items()}
+
+    @staticmethod
+    def _encode(snapshot: dict) -> dict:
+        return {name: [[list(labels), value] for labels, value in series.items()]
+                for name, series in snapshot.items()}
+
+    @staticmethod
+    def _decode(data: dict) -> dict:
+        return {name: {tuple(labels): value for labels, value in series} for name, series in data.items()}
+
+    @staticmethod
+    def _merge(total: dict, snapshot: dict):
+        for name, series in snapshot.items():
+            merged = total.setdefault(name, {})
+            for labels, value in series.items():
+                current = merged.get(labels)
+                if current is None:
+                    merged[labels] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    if len(value) == len(current):
+                        merged[labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[labels] = current + value
+
+    def _read(self, path: str) -> dict:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return self._decode(json.load(f))
+        except (OSError, ValueError):
+            return {}
+
+    def _collect(self) -> dict:
+        """This process's live values plus, when shared, every other snapshot."""
+        total = {}
+        self._merge(total, self._snapshot())
+        if self._directory is None:
+            return total
+        self._archive_exited()
+        own = os.path.abspath(self._path())
+        for path in glob.glob(os.path.join(self._directory, '*.json')):
+            if os.path.abspath(path) != own:
+                self._merge(total, self._read(path))
+        return total
+
+    def _archive_exited(self):
+        # Only on POSIX, where signal 0 checks a pid without touching the process.
+        if os.name != 'posix':
+            return
+        exited = []
+        for path in glob.glob(os.path.join(self._directory, '*-*.json')):
+            pid = os.path.basename(path).split('-', 1)[0]
+            if pid.isdigit() and not _alive(int(pid)):
+                exited.append(path)
+        if not exited:
+            return
+        lock = FileLock(os.path.join(self._directory, 'archive.lock'))
+        archive_path = os.path.join(self._directory, ARCHIVE_NAME)
+        with lock.exclusive():
+            archive = self._read(archive_path)
+            folded = [path for path in exited if os.path.exists(path)]
+            for path in folded:
+                self._merge(archive, self._read(path))
+            with open(archive_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self._encode(archive), f)
+            os.replace(archive_path + '.tmp', archive_path)
+            for path in folded:
+                os.remove(path)
+
+    # --- Output ---
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        values = self._collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(values.get(name, {}).items()):
+                pairs = [f'{key}="{_escape(val)}"' for key, val in zip(metric.labelnames, labels)]
+                if metric.kind == 'counter':
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    bucket_labels = _labels(pairs + [f'le="{le}"'])
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(pairs: list) -> str:
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+REGISTRY = Registry()
+
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+configure = REGISTRY.configure
+child_settings = REGISTRY.child_settings
+render = REGISTRY.render
+
+
+def timed(metric: Histogram, *labels):
+    """Decorator that observes each call's duration in `metric`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start, *labels)
+        return wrapper
+    return decorator
+
+
+# --- Application Metrics ---
+# Defined here so every module records into the same series.
+
+REQUEST_SECONDS = histogram(
+    'auth_http_request_duration_seconds', 'Time to handle a request, by route.', ('route', 'method'))
+REQUESTS = counter(
+    'auth_http_requests_total', 'Requests handled, by route and status code.', ('route', 'method', 'status'))
+FACTOR_SECONDS = histogram(
+    'auth_factor_duration_seconds', 'Time to verify one authentication factor.', ('factor',))
+STORAGE_SECONDS = histogram(
+    'auth_storage_duration_seconds', 'Time spent in user store operations.', ('op',))
+USER_CACHE_LOOKUPS = counter(
+    'auth_user_cache_lookups_total', 'User record cache lookups, by result.', ('result',))
+MODEL_INFERENCE_SECONDS = histogram(
+    'auth_model_inference_seconds', 'Time for one behavioral model scoring call.', ('engine',))
+LOGINS = counter(
+    'auth_logins_total', 'Login decisions, by factor and decision (grant or deny).', ('factor', 'decision'))
+ESCALATIONS = counter(
+    'auth_escalations_total', 'Logins sent on to a further challenge.', ('from_factor', 'to_factor'))
+LOCKOUTS = counter(
+    'auth_lockouts_total', 'Logins locked out after too many failed challenges.')
+THROTTLED = counter(
+    'auth_login_throttled_total', 'Login attempts refused by the per-IP or per-email rate limit.', ('route',))
+OFFLOAD_WAIT_SECONDS = histogram(
+    'auth_offload_wait_seconds', 'Time a blocking call waited for a worker of an offload pool.', ('pool',))
+OFFLOAD_REJECTED = counter(
+    'auth_offload_rejected_total', 'Blocking calls refused because an offload pool was full.', ('pool',))
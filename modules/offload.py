@@ -0,0 +1,82 @@
+# modules/offload.py
+#
+# Bounded pools for calling blocking code from an event loop (see asgi.py).
+#
+# The stores, the session and rate limit backends and the behavioral model are
+# synchronous. Called on the event loop they would stall every other request,
+# so the async views hand them to a pool instead. A pool runs at most
+# `workers` calls at once and lets at most `max_pending` more wait for a
+# worker; a call beyond that raises Overloaded straight away, which the app
+# answers with 503 and Retry-After. Rejecting early keeps the queue short
+# enough for the requests in it to finish in time, instead of letting
+# every request slow down under overload.
+#
+# Thread pools suit the store work, which mostly waits on SQLite and the
+# filesystem. CPU-bound model scoring can go to a process pool, whose
+# workers do not compete for the GIL; its calls and results must then be
+# picklable, and it runs without the Flask app context. Its workers write
+# metrics snapshots (see modules/metrics.py) that /metrics sums with the app's.
+
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import metrics
+
+
+def _start_worker(metrics_dir: str, flush_interval: float):
+    # Runs first in each process pool worker, which starts with empty metrics.
+    metrics.configure(metrics_dir, flush_interval)
+
+
+class Overloaded(Exception):
+    """Raised when a pool already has `max_pending` calls waiting."""
+
+    def __init__(self, pool: str):
+        super().__init__(f"offload pool '{pool}' is full")
+        self.pool = pool
+
+
+class BoundedPool:
+    def __init__(self, name: str, workers: int, max_pending: int, processes: bool = False):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.processes = processes
+        if processes:
+            # 'spawn' rather than fork: the app process runs threads (log
+            # queue, challenge pool) whose locks a forked child could inherit held.
+            self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_start_worker, initargs=metrics.child_settings())
+        else:
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix=f'offload-{name}')
+        # The semaphore keeps the executor's own queue empty; waiting happens
+        # here, where it can be counted and capped.
+        self._slots = asyncio.Semaphore(workers)
+        self._waiting = 0
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the pool and returns its result."""
+        if self._slots.locked():
+            if self._waiting >= self.max_pending:
+                metrics.OFFLOAD_REJECTED.inc(self.name)
+                raise Overloaded(self.name)
+            self._waiting += 1
+            started = time.perf_counter()
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+            metrics.OFFLOAD_WAIT_SECONDS.observe(time.perf_counter() - started, self.name)
+        else:
+            await self._slots.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,272 @@
+# modules/profiling.py
+#
+# Opt-in per-request profiling, installed as WSGI middleware around the app.
+#
+# A request is profiled when any of these holds:
+#   - PROFILE_ALL is set (every request; for local reproduction),
+#   - a random draw falls under PROFILE_SAMPLE_RATE (e.g. 0.001 in production),
+#   - it carries a valid X-Profile header: "<expiry>.<signature>", where the
+#     signature is an HMAC-SHA256 of "profile:<expiry>" with SECRET_KEY. Mint
+#     one with `python -m tools.profiles token`.
+#
+# PROFILE_MODE picks the profiler: 'cprofile' (exact deterministic profile,
+# adds noticeable overhead to the profiled request) or 'sample' (a thread
+# samples the request thread's stack every PROFILE_SAMPLE_INTERVAL seconds;
+# cheap, but only statistical, and it needs the GIL to take a sample, so a
+# CPU-bound request is sampled at most every sys.getswitchinterval(), 5 ms by
+# default; aggregate many requests). Profiles are saved to PROFILE_DIR as
+#
+#   <utc time>-<METHOD>-<route>-<ms>ms-<pid>.prof          (cProfile)
+#   <utc time>-<METHOD>-<route>-<ms>ms-<pid>.sample.json   (sampling)
+#
+# and only the newest PROFILE_MAX_FILES are kept. Requests that are not
+# profiled pay one dict lookup (and one random() when sampling is enabled).
+#
+# The response body is passed on chunk by chunk as the app produces it; the
+# profiler only runs while the app is working (not while the server sends),
+# and the profile is saved when the server closes the response. The duration
+# in the name runs until then.
+#
+# Profiling stays off while SECRET_KEY is the development default: anyone
+# could sign X-Profile headers with it.
+
+import cProfile
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from werkzeug.exceptions import HTTPException
+
+from config import DEV_SECRET_KEY
+from . import auth_log
+
+log = auth_log.get_logger(__name__)
+
+HEADER = 'X-Profile'
+_HEADER_ENVIRON_KEY = 'HTTP_' + HEADER.upper().replace('-', '_')
+
+
+def sign(secret: str, expiry: int) -> str:
+    """Header value that allows profiling requests until `expiry` (unix time)."""
+    signature = hmac.new(secret.encode('utf-8'), f"profile:{expiry}".encode('ascii'), hashlib.sha256).hexdigest()
+    return f"{expiry}.{signature}"
+
+
+def verify(secret: str, value: str) -> bool:
+    expiry = value.partition('.')[0]
+    if not expiry.isdigit() or int(expiry) < time.time():
+        return False
+    return hmac.compare_digest(sign(secret, int(expiry)), value)
+
+
+def route_slug(route: str) -> str:
+    """File-name form of a route, e.g. '/login/verify_clicks' -> 'login_verify_clicks'."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+class RequestProfiler:
+    """
+    WSGI middleware; install with `app.wsgi_app = RequestProfiler(app, app.wsgi_app)`.
+    Settings are read from app.config on every request, so they can be changed at runtime.
+    """
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self._rotate_lock = threading.Lock()
+        self._warned_insecure = False
+
+    def __call__(self, environ, start_response):
+        config = self.app.config
+        if not self._wanted(environ, config):
+            return self.wsgi_app(environ, start_response)
+
+        mode = config.get('PROFILE_MODE', 'cprofile')
+        if mode == 'sample':
+            profiler = _StackSampler(threading.get_ident(), config.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is active in this thread; serve the request unprofiled.
+                return self.wsgi_app(environ, start_response)
+            profiler.disable()
+        response = _ProfiledResponse(self, profiler, mode, environ, config)
+        response.start(start_response)
+        return response
+
+    def _wanted(self, environ, config) -> bool:
+        if config.get('PROFILE_ALL'):
+            wanted = True
+        else:
+            rate = config.get('PROFILE_SAMPLE_RATE') or 0.0
+            header = environ.get(_HEADER_ENVIRON_KEY)
+            wanted = bool(rate and random.random() < rate) or (bool(header) and verify(config['SECRET_KEY'], header))
+        if wanted and config['SECRET_KEY'] == DEV_SECRET_KEY:
+            if not self._warned_insecure:
+                log.warning("Request profiling is disabled: SECRET_KEY is the development default. Set SECRET_KEY.")
+                self._warned_insecure = True
+            return False
+        return wanted
+
+    def _route(self, environ) -> str:
+        try:
+            rule, _ = self.app.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.rule
+        except HTTPException:
+            return environ.get('PATH_INFO', '')
+
+    def _save(self, profiler, mode, environ, status, elapsed, config):
+        directory = config.get('PROFILE_DIR')
+        os.makedirs(directory, exist_ok=True)
+        route = self._route(environ)
+        method = environ.get('REQUEST_METHOD', 'GET')
+        now = datetime.now(timezone.utc)
+        base = os.path.join(directory, f"{now:%Y%m%dT%H%M%S.%f}-{method}-{route_slug(route)}-{elapsed * 1e3:.0f}ms-{os.getpid()}")
+        if mode == 'sample':
+            path = base + '.sample.json'
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({
+                    'route': route, 'method': method, 'status': status,
+                    'duration_ms': round(elapsed * 1e3, 3), 'captured_at': now.isoformat(),
+                    **profiler.result(),
+                }, f)
+        else:
+            path = base + '.prof'
+            profiler.dump_stats(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        self._rotate(directory, config.get('PROFILE_MAX_FILES', 200))
+
+    def _rotate(self, directory, keep):
+        with self._rotate_lock:
+            names = sorted(n for n in os.listdir(directory) if n.endswith(('.prof', '.sample.json')))
+            for name in names[:max(0, len(names) - keep)]:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass  # removed by another worker
+
+
+class _ProfiledResponse:
+    """
+    The app's response iterable, with the profiler enabled while the app
+    produces the body and the profile saved in close().
+    """
+
+    def __init__(self, middleware, profiler, mode, environ, config):
+        self._middleware = middleware
+        self._profiler = profiler
+        self._mode = mode
+        self._environ = environ
+        self._config = config
+        self._status = ''
+        self._iterable = ()
+        self._iterator = iter(())
+        self._closed = False
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        self._profiler.enable()
+
+    def __exit__(self, *exc):
+        self._profiler.disable()
+
+    def start(self, start_response):
+        def capture_status(status_line, headers, exc_info=None):
+            self._status = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            with self:
+                self._iterable = self._middleware.wsgi_app(self._environ, capture_status)
+                self._iterator = iter(self._iterable)
+        except BaseException:
+            self.close()
+            raise
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        with self:
+            return next(self._iterator)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if hasattr(self._iterable, 'close'):
+                with self:
+                    self._iterable.close()
+        finally:
+            if self._mode == 'sample':
+                self._profiler.stop()
+            elapsed = time.perf_counter() - self._started
+            try:
+                self._middleware._save(self._profiler, self._mode, self._environ, self._status, elapsed, self._config)
+            except OSError:
+                pass  # profiling must never break the request
+
+
+class _StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval from a helper thread,
+    while enabled (same interface as cProfile.Profile, plus stop()).
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = {}
+        self.total_counts = {}
+        self._enabled = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or not self._enabled or self._stop.is_set():
+                continue  # between chunks, or finished; don't record stop() itself
+            self.samples += 1
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if top:
+                    self.self_counts[key] = self.self_counts.get(key, 0) + 1
+                    top = False
+                if key not in seen:
+                    seen.add(key)
+                    self.total_counts[key] = self.total_counts.get(key, 0) + 1
+                frame = frame.f_back
+
+    def result(self) -> dict:
+        return {
+            'interval': self.interval,
+            'samples': self.samples,
+            # [file, line, function, samples on top of the stack, samples anywhere in the stack]
+            'functions': [[*key, self.self_counts.get(key, 0), total] for key, total in self.total_counts.items()],
+        }
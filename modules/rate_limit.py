@@ -0,0 +1,178 @@
+# modules/rate_limit.py
+#
+# Token buckets for throttling login attempts and locking out accounts.
+#
+# A bucket holds up to `capacity` tokens and refills at `rate` tokens per
+# second; every attempt takes one. The same primitive serves two purposes:
+#
+#   - rate limits: a bucket per client IP and per email on the login routes
+#     (burst of `capacity`, then `rate` attempts per second);
+#   - lockout: a bucket of failures per email and client IP. Each failed
+#     click or step-up challenge takes a token, those challenges are refused
+#     to that client while the bucket is empty, and failures are forgotten
+#     gradually as it refills (a sliding window). A successful login resets
+#     it. Keying by IP as well means a stranger's failures cannot lock the
+#     owner out; the per-IP rate limit bounds how many guesses one client
+#     gets across accounts.
+#
+# Buckets live in the backend, not in the client's session, so clearing
+# cookies does not reset them. 'sqlite' shares them between all worker
+# processes on the host; 'memory' keeps them in one process. A check is one
+# keyed read and write under a short lock (or one IMMEDIATE transaction).
+# Buckets that have refilled completely hold no information and are deleted
+# every `purge_interval` seconds.
+#
+# The login helpers at the end read the buckets and limits of the current
+# Flask app, so the WSGI (app.py) and ASGI (asgi.py) entry points share them.
+
+import math
+import threading
+import time
+
+from flask import current_app
+
+from .sqlite_util import ThreadConnections, retry
+
+
+class MemoryBuckets:
+    """Token buckets in a dict of this process."""
+
+    def __init__(self, purge_interval: float = 60.0):
+        self.purge_interval = purge_interval
+        self._buckets = {}  # key -> (tokens, updated, full_at)
+        self._lock = threading.Lock()
+        self._next_purge = time.monotonic() + purge_interval
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        """Takes `cost` tokens. Returns 0.0 if they were available, else the seconds until they will be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens = _refill(self._buckets.get(key), capacity, rate, now)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if not wait:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if now >= self._next_purge:
+                self._purge(now)
+        return wait
+
+    def available(self, key: str, capacity: float, rate: float) -> float:
+        with self._lock:
+            return _refill(self._buckets.get(key), capacity, rate, time.monotonic())
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _purge(self, now: float):
+        self._next_purge = now + self.purge_interval
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at);
+"""
+
+
+class SQLiteBuckets:
+    """Token buckets in an SQLite database shared by the worker processes."""
+
+    def __init__(self, path: str, purge_interval: float = 60.0):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._connections = ThreadConnections(path)
+        self._next_purge = 0.0
+        retry(lambda: self._connections.get().executescript(_SCHEMA))
+
+    def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        """Takes `cost` tokens. Returns 0.0 if they were available, else the seconds until they will be."""
+        conn = self._connections.get()
+
+        def take():
+            # IMMEDIATE takes the write lock before the read, so two workers
+            # cannot both spend the same token.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = _refill(row, capacity, rate, now)
+                wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+                if not wait:
+                    tokens -= cost
+                conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                             (key, tokens, now, now + (capacity - tokens) / rate))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return wait, now
+
+        wait, now = retry(take)
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self._connections.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+        return wait
+
+    def available(self, key: str, capacity: float, rate: float) -> float:
+        row = self._connections.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        return _refill(row, capacity, rate, time.time())
+
+    def reset(self, key: str):
+        self._connections.execute("DELETE FROM buckets WHERE key = ?", (key,))
+
+
+def _refill(bucket, capacity: float, rate: float, now: float) -> float:
+    """Tokens in a bucket stored as (tokens, updated, ...) at time `now`; a missing bucket is full."""
+    if bucket is None:
+        return capacity
+    return min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+
+def open_buckets(backend: str, path: str | None = None):
+    if backend == 'memory':
+        return MemoryBuckets()
+    if backend == 'sqlite':
+        return SQLiteBuckets(path)
+    raise ValueError(f"Unknown rate limit backend: {backend!r}")
+
+
+def init_app(app):
+    """Opens the buckets named by RATE_LIMIT_BACKEND as app.extensions['rate_limit']."""
+    app.extensions['rate_limit'] = open_buckets(app.config['RATE_LIMIT_BACKEND'], app.config['RATE_LIMIT_PATH'])
+
+
+# --- Login Throttling ---
+
+def _failure_bucket(email: str, ip: str):
+    failures = current_app.config['LOCKOUT_FAILURES']
+    return f'failures:{email}:{ip}', failures, failures / current_app.config['LOCKOUT_WINDOW']
+
+
+def failures_left(email: str, ip: str) -> int:
+    return math.floor(current_app.extensions['rate_limit'].available(*_failure_bucket(email, ip)))
+
+
+def record_failure(email: str, ip: str) -> bool:
+    """Counts a failed challenge. Returns True if the client is now locked out of the account."""
+    current_app.extensions['rate_limit'].take(*_failure_bucket(email, ip))
+    return failures_left(email, ip) < 1
+
+
+def clear_failures(email: str, ip: str):
+    current_app.extensions['rate_limit'].reset(_failure_bucket(email, ip)[0])
+
+
+def login_wait(ip: str, email: str | None) -> float:
+    """
+    Takes one attempt from the client IP's bucket and, if that allowed it, from
+    the email's. Returns 0.0 if the attempt may go ahead, else the seconds to wait.
+    """
+    config = current_app.config
+    buckets = current_app.extensions['rate_limit']
+    wait = buckets.take(f'ip:{ip}', config['LOGIN_IP_BURST'], config['LOGIN_IP_PER_MINUTE'] / 60)
+    if not wait and email:
+        wait = buckets.take(f'email:{email}', config['LOGIN_EMAIL_BURST'], config['LOGIN_EMAIL_PER_MINUTE'] / 60)
+    return wait
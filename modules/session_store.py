@@ -0,0 +1,309 @@
+# modules/session_store.py
+#
+# Server-side sessions and single-use challenges.
+#
+# The session cookie carries only a random id; the session data lives in a
+# backend and is written back only when a request changed it (or when a
+# sliding expiry needs extending), so unchanged sessions cost one lookup and
+# no serialization. Backends:
+#
+#   memory  - a dict in this process, expired through a timing wheel. Only for
+#             a single worker process.
+#   sqlite  - a table shared by all workers on the host (WAL mode), expired
+#             through an index on the expiry time.
+#   cookie  - Flask's default signed-cookie session, unchanged.
+#
+# WebAuthn challenges are kept apart from the session data: issue_challenge()
+# stores one per session and purpose, and consume_challenge() removes and
+# returns it in one step, so a challenge can be used once at most even when
+# requests race. These helpers work on Flask's current session by default;
+# the ASGI entry point (asgi.py) passes its session in explicitly.
+
+import json
+import re
+import secrets
+import threading
+import time
+
+from flask import current_app, session
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from .sqlite_util import ThreadConnections, retry
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+def _new_id() -> str:
+    return secrets.token_urlsafe(32)
+
+
+# --- Backends ---
+
+class TimingWheel:
+    """
+    Buckets keys by the tick they expire in, so that advancing the clock
+    yields the keys that may be due without looking at any others. Each key
+    sits in one slot; a key due more than one revolution ahead is handed back
+    early and must be scheduled again.
+    """
+
+    def __init__(self, slots: int = 4096, tick: float = 1.0):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._current = int(time.monotonic() // tick)
+
+    def schedule(self, key, expires: float) -> int:
+        slot_tick = max(int(expires // self.tick), self._current + 1)
+        self._slots[slot_tick % len(self._slots)].add(key)
+        return slot_tick
+
+    def cancel(self, key, slot_tick: int):
+        self._slots[slot_tick % len(self._slots)].discard(key)
+
+    def advance(self, now: float) -> list:
+        target = int(now // self.tick)
+        due = []
+        for t in range(self._current + 1, min(target, self._current + len(self._slots)) + 1):
+            slot = self._slots[t % len(self._slots)]
+            if slot:
+                due.extend(slot)
+                slot.clear()
+        self._current = max(self._current, target)
+        return due
+
+
+class MemorySessionBackend:
+    """Sessions and challenges in a dict of this process."""
+
+    def __init__(self):
+        self._entries = {}  # key -> [expires (monotonic), slot tick, value]
+        self._wheel = TimingWheel()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        for key in self._wheel.advance(now):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del self._entries[key]
+            else:
+                entry[1] = self._wheel.schedule(key, entry[0])
+
+    def _put(self, key, value, ttl: float):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._wheel.cancel(key, entry[1])
+            expires = now + ttl
+            self._entries[key] = [expires, self._wheel.schedule(key, expires), value]
+
+    def _get(self, key, remove: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                return None
+            if remove:
+                del self._entries[key]
+                self._wheel.cancel(key, entry[1])
+            return entry[2], entry[0] - now
+
+    def load(self, sid: str) -> tuple[dict, float] | None:
+        """Returns (data, seconds left), or None if the session does not exist or has expired."""
+        found = self._get(('session', sid))
+        return (json.loads(found[0]), found[1]) if found else None
+
+    def save(self, sid: str, data: dict, ttl: float):
+        # Stored as JSON like in the SQLite backend, so both behave the same.
+        self._put(('session', sid), json.dumps(data), ttl)
+
+    def delete(self, sid: str):
+        self._get(('session', sid), remove=True)
+
+    def put_challenge(self, sid: str, purpose: str, value: str, ttl: float):
+        self._put(('challenge', sid, purpose), value, ttl)
+
+    def take_challenge(self, sid: str, purpose: str) -> str | None:
+        found = self._get(('challenge', sid, purpose), remove=True)
+        return found[0] if found else None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+CREATE TABLE IF NOT EXISTS challenges (
+    id TEXT NOT NULL, purpose TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,
+    PRIMARY KEY (id, purpose)
+);
+CREATE INDEX IF NOT EXISTS challenges_expires ON challenges (expires);
+"""
+
+
+class SQLiteSessionBackend:
+    """
+    Sessions and challenges in an SQLite database shared by the worker
+    processes. Expired rows are ignored on read and deleted in one indexed
+    range delete at most every `purge_interval` seconds.
+    """
+
+    def __init__(self, path: str, purge_interval: float = 60.0):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._connections = ThreadConnections(path)
+        self._next_purge = 0.0
+        retry(lambda: self._connections.get().executescript(_SCHEMA))
+
+    def _purge(self, now: float):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        self._connections.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+        self._connections.execute("DELETE FROM challenges WHERE expires <= ?", (now,))
+
+    def load(self, sid: str) -> tuple[dict, float] | None:
+        """Returns (data, seconds left), or None if the session does not exist or has expired."""
+        now = time.time()
+        row = self._connections.execute(
+            "SELECT data, expires FROM sessions WHERE id = ? AND expires > ?", (sid, now)).fetchone()
+        return (json.loads(row[0]), row[1] - now) if row else None
+
+    def save(self, sid: str, data: dict, ttl: float):
+        now = time.time()
+        self._connections.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+            (sid, json.dumps(data), now + ttl))
+        self._purge(now)
+
+    def delete(self, sid: str):
+        self._connections.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+    def put_challenge(self, sid: str, purpose: str, value: str, ttl: float):
+        self._connections.execute(
+            "INSERT OR REPLACE INTO challenges (id, purpose, value, expires) VALUES (?, ?, ?, ?)",
+            (sid, purpose, value, time.time() + ttl))
+
+    def take_challenge(self, sid: str, purpose: str) -> str | None:
+        row = self._connections.execute(
+            "SELECT value FROM challenges WHERE id = ? AND purpose = ? AND expires > ?",
+            (sid, purpose, time.time())).fetchone()
+        if row is None:
+            return None
+        # Of several requests that read the same challenge, only the one whose
+        # delete removes the row may use it.
+        deleted = self._connections.execute(
+            "DELETE FROM challenges WHERE id = ? AND purpose = ? AND value = ?", (sid, purpose, row[0]))
+        return row[0] if deleted.rowcount == 1 else None
+
+
+# --- Flask Integration ---
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires_in=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_in = expires_in
+        self.modified = False
+        self.has_challenges = False
+        self.previous_sid = None
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and _SESSION_ID.match(sid):
+            found = self.backend.load(sid)
+            if found is not None:
+                return ServerSession(found[0], sid=sid, expires_in=found[1])
+        return ServerSession(sid=_new_id(), new=True)
+
+    def _ttl(self, app, session) -> float:
+        return app.permanent_session_lifetime.total_seconds() if session.permanent else self.ttl
+
+    def save_session(self, app, session: ServerSession, response):
+        name = self.get_cookie_name(app)
+        cookie = dict(domain=self.get_cookie_domain(app), path=self.get_cookie_path(app),
+                      secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                      httponly=self.get_cookie_httponly(app))
+        if session.accessed:
+            response.vary.add("Cookie")
+        if session.previous_sid is not None:
+            self.backend.delete(session.previous_sid)
+
+        if not session and not session.has_challenges:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, **cookie)
+            return
+
+        ttl = self._ttl(app, session)
+        # An unchanged session is only written back once half of its lifetime is used up.
+        extend = session.expires_in is not None and session.expires_in < ttl / 2
+        if not (session.modified or session.new or extend):
+            return
+        self.backend.save(session.sid, dict(session), ttl)
+        if session.new or session.previous_sid is not None or session.permanent:
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session), **cookie)
+            response.vary.add("Cookie")
+
+
+def init_app(app):
+    """Installs the session backend named by SESSION_BACKEND."""
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+        return
+    if backend == 'memory':
+        store = MemorySessionBackend()
+    elif backend == 'sqlite':
+        store = SQLiteSessionBackend(app.config['SESSION_STORE_PATH'])
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
+    app.session_interface = ServerSessionInterface(store, app.config['SESSION_TTL'])
+
+
+def _server_session():
+    interface = current_app.session_interface
+    return interface if isinstance(interface, ServerSessionInterface) else None
+
+
+def issue_challenge(purpose: str, value: str, sess=None):
+    """Stores a challenge for the session, replacing any earlier one for `purpose`."""
+    sess = session if sess is None else sess
+    interface = _server_session()
+    if interface is None:
+        sess[f'challenge_{purpose}'] = value
+        return
+    interface.backend.put_challenge(sess.sid, purpose, value, current_app.config['CHALLENGE_TTL'])
+    sess.has_challenges = True
+
+
+def consume_challenge(purpose: str, sess=None) -> str | None:
+    """Removes and returns the session's challenge for `purpose`; None if there is none."""
+    sess = session if sess is None else sess
+    interface = _server_session()
+    if interface is None:
+        return sess.pop(f'challenge_{purpose}', None)
+    return interface.backend.take_challenge(sess.sid, purpose)
+
+
+def rotate_id(sess=None):
+    """Moves the session to a new id, e.g. on login, so an id seen before it is useless."""
+    sess = session if sess is None else sess
+    if _server_session() is None or sess.new:
+        return
+    sess.previous_sid = sess.sid
+    sess.sid = _new_id()
+    sess.modified = True
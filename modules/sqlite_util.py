@@ -0,0 +1,49 @@
+# modules/sqlite_util.py
+#
+# Connection handling shared by the SQLite-backed stores (users, sessions).
+
+import sqlite3
+import threading
+import time
+
+RETRY_ATTEMPTS = 8
+
+
+def retry(operation):
+    """
+    Runs an SQLite operation, retrying with exponential backoff while another
+    process holds the database lock.
+    """
+    delay = 0.01
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            message = str(e)
+            if attempt == RETRY_ATTEMPTS - 1 or ('locked' not in message and 'busy' not in message):
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+
+class ThreadConnections:
+    """
+    One autocommit connection per thread (sqlite3 connections must not be
+    shared), in WAL mode so readers never block the writer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            retry(lambda: conn.execute('PRAGMA journal_mode=WAL'))
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return retry(lambda: self.get().execute(sql, params))
@@ -1,10 +1,24 @@
 # modules/typing_analyzer.py
 
-import pandas as pd
-from . import user_manager
+import logging
+import math
+from . import auth_log, metrics, user_manager
+from .user_models import RunningStats
+from .user_record import UserRecord
 
+log = auth_log.get_logger(__name__)
+
+# Fixed band, used for users registered before the streaming baseline existed
+# (they only have a stored average).
 TYPING_TOLERANCE_SECONDS = 3.0 
 
+# Streaming baseline: the allowed band is the user's own mean plus or minus this
+# many standard deviations, but never narrower than MIN_TOLERANCE_SECONDS.
+TOLERANCE_STDS = 2.5
+MIN_TOLERANCE_SECONDS = 1.0
+# Weight kept by older attempts at each accepted login (1.0 never forgets).
+TYPING_DECAY = 0.95
+
 def calculate_average(durations: list) -> float | None:
     """
     Calculates the average speed from a list of durations. Does NOT save anything.
@@ -13,24 +27,89 @@ def calculate_average(durations: list) -> float | None:
         return sum(durations) / len(durations)
     return None
 
-def verify_typing_speed(email: str, attempt_duration: float) -> bool:
+def build_baseline(durations: list) -> RunningStats:
     """
-    Verifies if a new typing duration is within the user's normal range.
+    Builds the streaming baseline (weighted mean/variance) from registration samples.
     """
-    baseline = user_manager.get_typing_baseline(email)
-    if not (baseline and baseline.get('average_speed')):
-        return False
+    stats = RunningStats()
+    for duration in durations:
+        stats.update([duration], decay=TYPING_DECAY)
+    return stats
 
-    if pd.isna(baseline['average_speed']):
-        return False
-        
-    avg_speed = baseline['average_speed']
-    lower_bound = avg_speed - TYPING_TOLERANCE_SECONDS
-    upper_bound = avg_speed + TYPING_TOLERANCE_SECONDS
+def get_baseline(user: UserRecord) -> RunningStats | None:
+    """
+    Returns a user's streaming baseline. Users registered before it existed get
+    one derived from their registration samples; None if there is nothing to use.
+    """
+    if user.typing_stats:
+        return RunningStats.from_dict(user.typing_stats)
+    if user.typing_samples:
+        return build_baseline(user.typing_samples)
+    return None
+
+def allowed_range(stats: RunningStats) -> tuple[float, float]:
+    mean = stats.mean[0]
+    tolerance = max(MIN_TOLERANCE_SECONDS, TOLERANCE_STDS * stats.std()[0])
+    return mean - tolerance, mean + tolerance
 
-    print(f"Verifying typing speed for {email}:")
-    print(f"  - User's Average: {avg_speed:.2f}s")
-    print(f"  - Current Attempt: {attempt_duration:.2f}s")
-    print(f"  - Allowed Range: [{lower_bound:.2f}s - {upper_bound:.2f}s]")
+def user_range(user: UserRecord) -> tuple[float, float, float] | None:
+    """
+    Returns (average, lower_bound, upper_bound) of a user's accepted typing
+    durations, or None if the user has no usable baseline.
+    """
+    stats = get_baseline(user)
+    if stats is not None and stats.weight > 0:
+        lower_bound, upper_bound = allowed_range(stats)
+        return stats.mean[0], lower_bound, upper_bound
+    avg_speed = user.typing_average
+    if not avg_speed or math.isnan(avg_speed):
+        return None
+    return avg_speed, avg_speed - TYPING_TOLERANCE_SECONDS, avg_speed + TYPING_TOLERANCE_SECONDS
 
-    return lower_bound <= attempt_duration <= upper_bound
\ No newline at end of file
+def typing_margin(email: str, attempt_duration: float, user: UserRecord | None = None) -> float | None:
+    """
+    Distance in seconds from the attempt to the nearest edge of the user's
+    allowed range: positive inside it, negative outside. None without a baseline.
+    """
+    if user is None:
+        user = user_manager.get_user(email)
+    bounds = user_range(user) if user else None
+    if bounds is None:
+        return None
+    _, lower_bound, upper_bound = bounds
+    return min(attempt_duration - lower_bound, upper_bound - attempt_duration)
+
+@metrics.timed(metrics.FACTOR_SECONDS, 'typing')
+def verify_typing_speed(email: str, attempt_duration: float, user: UserRecord | None = None) -> bool:
+    """
+    Verifies if a new typing duration is within the user's normal range.
+    The range comes from the user's own running mean and variance; this is
+    O(1) whatever the number of past logins.
+    Pass `user` to reuse an already-loaded record instead of fetching it again.
+    """
+    if user is None:
+        user = user_manager.get_user(email)
+    bounds = user_range(user) if user else None
+    if bounds is None:
+        auth_log.event(log, logging.DEBUG, "typing checked", email=email, factor='typing',
+                       decision=False, reason='no baseline')
+        return False
+    avg_speed, lower_bound, upper_bound = bounds
+    accepted = lower_bound <= attempt_duration <= upper_bound
+    auth_log.event(log, logging.DEBUG, "typing checked", email=email, factor='typing',
+                   duration=attempt_duration, average=avg_speed, lower=lower_bound, upper=upper_bound,
+                   decision=accepted)
+    return accepted
+
+def update_baseline(email: str, attempt_duration: float, user: UserRecord | None = None):
+    """
+    Folds an accepted login's typing duration into the user's baseline, so it
+    follows gradual changes in typing speed. Constant time and space.
+    """
+    if user is None:
+        user = user_manager.get_user(email)
+    if not user:
+        return
+    stats = get_baseline(user) or RunningStats()
+    stats.update([attempt_duration], decay=TYPING_DECAY)
+    user_manager.save_typing_stats(email, stats.to_dict())
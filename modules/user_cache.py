@@ -0,0 +1,76 @@
+# modules/user_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by UserCache.get when there is no usable entry. (None is a valid
+# cached value: it records that a user does not exist.)
+MISSING = object()
+
+
+class UserCache:
+    """
+    In-process LRU cache of decoded user records with a TTL.
+
+    Every entry is stamped with the user's version in the store when it was
+    read. A lookup only hits if the store still reports that version, so a
+    write made by this process or by another worker is never served stale,
+    while writes to other users leave the entry valid. Records handed out are
+    shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, email: str, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None:
+                entry_version, expires_at, record = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(email)
+                    self.hits += 1
+                    return record
+                del self._entries[email]
+            self.misses += 1
+            return MISSING
+
+    def put(self, email: str, version, record):
+        """
+        Stores a record. `version` must be read from the store *before* the
+        record itself, so a concurrent write can only make the entry miss.
+        """
+        with self._lock:
+            self._entries[email] = (version, time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
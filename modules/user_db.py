@@ -1,8 +1,12 @@
 # C:\Users\Jejo\Documents\passwordless-behaviour-based-auth-main\modules\user_db.py
 
-import math
+import logging
 import random
 
+from . import auth_log, click_matching
+
+log = auth_log.get_logger(__name__)
+
 # In-memory dictionary to simulate a real database for the hackathon.
 USER_DATABASE = {}
 
@@ -22,7 +26,7 @@ def create_user_profile(email: str):
             "click_profile": [],
             "secret_passkey": None,
         }
-    print(f"Current DB state: {USER_DATABASE}")
+    auth_log.event(log, logging.DEBUG, "profile created", email=email, users=len(USER_DATABASE))
 
 def add_baseline_speed(email: str, speed: float):
     if email in USER_DATABASE:
@@ -49,19 +53,19 @@ def get_click_profile(email: str) -> list | None:
     return None
 
 def verify_clicks(baseline_clicks: list, new_clicks: list, tolerance: int = 25) -> bool:
-    if len(baseline_clicks) != len(new_clicks):
+    baseline = click_matching.to_points(baseline_clicks)
+    if baseline is None:
+        return False
+    attempt = click_matching.to_points(new_clicks, len(baseline))
+    if attempt is None:
         return False
-    for baseline_pt, new_pt in zip(baseline_clicks, new_clicks):
-        distance = math.sqrt((baseline_pt["x"] - new_pt["x"])**2 + (baseline_pt["y"] - new_pt["y"])**2)
-        if distance > tolerance:
-            return False
-    return True
+    return click_matching.match(baseline, attempt, tolerance).matched
 
 def save_secret_passkey(email: str, passkey: str):
     """Saves the user's secret passkey."""
     if email in USER_DATABASE:
         USER_DATABASE[email]["secret_passkey"] = passkey
-    print(f"Current DB state: {USER_DATABASE}")
+    auth_log.event(log, logging.DEBUG, "passkey saved", email=email)
 
 def verify_secret_passkey(email: str, attempt: str) -> bool:
     """Checks if the provided passkey attempt is correct."""
@@ -1,109 +1,164 @@
 # modules/user_manager.py
 
-import pandas as pd
+import base64
 import json
-import os
-from flask import current_app
+from flask import current_app, g, has_app_context, has_request_context
 
-def _get_db_path():
-    return current_app.config['USER_DB_PATH']
+from config import Config
+from . import metrics, user_cache, user_store
+from .user_record import UserRecord
 
-def _load_df():
+def _config_value(key):
+    # Fall back to the static config so the store also works outside a request
+    # (command-line tools, background jobs).
+    if has_app_context():
+        return current_app.config[key]
+    return getattr(Config, key)
+
+def _get_store():
     """
-    Loads user data into a pandas DataFrame.
-    Handles cases where the file doesn't exist or is empty.
+    Returns the configured user store. With the default SQLite backend, users
+    from the legacy users.csv file are imported on first use; the journal
+    backend keeps users.csv itself as its snapshot.
     """
-    path = _get_db_path()
-    
-    # --- THIS IS THE FIX ---
-    # We check if the file doesn't exist OR if it exists but is empty.
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
-        # If either is true, create a fresh DataFrame with the correct columns.
-        df = pd.DataFrame(columns=[
-            'email', 'webauthn_credential', 'click_profile', 
-            'secret_passkey', 'typing_samples', 'typing_average'
-        ])
-        # Save it to create the file with headers
-        df.to_csv(path, index=False)
-        return df
-        
-    # If the file exists and is not empty, read it as usual.
-    return pd.read_csv(path)
-
-def _save_df(df):
-    path = _get_db_path()
-    df.to_csv(path, index=False)
-
-def get_user(email):
-    df = _load_df()
-    user_row = df[df['email'] == email]
-    if user_row.empty:
-        return None
-    user_dict = user_row.to_dict('records')[0]
-    for key in ['webauthn_credential', 'click_profile', 'typing_samples']:
-        if pd.notna(user_dict[key]):
-            try:
-                user_dict[key] = json.loads(user_dict[key])
-            except (json.JSONDecodeError, TypeError):
-                user_dict[key] = None
-    return user_dict
+    if _config_value('USER_STORE_BACKEND') == 'journal':
+        return user_store.open_store(
+            _config_value('USER_DB_PATH'),
+            backend='journal',
+            compact_threshold=_config_value('USER_JOURNAL_COMPACT_THRESHOLD'),
+        )
+    return user_store.open_store(
+        _config_value('USER_STORE_PATH'),
+        legacy_csv=_config_value('USER_DB_PATH'),
+    )
+
+# --- Record Cache ---
+_caches = {}
+
+def _get_cache(store):
+    cache = _caches.get(store)
+    if cache is None:
+        cache = _caches.setdefault(store, user_cache.UserCache(
+            max_size=_config_value('USER_CACHE_SIZE'),
+            ttl=_config_value('USER_CACHE_TTL'),
+        ))
+    return cache
+
+def cache_stats():
+    """Returns hit/miss counters of the user record cache."""
+    return _get_cache(_get_store()).stats()
+
+def get_user(email) -> UserRecord | None:
+    """
+    Returns the decoded user record, or None. Records come from an in-process
+    cache that is checked against the user's version in the store on every
+    call, so only writes to this user invalidate it; callers must not modify them.
+    """
+    store = _get_store()
+    cache = _get_cache(store)
+    with metrics.STORAGE_SECONDS.time('version'):
+        version = store.version(email)
+    user = cache.get(email, version)
+    if user is user_cache.MISSING:
+        metrics.USER_CACHE_LOOKUPS.inc('miss')
+        with metrics.STORAGE_SECONDS.time('get'):
+            row = store.get(email)
+        user = UserRecord.from_row(row) if row is not None else None
+        cache.put(email, version, user)
+    else:
+        metrics.USER_CACHE_LOOKUPS.inc('hit')
+    return user
+
+# --- Request-Scoped Snapshot ---
+def load_request_user(email):
+    """
+    Returns the user record for the current request. The store is read at most
+    once per request; every verification factor then shares the same record.
+    Outside a request this is the same as get_user.
+    """
+    if not has_request_context():
+        return get_user(email)
+    users = g.setdefault('request_users', {})
+    if email not in users:
+        users[email] = get_user(email)
+    return users[email]
+
+def _forget_request_user(email):
+    # Called after a write so the rest of the request sees the new values.
+    if has_request_context():
+        g.get('request_users', {}).pop(email, None)
 
 def create_user_profile(email):
-    df = _load_df()
-    if email in df['email'].values:
-        return False
     new_user = {
-        'email': email,
         'webauthn_credential': None,
         'click_profile': json.dumps([]),
         'secret_passkey': None,
         'typing_samples': json.dumps([]),
         'typing_average': None
     }
-    new_df = pd.concat([df, pd.DataFrame([new_user])], ignore_index=True)
-    _save_df(new_df)
-    return True
+    with metrics.STORAGE_SECONDS.time('create'):
+        created = _get_store().create(email, new_user)
+    _forget_request_user(email)
+    return created
 
 def _update_user_field(email, field, value):
-    df = _load_df()
-    user_index = df.index[df['email'] == email].tolist()
-    if not user_index:
-        return
     if isinstance(value, (dict, list)):
         value = json.dumps(value)
-    df.loc[user_index[0], field] = value
-    _save_df(df)
+    with metrics.STORAGE_SECONDS.time('update'):
+        _get_store().update_field(email, field, value)
+    _forget_request_user(email)
 
 def save_webauthn_credential(email, credential):
     _update_user_field(email, 'webauthn_credential', credential)
 
+def save_credential_key(email, key):
+    """Stores a verified credential's id, public key and sign count in one update."""
+    with metrics.STORAGE_SECONDS.time('update'):
+        _get_store().update_fields(email, {
+            'credential_id': key.credential_id,
+            'credential_public_key': base64.urlsafe_b64encode(key.public_key).decode('ascii').rstrip('='),
+            'sign_count': key.sign_count,
+        })
+    _forget_request_user(email)
+
+def save_sign_count(email, sign_count):
+    _update_user_field(email, 'sign_count', sign_count)
+
 def get_webauthn_credential(email):
     user = get_user(email)
-    return user.get('webauthn_credential') if user else None
+    return user.webauthn_credential if user else None
 
 def save_click_profile(email, clicks):
     _update_user_field(email, 'click_profile', clicks)
 
 def get_click_profile(email):
     user = get_user(email)
-    return user.get('click_profile') if user else None
+    return user.click_profile if user else None
 
 def save_secret_passkey(email, passkey):
     _update_user_field(email, 'secret_passkey', passkey)
 
 def get_secret_passkey(email):
     user = get_user(email)
-    return user.get('secret_passkey') if user else None
+    return user.secret_passkey if user else None
 
 def get_typing_baseline(email):
     user = get_user(email)
     if not user:
         return None
     return {
-        "samples": user.get('typing_samples', []),
-        "average_speed": user.get('typing_average')
+        "samples": list(user.typing_samples or []),
+        "average_speed": user.typing_average
     }
 
 def save_typing_average(email, avg_speed):
     """Saves the calculated average typing speed for a user."""
-    _update_user_field(email, 'typing_average', avg_speed)
\ No newline at end of file
+    _update_user_field(email, 'typing_average', avg_speed)
+
+def save_typing_stats(email, state):
+    """Saves a user's streaming typing baseline (weighted mean/variance)."""
+    _update_user_field(email, 'typing_stats', state)
+
+def save_behavior_model(email, state):
+    """Saves the state of a user's personal behavioral model."""
+    _update_user_field(email, 'behavior_model', state)
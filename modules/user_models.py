@@ -0,0 +1,78 @@
+# modules/user_models.py
+
+import math
+
+# A user's own model is only trusted once its decay-weighted session count
+# reaches this (the four registration samples give about 3.9).
+MIN_WEIGHT = 3.0
+# Maximum distance from the user's mean, in standard deviations, per feature.
+Z_THRESHOLD = 3.0
+# Weight kept by older sessions at each update; 1.0 never forgets.
+DECAY = 0.98
+# Lower bound on the standard deviation, so a user with very consistent
+# sessions is not rejected for tiny variations. Absolute, and relative to the mean.
+MIN_STD = 0.5
+MIN_RELATIVE_STD = 0.1
+
+
+class RunningStats:
+    """
+    Exponentially weighted running mean and variance of a fixed-length feature
+    vector (Welford/West update).
+
+    State is three numbers per feature plus a weight, whatever the number of
+    sessions seen, and an update is O(n_features). With decay=1.0 this is the
+    plain Welford algorithm.
+    """
+
+    __slots__ = ('weight', 'mean', 'm2')
+
+    def __init__(self, weight: float = 0.0, mean=None, m2=None, n_features: int = 1):
+        self.weight = float(weight)
+        self.mean = list(mean) if mean is not None else [0.0] * n_features
+        self.m2 = list(m2) if m2 is not None else [0.0] * n_features
+
+    @classmethod
+    def from_dict(cls, state: dict | None, n_features: int = 1) -> 'RunningStats':
+        if not state or len(state.get('mean', ())) != n_features:
+            # No state yet, or it was built for a different feature set.
+            return cls(n_features=n_features)
+        return cls(state['weight'], state['mean'], state['m2'])
+
+    def to_dict(self) -> dict:
+        return {"weight": self.weight, "mean": self.mean, "m2": self.m2}
+
+    def update(self, x, decay: float = 1.0):
+        """Folds one observation into the statistics."""
+        self.weight = self.weight * decay + 1.0
+        for i, value in enumerate(x):
+            delta = value - self.mean[i]
+            self.mean[i] += delta / self.weight
+            self.m2[i] = self.m2[i] * decay + delta * (value - self.mean[i])
+
+    def std(self) -> list:
+        if self.weight <= 0:
+            return [0.0] * len(self.mean)
+        return [math.sqrt(max(m2, 0.0) / self.weight) for m2 in self.m2]
+
+    def z_scores(self, x, min_std=MIN_STD) -> list:
+        """
+        Distance of each feature from the mean in (floored) standard deviations.
+        min_std is the absolute floor: one number, or one per feature.
+        """
+        floors = min_std if isinstance(min_std, (list, tuple)) else [min_std] * len(self.mean)
+        return [
+            abs(value - mean) / max(std, floor, MIN_RELATIVE_STD * abs(mean))
+            for value, mean, std, floor in zip(x, self.mean, self.std(), floors)
+        ]
+
+
+def is_trained(stats: RunningStats) -> bool:
+    return stats.weight >= MIN_WEIGHT
+
+def score(stats: RunningStats, x, min_std=MIN_STD) -> float:
+    """
+    Scores a session against a user's model. Like the global One-Class SVM,
+    a positive score means the session looks normal for this user.
+    """
+    return Z_THRESHOLD - max(stats.z_scores(x, min_std))
@@ -0,0 +1,139 @@
+# modules/user_record.py
+
+import base64
+import json
+from array import array
+from typing import NamedTuple
+
+# Marks a credential that has not been decoded yet (None means "no credential").
+_UNDECODED = object()
+
+
+def _parse_json(raw):
+    if raw is None:
+        return None
+    if not isinstance(raw, str):
+        return raw
+    try:
+        return json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+class CredentialKey(NamedTuple):
+    """What a login needs from a verified WebAuthn credential."""
+    credential_id: str  # base64url, as sent by the browser
+    public_key: bytes  # COSE-encoded
+    sign_count: int
+
+
+def _b64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+class UserRecord:
+    """
+    A decoded user profile.
+
+    Click points and typing samples are kept as packed float arrays
+    (click points flattened as x0, y0, x1, y1, ...). The WebAuthn credential is
+    by far the largest column and is only needed by the fingerprint step, so it
+    stays a JSON string until `webauthn_credential` is first read. Likewise the
+    credential's public key is decoded when `credential_key` is first read and
+    then kept with the record, so cached users are verified without decoding.
+
+    Records may be shared through the user cache and must not be modified.
+    """
+
+    __slots__ = (
+        'email', 'secret_passkey', 'typing_average', 'typing_stats', 'behavior_model',
+        'click_points', 'typing_samples', '_credential_json', '_credential',
+        'credential_id', 'sign_count', '_public_key_b64', '_credential_key',
+    )
+
+    def __init__(self, email, webauthn_credential=None, click_points=None,
+                 secret_passkey=None, typing_samples=None, typing_average=None,
+                 typing_stats=None, behavior_model=None, credential_id=None,
+                 credential_public_key=None, sign_count=None):
+        self.email = email
+        self.credential_id = credential_id
+        self.sign_count = int(sign_count) if sign_count is not None else 0
+        self._public_key_b64 = credential_public_key
+        self._credential_key = _UNDECODED
+        self.typing_stats = typing_stats
+        self.behavior_model = behavior_model
+        self.secret_passkey = secret_passkey
+        self.typing_average = float(typing_average) if typing_average is not None else None
+        self.click_points = click_points
+        self.typing_samples = typing_samples
+        if webauthn_credential is None or isinstance(webauthn_credential, str):
+            self._credential_json = webauthn_credential
+            self._credential = _UNDECODED
+        else:
+            self._credential_json = None
+            self._credential = webauthn_credential
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'UserRecord':
+        """Builds a record from a raw store row (JSON columns still encoded)."""
+        clicks = _parse_json(row.get('click_profile'))
+        try:
+            click_points = array('d', (v for point in clicks for v in (point['x'], point['y'])))
+        except (TypeError, KeyError):
+            click_points = None
+        samples = _parse_json(row.get('typing_samples'))
+        try:
+            typing_samples = array('d', samples)
+        except TypeError:
+            typing_samples = None
+        return cls(
+            row['email'],
+            webauthn_credential=row.get('webauthn_credential'),
+            click_points=click_points,
+            secret_passkey=row.get('secret_passkey'),
+            typing_samples=typing_samples,
+            typing_average=row.get('typing_average'),
+            typing_stats=_parse_json(row.get('typing_stats')),
+            behavior_model=_parse_json(row.get('behavior_model')),
+            credential_id=row.get('credential_id'),
+            credential_public_key=row.get('credential_public_key'),
+            sign_count=row.get('sign_count'),
+        )
+
+    @property
+    def webauthn_credential(self) -> dict | None:
+        if self._credential is _UNDECODED:
+            self._credential = _parse_json(self._credential_json)
+            self._credential_json = None
+        return self._credential
+
+    @property
+    def credential_key(self) -> CredentialKey | None:
+        """The verified credential's id and decoded public key, or None if none is stored."""
+        if self._credential_key is _UNDECODED:
+            key = None
+            if self.credential_id and self._public_key_b64:
+                try:
+                    key = CredentialKey(self.credential_id, _b64url_decode(self._public_key_b64), self.sign_count)
+                except ValueError:
+                    pass
+            self._credential_key = key
+        return self._credential_key
+
+    @property
+    def click_profile(self) -> list | None:
+        """The click points as a list of {x, y} dicts."""
+        if self.click_points is None:
+            return None
+        points = self.click_points
+        return [{"x": points[i], "y": points[i + 1]} for i in range(0, len(points) - 1, 2)]
+
+    def get(self, key, default=None):
+        """Dict-style access, kept for callers written against the old dict records."""
+        value = getattr(self, key, default)
+        if isinstance(value, array):
+            return list(value)
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"UserRecord(email={self.email!r})"
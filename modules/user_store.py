@@ -0,0 +1,505 @@
+# modules/user_store.py
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+
+from . import auth_log
+from .file_lock import FileLock
+from .sqlite_util import ThreadConnections, retry
+
+log = auth_log.get_logger(__name__)
+
+# Columns of the user table and their SQLite types. The first six match the
+# header of the legacy users.csv so that rows can be imported without any
+# renaming; columns added later are created on existing databases at start-up
+# and read as empty from older CSV files.
+COLUMNS = {
+    'email': 'TEXT PRIMARY KEY',
+    'webauthn_credential': 'TEXT',
+    'click_profile': 'TEXT',
+    'secret_passkey': 'TEXT',
+    'typing_samples': 'TEXT',
+    'typing_average': 'REAL',
+    'behavior_model': 'TEXT',
+    'typing_stats': 'TEXT',
+    # The verified WebAuthn credential: its id and COSE public key, both
+    # base64url, and the authenticator's signature counter.
+    'credential_id': 'TEXT',
+    'credential_public_key': 'TEXT',
+    'sign_count': 'INTEGER',
+}
+FIELDS = tuple(COLUMNS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    {', '.join(f'{name} {kind}' for name, kind in COLUMNS.items())}
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+-- A user's version is bumped in the same transaction as every change to
+-- that user's row, so caches in any process can tell whether their copy of
+-- the user is still current; writes to other users leave it valid. Rows stay
+-- after a delete, so a version is never reused. (Older databases bumped one
+-- store-wide counter in meta; those triggers are replaced here.)
+CREATE TABLE IF NOT EXISTS user_versions (
+    email TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+DROP TRIGGER IF EXISTS users_version_insert;
+DROP TRIGGER IF EXISTS users_version_update;
+DROP TRIGGER IF EXISTS users_version_delete;
+DELETE FROM meta WHERE key = 'version';
+CREATE TRIGGER IF NOT EXISTS user_version_insert AFTER INSERT ON users
+BEGIN INSERT INTO user_versions (email, version) VALUES (NEW.email, 1)
+      ON CONFLICT (email) DO UPDATE SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS user_version_update AFTER UPDATE ON users
+BEGIN INSERT INTO user_versions (email, version) VALUES (NEW.email, 1)
+      ON CONFLICT (email) DO UPDATE SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS user_version_delete AFTER DELETE ON users
+BEGIN INSERT INTO user_versions (email, version) VALUES (OLD.email, 1)
+      ON CONFLICT (email) DO UPDATE SET version = version + 1; END;
+"""
+
+_SELECT_USER = f"SELECT {', '.join(FIELDS)} FROM users WHERE email = ?"
+_INSERT_USER = (
+    f"INSERT OR IGNORE INTO users ({', '.join(FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(FIELDS))})"
+)
+
+
+class SQLiteUserStore:
+    """
+    Stores user profiles in an SQLite table keyed by email.
+
+    Lookups and single-field updates go through the primary-key index, so they
+    cost O(log N) instead of reading and rewriting the whole user file. The
+    database runs in WAL mode so readers never block the writer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = ThreadConnections(path)
+        retry(lambda: self._connect().executescript(_SCHEMA))
+        self._add_missing_columns()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self._connections.execute(sql, params)
+
+    def _add_missing_columns(self):
+        existing = {row[1] for row in self._execute("PRAGMA table_info(users)")}
+        for name, kind in COLUMNS.items():
+            if name not in existing:
+                try:
+                    self._execute(f"ALTER TABLE users ADD COLUMN {name} {kind}")
+                except sqlite3.OperationalError as e:
+                    # Another worker may have added it first.
+                    if 'duplicate column' not in str(e):
+                        raise
+
+    def get(self, email: str) -> dict | None:
+        """Returns the raw (still JSON-encoded) row for a user, or None."""
+        row = self._execute(_SELECT_USER, (email,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(FIELDS, row))
+
+    def create(self, email: str, record: dict) -> bool:
+        """Inserts a new user. Returns False if the email is already taken."""
+        values = [email] + [record.get(field) for field in FIELDS[1:]]
+        cursor = self._execute(_INSERT_USER, values)
+        return cursor.rowcount == 1
+
+    def update_field(self, email: str, field: str, value) -> bool:
+        """Sets one column of one user. Returns False if the user does not exist."""
+        if field not in FIELDS[1:]:
+            raise ValueError(f"Unknown user field: {field!r}")
+        cursor = self._execute(
+            f"UPDATE users SET {field} = ? WHERE email = ?", (value, email)
+        )
+        return cursor.rowcount == 1
+
+    def update_fields(self, email: str, values: dict) -> bool:
+        """Sets several columns of one user in one statement. Returns False if the user does not exist."""
+        unknown = set(values) - set(FIELDS[1:])
+        if unknown:
+            raise ValueError(f"Unknown user fields: {sorted(unknown)!r}")
+        assignments = ', '.join(f"{field} = ?" for field in values)
+        cursor = self._execute(
+            f"UPDATE users SET {assignments} WHERE email = ?", (*values.values(), email)
+        )
+        return cursor.rowcount == 1
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def version(self, email: str) -> int:
+        """Returns a counter that changes whenever any process creates, modifies or deletes this user."""
+        row = self._execute(
+            "SELECT version FROM user_versions WHERE email = ?", (email,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_meta(self, key: str) -> str | None:
+        row = self._execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self._execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def iter_rows(self, batch_size: int = 1000):
+        """
+        Yields every user as a raw row, in email order. Rows are fetched one
+        batch at a time by key, so memory use does not grow with the table and
+        no read transaction is held between batches.
+        """
+        last = ''
+        while True:
+            rows = self._execute(
+                f"SELECT {', '.join(FIELDS)} FROM users WHERE email > ? ORDER BY email LIMIT ?",
+                (last, batch_size),
+            ).fetchall()
+            for row in rows:
+                yield dict(zip(FIELDS, row))
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    def insert_many(self, rows) -> int:
+        """
+        Inserts raw rows (dicts keyed by FIELDS) in one transaction.
+        Users that already exist are left untouched. Returns the number inserted.
+        """
+        return self._insert_batch(self._connect(), [tuple(row.get(field) for field in FIELDS) for row in rows])
+
+    def import_csv(self, csv_path: str, batch_size: int = 1000) -> int:
+        """
+        Copies every row of a legacy users.csv into the store.
+        The file is streamed in batches, and users that already exist are left untouched.
+        Returns the number of users inserted.
+        """
+        conn = self._connect()
+        inserted = 0
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(_row_from_csv(row))
+                if len(batch) >= batch_size:
+                    inserted += self._insert_batch(conn, batch)
+                    batch = []
+            if batch:
+                inserted += self._insert_batch(conn, batch)
+        return inserted
+
+    def _insert_batch(self, conn, batch) -> int:
+        def insert():
+            # IMMEDIATE takes the write lock up front, so the batch cannot
+            # deadlock against another writer halfway through.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # rowcount, unlike total_changes, leaves out the version trigger's updates.
+                inserted = conn.executemany(_INSERT_USER, batch).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return inserted
+        return retry(insert)
+
+
+_NUMERIC = {'typing_average': float, 'sign_count': int}
+
+
+def _row_from_csv(row: dict) -> tuple:
+    """Converts a csv.DictReader row into a tuple in FIELDS order."""
+    values = []
+    for field in FIELDS:
+        value = row.get(field)
+        if value == '':
+            value = None
+        if field in _NUMERIC and value is not None:
+            try:
+                value = _NUMERIC[field](value)
+            except ValueError:
+                value = None
+        values.append(value)
+    return tuple(values)
+
+
+class JournalUserStore:
+    """
+    Keeps users.csv as a compacted snapshot and records every change as one
+    appended journal line, so a write costs the same no matter how many users exist.
+
+    Journal lines are JSON arrays of [seq, email, field, value]; a field of null
+    marks the creation of a user, with the new record as value, and a list of
+    fields (with a list of values) several fields changed together. Reads are served
+    from an in-memory index built from the snapshot with the journal replayed on
+    top. Once the journal holds `compact_threshold` entries, a background thread
+    folds it into a new snapshot (written to a temp file and renamed into place)
+    and starts an empty journal.
+
+    Several processes may share the same files: appends and compaction hold an
+    exclusive lock on `<snapshot>.lock`, and readers take a shared lock whenever
+    the files have changed since their last look.
+    """
+
+    def __init__(self, snapshot_path: str, journal_path: str | None = None,
+                 compact_threshold: int = 1000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or snapshot_path + '.journal'
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(snapshot_path + '.lock')
+        self._users = {}
+        # Sequence number of the last journal entry applied per email since the
+        # snapshot was loaded; see version().
+        self._versions = {}
+        self._seq = 0
+        self._journal_entries = 0
+        self._journal_offset = 0
+        self._journal_id = None
+        self._snapshot_id = None
+        self._compact_event = threading.Event()
+        self._refresh()
+        threading.Thread(target=self._compact_loop, name='user-journal-compactor', daemon=True).start()
+
+    # --- Reading ---
+    def _refresh(self):
+        """Picks up journal lines (and new snapshots) written since the last call."""
+        if self._files_unchanged():
+            return
+        # Hold off writers and the compactor while we read, so we never pair a
+        # snapshot with a journal from a different generation.
+        with self._file_lock.shared():
+            snapshot_id = _file_id(self.snapshot_path)
+            journal_id = _file_id(self.journal_path)
+            journal_inode = journal_id[0] if journal_id else None
+            journal_size = journal_id[2] if journal_id else 0
+            if (snapshot_id != self._snapshot_id or journal_inode != self._journal_id
+                    or journal_size < self._journal_offset):
+                self._load_snapshot()
+                self._snapshot_id = snapshot_id
+                self._journal_id = journal_inode
+                self._journal_offset = 0
+                self._journal_entries = 0
+            if journal_size > self._journal_offset:
+                self._replay_journal()
+
+    def _files_unchanged(self) -> bool:
+        journal_id = _file_id(self.journal_path)
+        journal_inode = journal_id[0] if journal_id else None
+        journal_size = journal_id[2] if journal_id else 0
+        return (_file_id(self.snapshot_path) == self._snapshot_id
+                and journal_inode == self._journal_id
+                and journal_size == self._journal_offset)
+
+    def _load_snapshot(self):
+        users = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    record = dict(zip(FIELDS, _row_from_csv(row)))
+                    users[record['email']] = record
+        self._users = users
+        self._versions = {}
+
+    def _replay_journal(self):
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            data = f.read()
+        # Only consume complete lines; a partially written tail is read next time.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line:
+                self._apply(json.loads(line))
+        self._journal_offset += end
+
+    def _apply(self, entry):
+        seq, email, field, value = entry
+        self._seq = max(self._seq, seq)
+        self._versions[email] = seq
+        self._journal_entries += 1
+        if field is None:
+            if email not in self._users:
+                record = {key: value.get(key) for key in FIELDS[1:]}
+                self._users[email] = {'email': email, **record}
+        elif email in self._users:
+            if isinstance(field, list):
+                self._users[email].update(zip(field, value))
+            else:
+                self._users[email][field] = value
+        if self._journal_entries >= self.compact_threshold:
+            self._compact_event.set()
+
+    def get(self, email: str) -> dict | None:
+        """Returns the raw (still JSON-encoded) row for a user, or None."""
+        with self._lock:
+            self._refresh()
+            record = self._users.get(email)
+            return dict(record) if record is not None else None
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._users)
+
+    def version(self, email: str):
+        """
+        Returns a token that changes whenever any process appends a change of
+        this user to the journal, or replaces the snapshot (compaction, which
+        changes every user's token once per `compact_threshold` writes).
+        """
+        with self._lock:
+            self._refresh()
+            return (self._snapshot_id, self._versions.get(email, 0))
+
+    # --- Writing ---
+    def _append(self, email, field, value):
+        line = json.dumps([self._seq + 1, email, field, value], separators=(',', ':')) + '\n'
+        encoded = line.encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            f.write(encoded)
+            inode = os.fstat(f.fileno()).st_ino
+        if inode != self._journal_id:
+            # We just created the journal file; nothing else is in it yet.
+            self._journal_id = inode
+            self._journal_offset = 0
+        self._journal_offset += len(encoded)
+        self._apply(json.loads(line))
+
+    def create(self, email: str, record: dict) -> bool:
+        """Inserts a new user. Returns False if the email is already taken."""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            if email in self._users:
+                return False
+            self._append(email, None, {field: record.get(field) for field in FIELDS[1:]})
+            return True
+
+    def update_field(self, email: str, field: str, value) -> bool:
+        """Sets one column of one user. Returns False if the user does not exist."""
+        if field not in FIELDS[1:]:
+            raise ValueError(f"Unknown user field: {field!r}")
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            if email not in self._users:
+                return False
+            self._append(email, field, value)
+            return True
+
+    def update_fields(self, email: str, values: dict) -> bool:
+        """Sets several fields of one user in one journal line. Returns False if the user does not exist."""
+        unknown = set(values) - set(FIELDS[1:])
+        if unknown:
+            raise ValueError(f"Unknown user fields: {sorted(unknown)!r}")
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            if email not in self._users:
+                return False
+            self._append(email, list(values), list(values.values()))
+            return True
+
+    # --- Compaction ---
+    def compact(self, force: bool = True):
+        """
+        Folds the journal into a new snapshot and starts an empty journal.
+        With force=False this is skipped if another process compacted first.
+        """
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            if not force and self._journal_entries < self.compact_threshold:
+                return
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(FIELDS)
+                for record in self._users.values():
+                    writer.writerow(['' if record[field] is None else record[field] for field in FIELDS])
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # If we stop between the two renames, replaying the old journal over
+            # the new snapshot is harmless: every entry is already reflected in it.
+            tmp_journal = self.journal_path + '.tmp'
+            open(tmp_journal, 'wb').close()
+            os.replace(tmp_journal, self.journal_path)
+            self._snapshot_id = _file_id(self.snapshot_path)
+            self._journal_id = _file_id(self.journal_path)[0]
+            self._journal_offset = 0
+            self._journal_entries = 0
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait()
+            self._compact_event.clear()
+            try:
+                self.compact(force=False)
+            except Exception:
+                # Keep the thread alive whatever went wrong (a locked or full
+                # disk, a corrupt journal line): it is retried on the next append.
+                log.exception("Compaction of '%s' failed.", self.journal_path)
+
+
+def _file_id(path: str):
+    """Returns (inode, mtime, size) for a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+# --- Store Registry ---
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(path: str, legacy_csv: str | None = None, backend: str = 'sqlite', **options):
+    """
+    Returns the shared store for a path, creating it on first use.
+
+    backend='sqlite': `path` is the database. When it is new and a legacy CSV
+    exists, its users are imported once.
+    backend='journal': `path` is the users.csv snapshot; changes are journaled next to it.
+    """
+    key = (backend, path)
+    store = _stores.get(key)
+    if store is not None:
+        return store
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if backend == 'journal':
+                store = JournalUserStore(path, **options)
+            elif backend == 'sqlite':
+                store = SQLiteUserStore(path)
+                if legacy_csv and os.path.exists(legacy_csv) and not store.get_meta('csv_imported'):
+                    store.import_csv(legacy_csv)
+                    store.set_meta('csv_imported', os.path.abspath(legacy_csv))
+            else:
+                raise ValueError(f"Unknown user store backend: {backend!r}")
+            _stores[key] = store
+    return store
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import a legacy users.csv into the SQLite user store.")
+    parser.add_argument('csv_path', help="Path to the users.csv file to import.")
+    parser.add_argument('db_path', help="Path to the SQLite database to create or update.")
+    args = parser.parse_args()
+
+    target = SQLiteUserStore(args.db_path)
+    count = target.import_csv(args.csv_path)
+    target.set_meta('csv_imported', os.path.abspath(args.csv_path))
+    print(f"Imported {count} user(s) from '{args.csv_path}' into '{args.db_path}'.")
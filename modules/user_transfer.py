@@ -0,0 +1,507 @@
+# modules/user_transfer.py
+#
+# Streaming conversion of user records between the places users have been kept:
+#
+#   csv      users.csv as read by user_manager (and the journal snapshot), one
+#            row per user with JSON-encoded columns;
+#   json     users.json as written by app2.py: one object keyed by email, with
+#            the typing baseline nested as {"samples": [...], "average_speed": x};
+#            the flat layout of user_db.USER_DATABASE ("baseline_speeds",
+#            "average_speed") is read too, and written with layout='user_db';
+#   jsonl    one JSON document per line, keyed like the store columns;
+#   sqlite   the SQLite user store (modules/user_store.py);
+#   journal  the users.csv snapshot of the journal backend;
+#   user_db  the in-memory user_db.USER_DATABASE of the Streamlit pages
+#            (in-process only: read_user_db / UserDbWriter).
+#
+# Every record is normalized to a raw store row (user_store.FIELDS, JSON
+# columns encoded) on the way through, and records that cannot be normalized
+# are reported instead of written. Readers yield one record at a time (users.json
+# is parsed incrementally, chunk by chunk) and writers take a batch at a time,
+# so memory use depends on the batch size, not on the number of users.
+#
+# File writers write to a temporary file and rename it into place on close;
+# the SQLite writer inserts each batch in one transaction and, like the CSV
+# import, leaves users that already exist untouched.
+
+import csv
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+
+from . import user_store
+from .file_lock import FileLock
+
+# Store columns holding JSON, and the type their decoded value must have.
+JSON_FIELDS = {
+    'webauthn_credential': dict,
+    'click_profile': list,
+    'typing_samples': list,
+    'typing_stats': dict,
+    'behavior_model': dict,
+}
+TEXT_FIELDS = ('secret_passkey', 'credential_id', 'credential_public_key')
+LAYOUTS = ('users.json', 'user_db')
+
+_EMAIL = re.compile(r'[^@\s]+@[^@\s]+')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class InvalidRecord(ValueError):
+    """A record that cannot be normalized; `reason` names the field, never its value."""
+
+    def __init__(self, reason: str, email=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.email = email
+
+
+# --- Normalization ---
+def _decode(field, value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            raise InvalidRecord(f"{field}: not valid JSON") from None
+    if value is not None and not isinstance(value, JSON_FIELDS[field]):
+        raise InvalidRecord(f"{field}: expected a JSON {JSON_FIELDS[field].__name__}")
+    return value
+
+
+def _number(field, value, kind=float):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise InvalidRecord(f"{field}: not a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f"{field}: not a number") from None
+    if not math.isfinite(number):
+        raise InvalidRecord(f"{field}: not a finite number")
+    if kind is int:
+        if not number.is_integer() or number < 0:
+            raise InvalidRecord(f"{field}: not a non-negative integer")
+        return int(number)
+    return number
+
+
+def _clicks(value):
+    points = []
+    for point in value:
+        if not isinstance(point, dict):
+            raise InvalidRecord("click_profile: point is not an object")
+        # user_db.save_click_profile takes canvas objects ({"left", "top"}).
+        x, y = (point.get('x'), point.get('y')) if 'x' in point else (point.get('left'), point.get('top'))
+        if x is None or y is None:
+            raise InvalidRecord("click_profile: point without x/y")
+        points.append({"x": _number('click_profile', x), "y": _number('click_profile', y)})
+    return points
+
+
+def normalize(email, doc: dict) -> dict:
+    """
+    Returns the raw store row for a record in any of the known layouts.
+    Empty strings count as missing. Raises InvalidRecord.
+    """
+    if not isinstance(doc, dict):
+        raise InvalidRecord("record: not an object", email)
+    doc = {key: (None if value == '' else value) for key, value in doc.items()}
+    email = email if email is not None else doc.get('email')
+    if isinstance(email, str):
+        email = email.strip()
+    try:
+        if not isinstance(email, str) or not _EMAIL.fullmatch(email):
+            raise InvalidRecord("email: missing or malformed")
+
+        baseline = doc.get('typing_baseline')
+        if baseline is not None and not isinstance(baseline, dict):
+            raise InvalidRecord("typing_baseline: expected a JSON object")
+        baseline = baseline or {}
+        samples = doc.get('typing_samples', baseline.get('samples', doc.get('baseline_speeds')))
+        average = doc.get('typing_average', baseline.get('average_speed', doc.get('average_speed')))
+
+        values = {field: _decode(field, doc.get(field)) for field in JSON_FIELDS}
+        values['typing_samples'] = _decode('typing_samples', samples)
+        if values['click_profile'] is not None:
+            values['click_profile'] = _clicks(values['click_profile'])
+        if values['typing_samples'] is not None:
+            values['typing_samples'] = [_number('typing_samples', v) for v in values['typing_samples']]
+        average = _number('typing_average', average)
+        if average is None and values['typing_samples']:
+            # Legacy files kept the samples but not always their mean.
+            average = sum(values['typing_samples']) / len(values['typing_samples'])
+
+        row = {'email': email}
+        for field in user_store.FIELDS[1:]:
+            if field in JSON_FIELDS:
+                value = values[field]
+                row[field] = json.dumps(value) if value is not None else None
+            elif field in TEXT_FIELDS:
+                value = doc.get(field)
+                if value is not None and not isinstance(value, str):
+                    raise InvalidRecord(f"{field}: not a string")
+                row[field] = value
+        row['typing_average'] = average
+        row['sign_count'] = _number('sign_count', doc.get('sign_count'), int)
+    except InvalidRecord as e:
+        e.email = email if isinstance(email, str) else None
+        raise
+    return row
+
+
+def to_document(row: dict, layout: str | None = None) -> dict:
+    """
+    The inverse of normalize: a row with its JSON columns decoded. With a
+    layout, the typing baseline is arranged as in users.json or user_db, the
+    email is left out (it is the key) and empty columns beyond that layout's
+    own fields are dropped.
+    """
+    doc = {field: (json.loads(row[field]) if field in JSON_FIELDS and row[field] is not None else row[field])
+           for field in user_store.FIELDS}
+    if layout is None:
+        return doc
+    samples, average = doc.pop('typing_samples'), doc.pop('typing_average')
+    if layout == 'users.json':
+        base = {
+            'webauthn_credential': doc.pop('webauthn_credential'),
+            'click_profile': doc.pop('click_profile'),
+            'secret_passkey': doc.pop('secret_passkey'),
+            'typing_baseline': {'samples': samples or [], 'average_speed': average},
+        }
+    elif layout == 'user_db':
+        base = {
+            'baseline_speeds': samples or [],
+            'average_speed': average,
+            'click_profile': doc.pop('click_profile') or [],
+            'secret_passkey': doc.pop('secret_passkey'),
+        }
+    else:
+        raise ValueError(f"Unknown layout: {layout!r}")
+    del doc['email']
+    base.update((field, value) for field, value in doc.items() if value is not None)
+    return base
+
+
+# --- Readers ---
+# Each yields (position, email, document): the line (CSV, JSONL) or record
+# number (JSON, SQLite) for error reports, the key if the format has one
+# outside the document, and the document, or an InvalidRecord if the record
+# could not even be parsed.
+
+def read_csv(path: str):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, None, row
+
+
+def read_jsonl(path: str):
+    with open(path, encoding='utf-8-sig') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, None, json.loads(line)
+            except json.JSONDecodeError:
+                yield number, None, InvalidRecord("record: not valid JSON")
+
+
+class _ObjectStream:
+    """
+    The (key, value) pairs of a top-level JSON object, decoded from a file read
+    in chunks. Only the unconsumed tail of the last chunk is kept, so a
+    multi-gigabyte users.json is read with about one chunk plus one record in memory.
+    """
+
+    def __init__(self, f, chunk_size: int):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self.offset = 0  # characters consumed before the buffer, for error messages
+
+    def _more(self) -> bool:
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            return False
+        self.offset += self._pos
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skips whitespace; returns the next character, or '' at the end of the file."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ''
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"expected one of {chars!r} at character {self.offset + self._pos}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                if self._more():
+                    continue
+                raise ValueError(f"{e.msg} at character {self.offset + e.pos}") from None
+            # A number may stop at the end of a chunk ("12" of "123"), so a
+            # value is only taken once something follows it.
+            if end == len(self._buf) and self._more():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError(f"expected a key at character {self.offset + self._pos}")
+            self._expect(':')
+            yield key, self._value()
+            if self._expect(',}') == '}':
+                return
+
+
+def read_json(path: str, chunk_size: int = 1 << 20):
+    """Reads users.json (or a user_db dump) without loading it whole; raises ValueError if it is not a JSON object."""
+    with open(path, encoding='utf-8-sig') as f:
+        for number, (email, doc) in enumerate(_ObjectStream(f, chunk_size), 1):
+            yield number, email, doc
+
+
+def read_sqlite(path: str, batch_size: int = 1000):
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    for number, row in enumerate(user_store.SQLiteUserStore(path).iter_rows(batch_size), 1):
+        yield number, None, row
+
+
+def journal_pending(snapshot_path: str) -> bool:
+    """Whether the journal next to a snapshot holds changes not yet compacted into it."""
+    try:
+        return os.path.getsize(snapshot_path + '.journal') > 0
+    except FileNotFoundError:
+        return False
+
+
+def read_journal(path: str):
+    """
+    Reads the snapshot of the journal backend. Pending journal entries would
+    need the whole store in memory to apply, so they must be compacted first.
+    """
+    if journal_pending(path):
+        raise ValueError(f"'{path}.journal' has changes that are not in the snapshot yet; compact it first")
+    yield from read_csv(path)
+
+
+def read_user_db(database: dict | None = None):
+    if database is None:
+        from . import user_db
+        database = user_db.USER_DATABASE
+    for number, (email, doc) in enumerate(database.items(), 1):
+        yield number, email, doc
+
+
+# --- Writers ---
+# write(rows) stores one batch of normalized rows and returns how many were
+# stored; close() makes them visible, abort() throws them away.
+
+class _FileWriter:
+    def __init__(self, path: str, overwrite: bool = False):
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f"'{path}' exists; pass overwrite=True to replace it")
+        self.path = path
+        self._tmp_path = path + '.tmp'
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._f = open(self._tmp_path, 'w', newline='', encoding='utf-8')
+
+    def close(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._f.close()
+        os.remove(self._tmp_path)
+
+
+class CsvWriter(_FileWriter):
+    def __init__(self, path: str, overwrite: bool = False):
+        super().__init__(path, overwrite)
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(user_store.FIELDS)
+
+    def write(self, rows) -> int:
+        self._writer.writerows(['' if row[field] is None else row[field] for field in user_store.FIELDS]
+                               for row in rows)
+        return len(rows)
+
+
+class JournalWriter(CsvWriter):
+    """Writes a new snapshot for the journal backend and starts it with an empty journal."""
+
+    def close(self):
+        with FileLock(self.path + '.lock').exclusive():
+            super().close()
+            # As in JournalUserStore.compact: the old journal belongs to the old snapshot.
+            tmp_journal = self.path + '.journal.tmp'
+            open(tmp_journal, 'wb').close()
+            os.replace(tmp_journal, self.path + '.journal')
+
+
+class JsonlWriter(_FileWriter):
+    def write(self, rows) -> int:
+        self._f.writelines(json.dumps(to_document(row)) + '\n' for row in rows)
+        return len(rows)
+
+
+class JsonWriter(_FileWriter):
+    """Writes users.json (layout='users.json') or a user_db dump (layout='user_db'), one user at a time."""
+
+    def __init__(self, path: str, overwrite: bool = False, layout: str = 'users.json'):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout: {layout!r}")
+        super().__init__(path, overwrite)
+        self.layout = layout
+        self._first = True
+        self._f.write('{')
+
+    def write(self, rows) -> int:
+        for row in rows:
+            # Indented like app2.save_users (json.dump(..., indent=4)).
+            doc = json.dumps(to_document(row, self.layout), indent=4).replace('\n', '\n    ')
+            self._f.write(f"{'' if self._first else ','}\n    {json.dumps(row['email'])}: {doc}")
+            self._first = False
+        return len(rows)
+
+    def close(self):
+        self._f.write('}' if self._first else '\n}')
+        super().close()
+
+
+class SQLiteWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._store = user_store.SQLiteUserStore(path)
+
+    def write(self, rows) -> int:
+        return self._store.insert_many(rows)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        # Batches are committed as they go; users already copied stay.
+        pass
+
+
+class UserDbWriter:
+    """Fills user_db.USER_DATABASE (or the given dict) in the layout of the Streamlit pages."""
+
+    def __init__(self, database: dict | None = None):
+        if database is None:
+            from . import user_db
+            database = user_db.USER_DATABASE
+        self._database = database
+
+    def write(self, rows) -> int:
+        written = 0
+        for row in rows:
+            if row['email'] not in self._database:
+                self._database[row['email']] = to_document(row, 'user_db')
+                written += 1
+        return written
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+# --- Transfer ---
+class TransferStats:
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.invalid = 0
+        self.reasons = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def skipped(self) -> int:
+        """Valid records the destination already had (SQLite, user_db)."""
+        return self.read - self.invalid - self.written
+
+    @property
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+def transfer(records, writer, batch_size: int = 10000, on_invalid=None, on_batch=None) -> TransferStats:
+    """
+    Normalizes the (position, email, document) records of a reader and hands
+    them to the writer `batch_size` at a time. Invalid records are counted by
+    reason and passed to on_invalid(position, error); on_batch(stats) is
+    called after every batch. The writer is closed on success and aborted on
+    error. A writer of None only validates.
+    """
+    stats = TransferStats()
+    batch = []
+
+    def flush():
+        if writer is not None:
+            stats.written += writer.write(batch)
+        else:
+            stats.written += len(batch)
+        batch.clear()
+        stats.elapsed = time.perf_counter() - stats.started
+        if on_batch is not None:
+            on_batch(stats)
+
+    try:
+        for position, email, doc in records:
+            stats.read += 1
+            try:
+                if isinstance(doc, InvalidRecord):
+                    raise doc
+                batch.append(normalize(email, doc))
+            except InvalidRecord as e:
+                stats.invalid += 1
+                stats.reasons[e.reason] += 1
+                if on_invalid is not None:
+                    on_invalid(position, e)
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
@@ -3,9 +3,31 @@
 from webauthn import (
     generate_registration_options,
     generate_authentication_options,
+    verify_registration_response,
+    verify_authentication_response,
 )
+from webauthn.helpers import base64url_to_bytes, exceptions, parse_attestation_object
 from webauthn.helpers.structs import AuthenticatorSelectionCriteria
+from collections import deque
+from functools import lru_cache
 import base64
+import json
+import os
+import threading
+
+from .user_record import CredentialKey
+
+try:
+    from webauthn.helpers import parse_authentication_credential_json, parse_registration_credential_json
+except ImportError:
+    # webauthn 1.x: the credential structs parse JSON themselves.
+    from webauthn.helpers.structs import AuthenticationCredential, RegistrationCredential
+
+    def parse_registration_credential_json(credential):
+        return RegistrationCredential.parse_raw(json.dumps(credential))
+
+    def parse_authentication_credential_json(credential):
+        return AuthenticationCredential.parse_raw(json.dumps(credential))
 
 # --- Relying Party (RP) Configuration ---
 # This identifies your web application to the browser and authenticator
@@ -13,83 +35,207 @@ RP_ID = "localhost"
 RP_NAME = "AdaptiveAuth Demo"
 ORIGIN = f"http://{RP_ID}:8501"
 
-def get_registration_options(email: str) -> dict:
+# Same size as the webauthn library's own challenges.
+CHALLENGE_BYTES = 64
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip("=")
+
+
+def _value(field):
+    # webauthn 1.x returns some fields as enums where later versions return plain strings.
+    return getattr(field, 'value', field)
+
+
+# --- Challenge Pool ---
+
+class ChallengePool:
     """
-    Generates the options for WebAuthn registration and returns them
-    as a simple, JSON-serializable dictionary.
+    Random challenges, already base64url-encoded, generated in batches by a
+    background thread so that a request only pops one. When the pool runs dry
+    pop() generates a challenge itself, so it never waits for the refill.
     """
-    # Create an instance of the required class for authenticator selection.
-    auth_selection = AuthenticatorSelectionCriteria(
-        authenticator_attachment="platform",
-        user_verification="preferred",
-    )
 
-    # Call the library function to get its special class object
+    def __init__(self, size: int = 1024, low_water: int = 256):
+        self.size = size
+        self.low_water = low_water
+        self._challenges = deque()
+        self._wanted = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # A forked worker must never hand out the challenges its parent has.
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def pop(self) -> str:
+        if self._thread is None:
+            self._start()
+        try:
+            challenge = self._challenges.popleft()
+        except IndexError:
+            challenge = _b64url(os.urandom(CHALLENGE_BYTES))
+        if len(self._challenges) < self.low_water:
+            self._wanted.set()
+        return challenge
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill_loop, name='challenge-pool', daemon=True)
+                self._thread.start()
+
+    def _refill_loop(self):
+        while True:
+            missing = self.size - len(self._challenges)
+            if missing > 0:
+                block = os.urandom(CHALLENGE_BYTES * missing)
+                self._challenges.extend(_b64url(block[i:i + CHALLENGE_BYTES])
+                                        for i in range(0, len(block), CHALLENGE_BYTES))
+            self._wanted.wait()
+            self._wanted.clear()
+
+    def _after_fork(self):
+        self._challenges = deque()
+        self._wanted = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+
+challenge_pool = ChallengePool()
+
+
+# --- Options Templates ---
+# The parts of the options that depend only on the RP configuration are built
+# once through the webauthn library and cached as plain JSON values. A request
+# copies the template and fills in the user and a pooled challenge. The nested
+# values are shared between requests, so they must not be modified.
+
+@lru_cache(maxsize=None)
+def _registration_template(rp_id: str, rp_name: str) -> dict:
     options_obj = generate_registration_options(
-        rp_id=RP_ID,
-        rp_name=RP_NAME,
-        user_id=email.encode('utf-8'),
-        user_name=email,
-        authenticator_selection=auth_selection,
+        rp_id=rp_id,
+        rp_name=rp_name,
+        user_id=b"template",
+        user_name="template",
+        authenticator_selection=AuthenticatorSelectionCriteria(
+            authenticator_attachment="platform",
+            user_verification="preferred",
+        ),
     )
-
-    # Manually create a clean dictionary from the object's attributes.
-    # This ensures it can be perfectly converted to JSON for the frontend.
-    options_dict = {
+    return {
         "rp": {
             "name": options_obj.rp.name,
             "id": options_obj.rp.id,
         },
-        "user": {
-            "id": base64.urlsafe_b64encode(options_obj.user.id).decode('utf-8').rstrip("="),
-            "name": options_obj.user.name,
-            "displayName": options_obj.user.display_name,
-        },
-        "challenge": base64.urlsafe_b64encode(options_obj.challenge).decode('utf-8').rstrip("="),
         "pubKeyCredParams": [
-            {"type": param.type, "alg": param.alg} for param in options_obj.pub_key_cred_params
+            {"type": "public-key", "alg": _value(param.alg)} for param in options_obj.pub_key_cred_params
         ],
         "timeout": options_obj.timeout,
-        "attestation": options_obj.attestation,
+        "attestation": _value(options_obj.attestation),
         "authenticatorSelection": {
-            "authenticatorAttachment": options_obj.authenticator_selection.authenticator_attachment,
-            "userVerification": options_obj.authenticator_selection.user_verification,
+            "authenticatorAttachment": _value(options_obj.authenticator_selection.authenticator_attachment),
+            "userVerification": _value(options_obj.authenticator_selection.user_verification),
         },
     }
 
-    return options_dict
-
-def get_authentication_options(user_credential: dict) -> dict:
-    """
-    Generates the options for WebAuthn authentication (login) and returns them
-    as a simple, JSON-serializable dictionary.
-    """
-    raw_id_str = user_credential.get("rawId")
-    if not raw_id_str:
-        raise ValueError("Credential is missing 'rawId'")
-        
-    padding = '=' * (-len(raw_id_str) % 4)
-    decoded_credential_id = base64.urlsafe_b64decode(raw_id_str + padding)
-
-    # It's good practice to also provide the credential type here.
-    options_obj = generate_authentication_options(
-        rp_id=RP_ID,
-        allow_credentials=[{"id": decoded_credential_id, "type": "public-key"}],
-    )
 
-    # Manually build the clean dictionary
-    options_dict = {
-        "challenge": base64.urlsafe_b64encode(options_obj.challenge).decode('utf-8').rstrip("="),
+@lru_cache(maxsize=None)
+def _authentication_template(rp_id: str) -> dict:
+    options_obj = generate_authentication_options(rp_id=rp_id)
+    return {
         "timeout": options_obj.timeout,
         "rpId": options_obj.rp_id,
-        "allowCredentials": [
-            {
-                "type": cred['type'],
-                # --- THIS IS THE FIX ---
-                # Changed 'base6d4' to the correct 'base64'.
-                "id": base64.urlsafe_b64encode(cred['id']).decode('utf-8').rstrip("=")
-            } for cred in options_obj.allow_credentials
-        ],
     }
 
-    return options_dict
\ No newline at end of file
+
+def get_registration_options(email: str, rp_name: str = RP_NAME) -> dict:
+    """
+    Returns the options for WebAuthn registration as a simple,
+    JSON-serializable dictionary. `rp_name` is the name authenticators show.
+    """
+    options = dict(_registration_template(RP_ID, rp_name))
+    options["user"] = {
+        "id": _b64url(email.encode('utf-8')),
+        "name": email,
+        "displayName": email,
+    }
+    options["challenge"] = challenge_pool.pop()
+    return options
+
+
+def get_authentication_options(credential_id: str) -> dict:
+    """
+    Returns the options for WebAuthn authentication (login) as a simple,
+    JSON-serializable dictionary. `credential_id` is the stored base64url id.
+    """
+    if not credential_id:
+        raise ValueError("Missing credential id")
+
+    options = dict(_authentication_template(RP_ID))
+    options["challenge"] = challenge_pool.pop()
+    options["allowCredentials"] = [{"type": "public-key", "id": credential_id}]
+    return options
+
+
+# --- Verification ---
+# Attestation and assertion checks are done by the webauthn library. What the
+# browser sends is untrusted, so any malformed or failing credential simply
+# fails verification.
+
+# webauthn 1.x has no common base class for its errors.
+_INVALID = (getattr(exceptions, 'WebAuthnException', Exception), ValueError, KeyError, TypeError, AttributeError)
+
+
+def verify_registration(credential: dict, expected_challenge: str) -> CredentialKey | None:
+    """
+    Verifies a registration credential against the challenge it was issued for.
+    Returns the key to store for later logins, or None if verification fails.
+    """
+    try:
+        verified = verify_registration_response(
+            credential=parse_registration_credential_json(credential),
+            expected_challenge=base64url_to_bytes(expected_challenge),
+            expected_rp_id=RP_ID,
+            expected_origin=ORIGIN,
+        )
+    except _INVALID:
+        return None
+    return CredentialKey(_b64url(verified.credential_id), verified.credential_public_key, verified.sign_count)
+
+
+def verify_authentication(credential: dict, expected_challenge: str, key: CredentialKey) -> int | None:
+    """
+    Verifies a login assertion with the stored key. Returns the authenticator's
+    new sign count, or None if verification fails (a sign count that went
+    backwards, as from a cloned authenticator, fails it).
+    """
+    try:
+        parsed = parse_authentication_credential_json(credential)
+        if _b64url(parsed.raw_id) != key.credential_id:
+            return None
+        verified = verify_authentication_response(
+            credential=parsed,
+            expected_challenge=base64url_to_bytes(expected_challenge),
+            expected_rp_id=RP_ID,
+            expected_origin=ORIGIN,
+            credential_public_key=key.public_key,
+            credential_current_sign_count=key.sign_count,
+        )
+    except _INVALID:
+        return None
+    return verified.new_sign_count
+
+
+def key_from_attestation(credential: dict) -> CredentialKey | None:
+    """
+    Reads the key out of a stored registration credential without verifying it.
+    Only for credentials saved before registrations were verified.
+    """
+    try:
+        attestation = parse_attestation_object(base64url_to_bytes(credential['response']['attestationObject']))
+        attested = attestation.auth_data.attested_credential_data
+        return CredentialKey(_b64url(attested.credential_id), attested.credential_public_key,
+                             attestation.auth_data.sign_count)
+    except _INVALID:
+        return None
@@ -1,6 +1,6 @@
 // static/js/click_canvas.js
 
-function initializeCanvas(imageUrl, postUrl) {
+function initializeCanvas(imageUrl, postUrl, maxClicks = 3) {
     const canvas = document.getElementById('click-canvas');
     if (!canvas) {
         console.error("Canvas element #click-canvas not found!");
@@ -14,7 +14,7 @@ function initializeCanvas(imageUrl, postUrl) {
     const errorEl = document.getElementById('error-message');
 
     let clicks = [];
-    const MAX_CLICKS = 3;
+    const MAX_CLICKS = maxClicks;
 
     const bgImage = new Image();
     bgImage.src = imageUrl;
@@ -110,4 +110,12 @@ function initializeCanvas(imageUrl, postUrl) {
     }
 
     updateUI();
-}
\ No newline at end of file
+}
+
+// The page passes the image URL, the POST URL and the number of points as
+// data attributes of #canvas-container.
+(function() {
+    const container = document.getElementById('canvas-container');
+    if (!container) { return; }
+    initializeCanvas(container.dataset.imageUrl, container.dataset.postUrl, Number(container.dataset.clickPoints));
+})();
\ No newline at end of file
@@ -0,0 +1,42 @@
+// static/js/keystrokes.js
+
+// Records key-down/key-up times for one typing attempt and encodes them as
+// "delta,dwell,delta,dwell,..." in whole milliseconds, where delta is the time
+// since the previous key-down and dwell is how long the key was held.
+// The server decodes this in modules/keystroke_features.py.
+function createKeystrokeRecorder(input) {
+    let keystrokes = [];
+    let pending = {};
+
+    input.addEventListener('keydown', (event) => {
+        if (event.repeat || event.key.length !== 1) { return; }
+        pending[event.code] = keystrokes.length;
+        keystrokes.push({ down: performance.now(), up: null });
+    });
+
+    // Listen on the window: the input may already be disabled when the last key is released.
+    window.addEventListener('keyup', (event) => {
+        const index = pending[event.code];
+        if (index === undefined) { return; }
+        keystrokes[index].up = performance.now();
+        delete pending[event.code];
+    });
+
+    return {
+        encode() {
+            const parts = [];
+            let previousDown = null;
+            for (const k of keystrokes) {
+                const delta = previousDown === null ? 0 : k.down - previousDown;
+                const dwell = k.up === null ? 0 : k.up - k.down;
+                parts.push(Math.round(delta), Math.round(dwell));
+                previousDown = k.down;
+            }
+            return parts.join(',');
+        },
+        reset() {
+            keystrokes = [];
+            pending = {};
+        },
+    };
+}
@@ -0,0 +1,39 @@
+// static/js/session_timeout.js
+
+// Warns logged-in users before their session times out and logs them out
+// when it does.
+(function() {
+    const WARNING_TIME = 20 * 1000; // 20 seconds of inactivity
+    const LOGOUT_TIME = 60 * 1000;  // 60 seconds total session
+    const COUNTDOWN_SECONDS = 40;
+    let warningTimer, logoutTimer, countdownInterval;
+    const modal = document.getElementById('session-timeout-modal');
+    const countdownEl = document.getElementById('session-countdown');
+    const stayButton = document.getElementById('session-stay-button');
+    const logoutUrl = modal.dataset.logoutUrl;
+    function showWarning() {
+        let secondsLeft = COUNTDOWN_SECONDS;
+        countdownEl.textContent = secondsLeft;
+        modal.style.display = 'flex';
+        countdownInterval = setInterval(() => {
+            secondsLeft--;
+            countdownEl.textContent = secondsLeft;
+            if (secondsLeft <= 0) clearInterval(countdownInterval);
+        }, 1000);
+    }
+    function hideWarning() {
+        modal.style.display = 'none';
+        clearInterval(countdownInterval);
+    }
+    function logoutUser() { window.location.href = logoutUrl; }
+    function resetTimers() {
+        clearTimeout(warningTimer);
+        clearTimeout(logoutTimer);
+        hideWarning();
+        warningTimer = setTimeout(showWarning, WARNING_TIME);
+        logoutTimer = setTimeout(logoutUser, LOGOUT_TIME);
+    }
+    stayButton.addEventListener('click', resetTimers);
+    ['mousemove', 'mousedown', 'keypress', 'touchmove'].forEach(event => window.addEventListener(event, resetTimers));
+    resetTimers();
+})();
\ No newline at end of file
@@ -0,0 +1,32 @@
+// static/js/step_up.js
+
+// Step-up challenge: times the typed sentence and attaches the duration and
+// keystroke timings to the recovery form.
+const typingInput = document.getElementById('typing-challenge');
+const durationInput = document.getElementById('typing_duration');
+const keystrokesInput = document.getElementById('keystrokes');
+const form = document.getElementById('recovery-form');
+const challengeText = typingInput.dataset.challengeText;
+const recorder = createKeystrokeRecorder(typingInput);
+let startTime = 0;
+
+// Start timer on first keypress
+typingInput.addEventListener('keydown', (event) => {
+    if (startTime === 0 && event.key.length === 1) {
+        startTime = performance.now();
+    }
+});
+
+// Stop timer and submit when the text matches
+form.addEventListener('submit', (event) => {
+    if (typingInput.value === challengeText) {
+        const endTime = performance.now();
+        const durationSeconds = (endTime - startTime) / 1000;
+        durationInput.value = durationSeconds.toFixed(4);
+        keystrokesInput.value = recorder.encode();
+    } else {
+        // Prevent form submission if text is wrong
+        alert("The typed text does not match the challenge sentence.");
+        event.preventDefault();
+    }
+});
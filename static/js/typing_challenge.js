@@ -0,0 +1,107 @@
+// static/js/typing_challenge.js
+
+// Registration typing baseline: times four attempts at the challenge sentence
+// and submits the durations with their keystroke timings.
+const totalAttempts = 4;
+
+const instructionText = document.getElementById('instruction-text');
+const progressLabel = document.getElementById('progress-label');
+const typingInput = document.getElementById('typing-input');
+const challengeText = typingInput.dataset.challengeText;
+const feedbackText = document.getElementById('feedback-text');
+const hiddenForm = document.getElementById('typing-form');
+
+let currentAttempt = 1;
+let startTime = 0;
+const durations = [];
+const keystrokeSamples = [];
+const recorder = createKeystrokeRecorder(typingInput);
+
+typingInput.addEventListener('input', handleTyping);
+
+function handleTyping() {
+    const inputText = typingInput.value;
+
+    // Start timer on the very first character of an attempt
+    if (inputText.length === 1 && startTime === 0) {
+        startTime = performance.now();
+    }
+
+    // Check for correctness in real-time
+    if (challengeText.startsWith(inputText)) {
+        typingInput.style.borderColor = 'var(--success-color)';
+        feedbackText.textContent = '';
+        feedbackText.className = 'feedback';
+    } else {
+        typingInput.style.borderColor = 'var(--error-color)';
+        feedbackText.textContent = 'Mistake detected. Please correct it.';
+        feedbackText.className = 'feedback incorrect';
+    }
+
+    // Check for successful completion of one attempt
+    if (inputText === challengeText) {
+        const endTime = performance.now();
+        const duration = (endTime - startTime) / 1000; // in seconds
+        durations.push(duration);
+        
+        feedbackText.textContent = `Correct! Duration: ${duration.toFixed(2)}s`;
+        feedbackText.className = 'feedback correct';
+
+        currentAttempt++;
+
+        if (currentAttempt > totalAttempts) {
+            // All attempts are done, finalize and submit
+            finalizeAndSubmit();
+        } else {
+            // Reset for the next attempt
+            resetForNextAttempt();
+        }
+    }
+}
+
+function resetForNextAttempt() {
+    typingInput.disabled = true; // Briefly disable to show feedback
+    setTimeout(() => {
+        // Encode here rather than on the last input event, so the final key-up is included.
+        keystrokeSamples.push(recorder.encode());
+        recorder.reset();
+        startTime = 0;
+        typingInput.value = '';
+        typingInput.style.borderColor = 'var(--border-color)';
+        progressLabel.textContent = `Attempt ${currentAttempt} of ${totalAttempts}`;
+        feedbackText.textContent = '';
+        feedbackText.className = 'feedback';
+        typingInput.disabled = false;
+        typingInput.focus();
+    }, 1500); // Wait 1.5 seconds before clearing for next attempt
+}
+
+function finalizeAndSubmit() {
+    instructionText.textContent = 'Typing profile created! Please wait...';
+    typingInput.disabled = true;
+
+    // Give the final key-up a moment to arrive before encoding the last attempt.
+    setTimeout(() => {
+        keystrokeSamples.push(recorder.encode());
+
+        // Dynamically create hidden inputs for each duration and its keystroke timings
+        durations.forEach((duration, index) => {
+            addHiddenInput('durations', duration.toFixed(4));
+            addHiddenInput('keystrokes', keystrokeSamples[index]);
+        });
+
+        // Submit the form to the server
+        hiddenForm.submit();
+    }, 250);
+}
+
+function addHiddenInput(name, value) {
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = name;
+    input.value = value;
+    hiddenForm.appendChild(input);
+}
+
+// Focus the input field on page load
+typingInput.focus();
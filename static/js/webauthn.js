@@ -109,4 +109,15 @@ async function sendCredentialToServer(payload, url) {
             document.getElementById('webauthn-button').disabled = false;
         }
     }
-}
\ No newline at end of file
+}
+
+// --- Page Start ---
+// The page passes the options as JSON in #webauthn-options and the URLs as
+// data attributes of the button.
+(function() {
+    const optionsEl = document.getElementById('webauthn-options');
+    const button = document.getElementById('webauthn-button');
+    if (!optionsEl || !button) { return; }
+    initiateWebAuthn(JSON.parse(optionsEl.textContent), button.dataset.formActionUrl,
+                     button.dataset.failureRedirectUrl || null);
+})();
\ No newline at end of file
@@ -0,0 +1,59 @@
+# tools/bench_keystroke_features.py
+#
+# Benchmark for the keystroke feature extraction: synthetic sessions are
+# encoded like the browser sends them and turned into feature matrices, both
+# in one vectorized batch and one session at a time, for growing batch sizes.
+#
+#   python -m tools.bench_keystroke_features
+#   python -m tools.bench_keystroke_features --sizes 1 1000 100000 --keys 43
+
+import argparse
+import time
+
+import numpy as np
+
+from modules import keystroke_features
+
+# Session-at-a-time extraction is only timed up to this many sessions.
+MAX_LOOP_SESSIONS = 10000
+
+
+def make_sessions(n: int, keys: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    delta = np.clip(rng.normal(130, 35, (n, keys)), 20, None).astype(np.int64)
+    delta[:, 0] = 0
+    dwell = np.clip(rng.normal(95, 20, (n, keys)), 20, None).astype(np.int64)
+    pairs = np.stack([delta, dwell], axis=2).reshape(n, -1)
+    return [','.join(map(str, row)) for row in pairs.tolist()]
+
+
+def best_of(repeats: int, fn) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keystroke feature extraction.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10000, 100000])
+    parser.add_argument('--keys', type=int, default=43, help="keystrokes per session")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'sessions':>9}  {'batch total':>12}  {'batch/session':>14}  {'loop/session':>13}")
+    for n in args.sizes:
+        sessions = make_sessions(n, args.keys)
+        batch = best_of(args.repeats, lambda: keystroke_features.extract_batch(sessions))
+        if n <= MAX_LOOP_SESSIONS:
+            loop = best_of(args.repeats, lambda: [keystroke_features.extract(s) for s in sessions])
+            loop_text = f"{loop / n * 1e6:10.1f} us"
+        else:
+            loop_text = f"{'-':>13}"
+        print(f"{n:>9}  {batch * 1e3:9.1f} ms  {batch / n * 1e6:11.1f} us  {loop_text}")
+
+
+if __name__ == '__main__':
+    main()
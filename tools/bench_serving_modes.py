@@ -0,0 +1,88 @@
+# tools/bench_serving_modes.py
+#
+# Compares concurrent login throughput of the two entry points: app.py on the
+# threaded WSGI server (sync) and asgi.py on Hypercorn (asgi). Both serve the
+# same pre-populated store (see tools/load_test.py), one after the other, and
+# are driven by the same simulated users, who only log in. For each mode and
+# concurrency level the script prints completed logins per second, the p50
+# and p99 latency over the login routes, the number of failed requests (5xx;
+# in asgi mode these include 503s from a full offload pool) and the number of
+# logins that ended without access.
+#
+#   python -m tools.bench_serving_modes
+#   python -m tools.bench_serving_modes --users 100000 --concurrency 16 64 256 --duration 20
+
+import argparse
+import json
+import os
+
+from tools import load_test
+
+MODES = ('sync', 'asgi')
+
+
+def summarize(level: dict) -> dict:
+    routes = [r for route, r in level['routes'].items() if route in load_test.LOGIN_ROUTES]
+    return {
+        'concurrency': level['concurrency'],
+        'logins_per_s': level['logins_per_s'],
+        # Worst route, so that one slow step is not averaged away.
+        'p50_ms': max((r['p50_ms'] for r in routes), default=0.0),
+        'p99_ms': max((r['p99_ms'] for r in routes), default=0.0),
+        'errors': sum(r['errors'] for r in level['routes'].values()),
+        'failed_flows': level['failed_flows'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare login throughput of the WSGI and ASGI entry points.")
+    parser.add_argument('--users', type=int, default=10000, help="store size")
+    parser.add_argument('--backend', choices=['sqlite', 'journal'], default='sqlite')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128],
+                        help="simulated users per level")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2,
+                        help="client processes the simulated users are spread over")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per level")
+    parser.add_argument('--click-success', type=float, default=0.7,
+                        help="fraction of logins whose clicks match (the rest go through step-up)")
+    parser.add_argument('--workdir', default=os.path.join('data', 'loadtest'),
+                        help="where the pre-populated store is kept between runs")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    overrides = load_test.prepare_store(args.workdir, args.backend, args.users)
+    results = {}
+    for mode in MODES:
+        print(f"{mode}: {args.users} users ({args.backend})")
+        server, port = load_test.start_server(overrides, mode)
+        try:
+            results[mode] = []
+            for concurrency in args.concurrency:
+                level = summarize(load_test.run_level(port, args.users, concurrency, args.processes,
+                                                      args.duration, 0.0, args.click_success))
+                print(f"  concurrency {concurrency}: {level['logins_per_s']} logins/s")
+                results[mode].append(level)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print()
+    print(f"{'concurrency':>11}  {'mode':<5}  {'logins/s':>9}  {'p50 ms':>8}  {'p99 ms':>8}  {'errors':>6}  {'failed':>6}")
+    for index, concurrency in enumerate(args.concurrency):
+        for mode in MODES:
+            r = results[mode][index]
+            print(f"{concurrency:>11}  {mode:<5}  {r['logins_per_s']:>9.1f}  {r['p50_ms']:>8.2f}  "
+                  f"{r['p99_ms']:>8.2f}  {r['errors']:>6}  {r['failed_flows']:>6}")
+        sync, asgi = results['sync'][index]['logins_per_s'], results['asgi'][index]['logins_per_s']
+        if sync:
+            print(f"{'':>11}  asgi/sync throughput: {asgi / sync:.2f}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'users': args.users, 'backend': args.backend, 'modes': results}, f, indent=2)
+        print(f"Results written to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# tools/build_assets.py
+#
+# Builds the fingerprinted static files served by modules/assets.py.
+#
+# Every file under static/ (except static/dist/ itself) is copied to
+# static/dist/ under a name with the first 12 hex digits of its SHA-256
+# (js/webauthn.js -> js/webauthn.1c9e0f3a5b7d.js). Text files (CSS, JS, SVG,
+# ...) also get a .gz and, with the optional `brotli` package installed, a .br
+# variant, each kept only if it is smaller. url(...) references in CSS are
+# rewritten to the hashed names first, so a stylesheet's hash changes when an
+# image it uses does. static/dist/manifest.json is replaced last, in one
+# step, so a running build never leaves a manifest pointing at missing files.
+#
+# Hashed files of earlier builds are kept, so that pages rendered before a
+# deploy can still load them; --prune removes those not in the new manifest.
+# The templates are also checked for inline <style> and <script> blocks, which
+# would be re-sent with every page instead of being cached: pages pass their
+# values to the static scripts in data-* attributes or JSON data blocks.
+#
+#   python -m tools.build_assets
+#   python -m tools.build_assets --prune --strict
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+import time
+
+from modules.assets import DIST_DIR, ENCODINGS, MANIFEST_NAME
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMPRESSIBLE = frozenset({'.css', '.js', '.json', '.svg', '.txt', '.html', '.xml', '.map', '.ico'})
+HASH_DIGITS = 12
+
+COMPRESSORS = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=11)
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+# Inline blocks: <style>, and <script> without src that is not a JSON data block.
+_INLINE_BLOCK = re.compile(
+    r'<(style)\b[^>]*>|<(script)\b(?![^>]*\bsrc=)(?![^>]*type="application/json")[^>]*>', re.I)
+
+
+def source_files(static_dir: str) -> list:
+    """Source names (POSIX, relative to static_dir) of every file outside dist/, CSS last."""
+    names = []
+    for directory, subdirs, files in os.walk(static_dir):
+        rel = os.path.relpath(directory, static_dir)
+        if rel == DIST_DIR or rel.startswith(DIST_DIR + os.sep):
+            subdirs[:] = []
+            continue
+        subdirs.sort()
+        for name in sorted(files):
+            names.append(posixpath.normpath(posixpath.join(rel.replace(os.sep, '/'), name)))
+    # Stylesheets refer to other files by name, so they are hashed after them.
+    return sorted(names, key=lambda n: n.endswith('.css'))
+
+
+def rewrite_css(css: bytes, name: str, hashed: dict) -> bytes:
+    """Points relative url(...) references of the stylesheet `name` at the hashed files."""
+    def replace(match):
+        quote, target = match.group(1), match.group(2)
+        if re.match(r'^([a-z]+:|/|#)', target, re.I):
+            return match.group(0)
+        path, _, suffix = target.partition('?')
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+        if resolved not in hashed:
+            return match.group(0)
+        new = posixpath.relpath(hashed[resolved], posixpath.dirname(name) or '.')
+        return f"url({quote}{new}{'?' + suffix if suffix else ''}{quote})"
+    return _CSS_URL.sub(replace, css.decode('utf-8')).encode('utf-8')
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_DIGITS]}{ext}"
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build(static_dir: str, min_size: int) -> dict:
+    """Writes the hashed files and their variants to static_dir/dist and returns the manifest entries."""
+    dist = os.path.join(static_dir, DIST_DIR)
+    files, hashed = {}, {}
+    for name in source_files(static_dir):
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = rewrite_css(data, name, hashed)
+        target = hashed_name(name, data)
+        hashed[name] = target
+        entry = {'path': target, 'size': len(data), 'encodings': []}
+        out = os.path.join(dist, target)
+        # A hashed name always has the same content, so existing files are kept as they are.
+        if not os.path.exists(out):
+            _write(out, data)
+        if posixpath.splitext(name)[1].lower() in COMPRESSIBLE and len(data) >= min_size:
+            for encoding, suffix in ENCODINGS:
+                if encoding not in COMPRESSORS:
+                    continue
+                if os.path.exists(out + suffix):
+                    compressed_size = os.path.getsize(out + suffix)
+                else:
+                    compressed = COMPRESSORS[encoding](data)
+                    compressed_size = len(compressed)
+                    if compressed_size >= len(data):
+                        continue
+                    _write(out + suffix, compressed)
+                entry['encodings'].append(encoding)
+                entry[f'{encoding}_size'] = compressed_size
+        files[name] = entry
+    return files
+
+
+def prune(dist: str, files: dict) -> int:
+    """Removes files of earlier builds that the new manifest does not name."""
+    keep = {MANIFEST_NAME}
+    for entry in files.values():
+        keep.add(entry['path'])
+        keep.update(entry['path'] + suffix for encoding, suffix in ENCODINGS if encoding in entry['encodings'])
+    removed = 0
+    for directory, _, names in os.walk(dist):
+        for name in names:
+            rel = os.path.relpath(os.path.join(directory, name), dist).replace(os.sep, '/')
+            if rel not in keep:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+    return removed
+
+
+def inline_blocks(templates_dir: str) -> list:
+    """(template, line, tag) of every inline <style> or <script> block in the templates."""
+    found = []
+    for name in sorted(os.listdir(templates_dir)):
+        with open(os.path.join(templates_dir, name), encoding='utf-8') as f:
+            text = f.read()
+        for match in _INLINE_BLOCK.finditer(text):
+            found.append((name, text.count('\n', 0, match.start()) + 1, match.group(1) or match.group(2)))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, pre-compressed static files.")
+    parser.add_argument('--static', default=os.path.join(ROOT, 'static'), help="static folder of the app")
+    parser.add_argument('--templates', default=os.path.join(ROOT, 'templates'), help="templates to check")
+    parser.add_argument('--min-size', type=int, default=256, help="smallest file (bytes) to compress")
+    parser.add_argument('--prune', action='store_true', help="remove hashed files of earlier builds")
+    parser.add_argument('--strict', action='store_true', help="fail if a template has an inline block")
+    args = parser.parse_args()
+
+    blocks = inline_blocks(args.templates)
+    for template, line, tag in blocks:
+        print(f"warning: inline <{tag}> in {template}:{line}; move it to a static file")
+    if blocks and args.strict:
+        sys.exit(1)
+
+    started = time.perf_counter()
+    files = build(args.static, args.min_size)
+    dist = os.path.join(args.static, DIST_DIR)
+    manifest = {'built': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'files': files}
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    print(f"{'file':<40}  {'bytes':>9}  {'gzip':>9}  {'br':>9}")
+    for name, entry in sorted(files.items()):
+        gz, br = entry.get('gzip_size', ''), entry.get('br_size', '')
+        print(f"{entry['path']:<40}  {entry['size']:>9}  {gz:>9}  {br:>9}")
+    if brotli is None:
+        print("brotli is not installed: no .br variants were written (pip install brotli).")
+    if args.prune:
+        print(f"Removed {prune(dist, files)} file(s) of earlier builds.")
+    print(f"Built {len(files)} file(s) into '{dist}' in {time.perf_counter() - started:.2f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# tools/check_model_parity.py
+#
+# Parity test between the scikit-learn One-Class SVM pickle and its NumPy export:
+# both are scored on the training data plus a dense grid (or random points
+# around the data when the model has several features), and the script exits
+# with status 1 if any decision value or prediction differs.
+#
+#   python models/train_model.py
+#   python -m tools.check_model_parity
+
+import argparse
+import json
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from modules.behavioral_analyzer import (MODEL_METADATA_PATH, MODEL_NPZ_PATH, MODEL_PATH,
+                                         NumpyOneClassSVM, extract_features_batch)
+
+DATA_PATH = 'data/sample_sessions.csv'
+
+
+def check(pkl_path: str, npz_path: str, data_path: str, atol: float) -> bool:
+    reference = joblib.load(pkl_path)
+    engine = NumpyOneClassSVM.load(npz_path)
+
+    with open(MODEL_METADATA_PATH, encoding='utf-8') as f:
+        features = tuple(json.load(f).get('features', ['typing_duration']))
+    train = extract_features_batch(pd.read_csv(data_path).to_dict('records'), features)
+    train = train[~np.isnan(train).any(axis=1)]
+    if len(features) == 1:
+        extra = np.linspace(0.0, 60.0, 100001).reshape(-1, 1)
+    else:
+        # Random points spread around the training data.
+        rng = np.random.default_rng(0)
+        extra = train[rng.integers(len(train), size=100000)] * rng.uniform(0.5, 1.5, (100000, len(features)))
+    X = np.vstack([train, extra])
+
+    expected = reference.decision_function(X)
+    actual = engine.decision_function(X)
+    max_error = float(np.max(np.abs(expected - actual)))
+    mismatched = int(np.count_nonzero(reference.predict(X) != engine.predict(X)))
+
+    print(f"Scored {len(X)} rows: max |sklearn - numpy| = {max_error:.3e}, "
+          f"{mismatched} prediction(s) differ.")
+    return max_error <= atol and mismatched == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the NumPy model export with the sklearn pickle.")
+    parser.add_argument('--pkl', default=MODEL_PATH)
+    parser.add_argument('--npz', default=MODEL_NPZ_PATH)
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--atol', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    if not check(args.pkl, args.npz, args.data, args.atol):
+        print("FAIL: the NumPy engine does not match scikit-learn.")
+        sys.exit(1)
+    print("OK: the NumPy engine matches scikit-learn.")
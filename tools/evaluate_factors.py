@@ -0,0 +1,373 @@
+# tools/evaluate_factors.py
+#
+# Offline accuracy and latency evaluation of every authentication factor.
+# Labeled genuine and impostor attempts from a dataset file are replayed through
+# the real verification functions (no web server, no user store), and for each
+# factor and for the step-up policy (passkey AND typing speed) the script
+# reports:
+#
+#   FAR  impostor attempts accepted        FRR  genuine attempts rejected
+#   EER  error rate where FAR = FRR when the factor's score threshold is swept
+#
+# plus per-call latency percentiles and throughput. Results can be written as
+# JSON and compared against an earlier run to catch regressions.
+#
+# The dataset is JSON lines: user profiles, then attempts against them.
+#
+#   {"type": "user", "email": "a@b.c", "click_profile": [{"x": 1, "y": 2}, ...],
+#    "secret_passkey": "moon-123", "typing_samples": [5.1, 5.4, 4.9, 5.2],
+#    "typing_stats": {...}, "behavior_model": {...}}
+#   {"type": "attempt", "email": "a@b.c", "genuine": true, "clicks": [...],
+#    "typing_duration": 5.3, "keystrokes": "0,95,...", "passkey": "moon-123"}
+#
+# A factor is evaluated on the attempts that carry its input.
+#
+#   python -m tools.evaluate_factors --make-dataset eval.jsonl --users 2000
+#   python -m tools.evaluate_factors eval.jsonl --output results.json
+#   python -m tools.evaluate_factors eval.jsonl --compare results.json
+
+import argparse
+import json
+import math
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config import Config
+from modules import auth_service, behavioral_analyzer, typing_analyzer, user_models
+from modules.user_record import UserRecord
+
+# Default regression limits for --compare.
+RATE_TOLERANCE = 0.01        # absolute increase of FAR, FRR or EER
+LATENCY_TOLERANCE = 0.5      # relative increase of p95 latency
+
+
+# Keys in the typing challenge ("the quick brown fox jumps over the lazy dog").
+CHALLENGE_KEYS = 43
+
+
+# --- Dataset ---
+
+def load_dataset(path: str) -> tuple[dict, list]:
+    users, attempts = {}, []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.pop('type', 'attempt')
+            if kind == 'user':
+                users[record['email']] = UserRecord.from_row(record)
+            elif kind == 'attempt':
+                attempts.append(record)
+            else:
+                raise ValueError(f"{path}:{line_number}: unknown record type {kind!r}")
+    return users, attempts
+
+
+def _keystrokes(rng, duration: float, dwell: float) -> str:
+    """Timing string (see modules/keystroke_features.py) of the challenge typed in about `duration` seconds."""
+    interval = duration / (CHALLENGE_KEYS - 1)
+    values = []
+    for key in range(CHALLENGE_KEYS):
+        delta = 0.0 if key == 0 else max(rng.gauss(interval, interval * 0.25), 0.01)
+        values += [round(delta * 1000), round(max(rng.gauss(dwell, dwell * 0.15), 0.02) * 1000)]
+    return ','.join(map(str, values))
+
+
+def make_dataset(path: str, n_users: int, attempts_per_user: int, seed: int = 0) -> None:
+    """Writes a synthetic dataset: one genuine and one impostor attempt per round per user."""
+    rng = random.Random(seed)
+    words = ["moon", "star", "nova", "flare", "comet", "ocean", "river", "cloud"]
+    n_points = Config.CLICK_POINTS
+
+    def random_clicks():
+        return [{"x": round(rng.uniform(0, 600), 1), "y": round(rng.uniform(0, 400), 1)} for _ in range(n_points)]
+
+    def random_passkey():
+        return f"{rng.choice(words)}-{''.join(rng.choices(string.digits, k=3))}"
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for index in range(n_users):
+            email = f"user{index}@eval.test"
+            clicks = random_clicks()
+            passkey = random_passkey()
+            mean = rng.uniform(4.0, 12.0)
+            spread = mean * rng.uniform(0.04, 0.12)
+            dwell = rng.uniform(0.07, 0.14)
+            samples = [round(rng.gauss(mean, spread), 3) for _ in range(4)]
+            features = behavioral_analyzer.extract_features_batch(
+                [{'typing_duration': sample, 'keystrokes': _keystrokes(rng, sample, dwell)} for sample in samples],
+                behavioral_analyzer.USER_FEATURES)
+            behavior = user_models.RunningStats(n_features=features.shape[1])
+            for row in features.tolist():
+                behavior.update(row, decay=user_models.DECAY)
+            f.write(json.dumps({
+                "type": "user", "email": email, "click_profile": clicks, "secret_passkey": passkey,
+                "typing_samples": samples, "typing_average": sum(samples) / len(samples),
+                "typing_stats": typing_analyzer.build_baseline(samples).to_dict(),
+                "behavior_model": behavior.to_dict(),
+            }) + "\n")
+            for _ in range(attempts_per_user):
+                duration = round(rng.gauss(mean, spread), 3)
+                f.write(json.dumps({
+                    "type": "attempt", "email": email, "genuine": True,
+                    "clicks": [{"x": p["x"] + rng.gauss(0, 12), "y": p["y"] + rng.gauss(0, 12)} for p in clicks],
+                    "typing_duration": duration,
+                    "keystrokes": _keystrokes(rng, duration, dwell),
+                    # Now and then a genuine user mistypes the passkey.
+                    "passkey": passkey if rng.random() > 0.02 else random_passkey(),
+                }) + "\n")
+                other_mean = rng.uniform(4.0, 12.0)
+                duration = round(rng.gauss(other_mean, other_mean * 0.08), 3)
+                f.write(json.dumps({
+                    "type": "attempt", "email": email, "genuine": False,
+                    "clicks": random_clicks(),
+                    "typing_duration": duration,
+                    "keystrokes": _keystrokes(rng, duration, rng.uniform(0.07, 0.14)),
+                    "passkey": random_passkey(),
+                }) + "\n")
+
+
+# --- Factors ---
+
+def _clicks_score(email, attempt, user):
+    result = auth_service.check_clicks(email, attempt['clicks'], user=user, tolerance=Config.CLICK_TOLERANCE_RADIUS)
+    return -float(result.distances.max()) if result is not None else -math.inf
+
+
+def _behavior_data(attempt):
+    return {key: attempt[key] for key in ('typing_duration', 'keystrokes') if key in attempt}
+
+
+# name -> (attempt key it needs, decision function, score function). Higher
+# scores mean "more genuine"; they are only used to sweep thresholds for the EER.
+FACTORS = {
+    'clicks': (
+        'clicks',
+        lambda email, attempt, user: auth_service.verify_clicks(
+            email, attempt['clicks'], user=user, tolerance=Config.CLICK_TOLERANCE_RADIUS),
+        _clicks_score,
+    ),
+    'typing': (
+        'typing_duration',
+        lambda email, attempt, user: typing_analyzer.verify_typing_speed(email, attempt['typing_duration'], user=user),
+        lambda email, attempt, user: typing_analyzer.typing_margin(email, attempt['typing_duration'], user=user),
+    ),
+    'passkey': (
+        'passkey',
+        lambda email, attempt, user: auth_service.verify_passkey(email, attempt['passkey'], user=user),
+        None,  # binary: the decision itself is the score
+    ),
+    'behavior': (
+        'typing_duration',
+        lambda email, attempt, user: behavioral_analyzer.analyze_behavior(_behavior_data(attempt), user=user) == "Grant",
+        lambda email, attempt, user: behavioral_analyzer.behavior_score(_behavior_data(attempt), user=user),
+    ),
+}
+
+# Policies combine factor decisions of the same attempt.
+POLICIES = {
+    'step_up': ('passkey', 'typing'),
+}
+
+
+def run_factor(name: str, users: dict, attempts: list) -> dict:
+    key, decide, score = FACTORS[name]
+    rows = [(a, users.get(a.get('email'))) for a in attempts if key in a]
+    decisions = np.zeros(len(rows), dtype=bool)
+    latencies = np.zeros(len(rows))
+
+    started = time.perf_counter()
+    for i, (attempt, user) in enumerate(rows):
+        t0 = time.perf_counter()
+        decisions[i] = bool(decide(attempt.get('email'), attempt, user)) if user is not None else False
+        latencies[i] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+
+    if score is None:
+        scores = decisions.astype(np.float64)
+    else:
+        scores = np.array([
+            score(attempt.get('email'), attempt, user) if user is not None else None
+            for attempt, user in rows
+        ], dtype=np.float64)
+    scores[np.isnan(scores)] = -np.inf
+
+    genuine = np.array([bool(a.get('genuine', True)) for a, _ in rows], dtype=bool)
+    result = accuracy(decisions, genuine, scores)
+    result['latency_us'] = latency_summary(latencies)
+    result['throughput_per_s'] = round(len(rows) / elapsed, 1) if elapsed > 0 else None
+    result['_decisions'] = {id(a): d for (a, _), d in zip(rows, decisions.tolist())}
+    result['_latencies'] = {id(a): t for (a, _), t in zip(rows, latencies.tolist())}
+    return result
+
+
+def run_policy(factors: tuple, factor_results: dict, attempts: list) -> dict:
+    decisions, genuine, latencies = [], [], []
+    for attempt in attempts:
+        ids = [factor_results[name]['_decisions'].get(id(attempt)) for name in factors]
+        if None in ids:
+            continue
+        decisions.append(all(ids))
+        genuine.append(bool(attempt.get('genuine', True)))
+        latencies.append(sum(factor_results[name]['_latencies'][id(attempt)] for name in factors))
+    decisions = np.array(decisions, dtype=bool)
+    result = accuracy(decisions, np.array(genuine, dtype=bool), None)
+    result['factors'] = list(factors)
+    result['latency_us'] = latency_summary(np.array(latencies))
+    total = float(np.sum(latencies))
+    result['throughput_per_s'] = round(len(latencies) / total, 1) if total > 0 else None
+    return result
+
+
+# --- Metrics ---
+
+def accuracy(decisions: np.ndarray, genuine: np.ndarray, scores: np.ndarray | None) -> dict:
+    n_genuine, n_impostor = int(genuine.sum()), int((~genuine).sum())
+    result = {
+        'genuine': n_genuine,
+        'impostor': n_impostor,
+        'far': _rate(decisions[~genuine].sum(), n_impostor),
+        'frr': _rate((~decisions[genuine]).sum(), n_genuine),
+        'eer': None,
+        'eer_threshold': None,
+    }
+    if scores is not None:
+        eer, threshold = equal_error_rate(scores[genuine], scores[~genuine])
+        result['eer'] = eer
+        result['eer_threshold'] = threshold
+    return result
+
+
+def equal_error_rate(genuine: np.ndarray, impostor: np.ndarray) -> tuple[float | None, float | None]:
+    """
+    Sweeps an "accept if score >= t" threshold over every observed score and
+    returns (EER, t) at the point where FAR and FRR are closest.
+    """
+    if len(genuine) == 0 or len(impostor) == 0:
+        return None, None
+    thresholds = np.append(np.unique(np.concatenate([genuine, impostor])), np.inf)
+    genuine, impostor = np.sort(genuine), np.sort(impostor)
+    frr = np.searchsorted(genuine, thresholds, side='left') / len(genuine)
+    far = 1.0 - np.searchsorted(impostor, thresholds, side='left') / len(impostor)
+    best = int(np.argmin(np.abs(far - frr)))
+    threshold = float(thresholds[best])
+    return round(float((far[best] + frr[best]) / 2), 6), (round(threshold, 6) if math.isfinite(threshold) else None)
+
+
+def latency_summary(seconds: np.ndarray) -> dict:
+    if len(seconds) == 0:
+        return {}
+    micros = seconds * 1e6
+    p50, p95, p99 = np.percentile(micros, [50, 95, 99])
+    return {
+        'mean': round(float(micros.mean()), 2),
+        'p50': round(float(p50), 2),
+        'p95': round(float(p95), 2),
+        'p99': round(float(p99), 2),
+        'max': round(float(micros.max()), 2),
+    }
+
+
+def _rate(count, total) -> float | None:
+    return round(float(count) / total, 6) if total else None
+
+
+# --- Reporting ---
+
+def evaluate(dataset: str) -> dict:
+    users, attempts = load_dataset(dataset)
+    factor_results = {name: run_factor(name, users, attempts) for name in FACTORS}
+    policy_results = {name: run_policy(factors, factor_results, attempts) for name, factors in POLICIES.items()}
+    for result in factor_results.values():
+        del result['_decisions'], result['_latencies']
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'dataset': os.path.abspath(dataset),
+        'users': len(users),
+        'attempts': len(attempts),
+        'model': behavioral_analyzer.active_model_info(),
+        'settings': {
+            'click_tolerance_radius': Config.CLICK_TOLERANCE_RADIUS,
+            'typing_tolerance_stds': typing_analyzer.TOLERANCE_STDS,
+            'typing_min_tolerance_seconds': typing_analyzer.MIN_TOLERANCE_SECONDS,
+            'behavior_z_threshold': user_models.Z_THRESHOLD,
+        },
+        'factors': factor_results,
+        'policies': policy_results,
+    }
+
+
+def print_report(results: dict) -> None:
+    print(f"{results['attempts']} attempts against {results['users']} users")
+    print(f"{'':<10} {'genuine':>8} {'impostor':>8} {'FAR':>8} {'FRR':>8} {'EER':>8} "
+          f"{'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'calls/s':>10}")
+    rows = list(results['factors'].items()) + list(results['policies'].items())
+    for name, r in rows:
+        latency = r['latency_us']
+        print(f"{name:<10} {r['genuine']:>8} {r['impostor']:>8} {_pct(r['far']):>8} {_pct(r['frr']):>8} "
+              f"{_pct(r['eer']):>8} {latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} "
+              f"{latency.get('p99', 0):>9.1f} {r['throughput_per_s'] or 0:>10.0f}")
+
+
+def _pct(value) -> str:
+    return '-' if value is None else f"{value:.2%}"
+
+
+def compare(results: dict, baseline: dict, rate_tolerance: float, latency_tolerance: float) -> list:
+    """Returns a list of regressions of `results` against an earlier run."""
+    regressions = []
+    for section in ('factors', 'policies'):
+        for name, current in results[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if not previous:
+                continue
+            for metric in ('far', 'frr', 'eer'):
+                old, new = previous.get(metric), current.get(metric)
+                if old is not None and new is not None and new > old + rate_tolerance:
+                    regressions.append(f"{name}: {metric.upper()} {old:.2%} -> {new:.2%}")
+            old, new = previous.get('latency_us', {}).get('p95'), current['latency_us'].get('p95')
+            if old and new and new > old * (1 + latency_tolerance):
+                regressions.append(f"{name}: p95 latency {old:.1f}us -> {new:.1f}us")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay labeled attempts through every authentication factor.")
+    parser.add_argument('dataset', nargs='?', help="JSONL dataset of users and attempts")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', metavar='RESULTS', help="fail on regressions against an earlier JSON result")
+    parser.add_argument('--rate-tolerance', type=float, default=RATE_TOLERANCE)
+    parser.add_argument('--latency-tolerance', type=float, default=LATENCY_TOLERANCE)
+    parser.add_argument('--make-dataset', metavar='PATH', help="write a synthetic dataset and exit")
+    parser.add_argument('--users', type=int, default=1000, help="--make-dataset only")
+    parser.add_argument('--attempts', type=int, default=5, help="--make-dataset only: rounds per user")
+    args = parser.parse_args()
+
+    if args.make_dataset:
+        make_dataset(args.make_dataset, args.users, args.attempts)
+        print(f"Wrote a synthetic dataset of {args.users} users to '{args.make_dataset}'.")
+        sys.exit(0)
+    if not args.dataset:
+        parser.error("give a dataset file (or --make-dataset PATH)")
+
+    results = evaluate(args.dataset)
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to '{args.output}'.")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.rate_tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"OK: no regressions against '{args.compare}'.")
@@ -0,0 +1,481 @@
+# tools/load_test.py
+#
+# End-to-end HTTP load test of the registration and login flows of app.py.
+#
+# For each store size the script writes a user store pre-populated with that
+# many users, starts the real Flask app on a local port in a separate process,
+# and drives it with concurrent simulated users (client processes x threads,
+# each with its own cookie session). The simulated users walk the same routes
+# as a browser:
+#
+#   register  /register -> /register/fingerprint -> /register/verify_fingerprint
+#             -> /register/save_clicks -> /register/save_typing_baseline
+#   login     /login -> /login/verify_clicks [-> /login/step_up]
+#
+# WebAuthn is answered by a software authenticator (SoftAuthenticator) that
+# returns signed credentials shaped like a browser's. Every concurrency level runs for a fixed
+# time. The script reports p50/p95/p99 latency per route and completed logins
+# per second. The highest rate with no errors and login p99 within --slo-ms is
+# reported as the maximum sustainable login rate.
+#
+#   python -m tools.load_test --users 1000 100000 1000000
+#   python -m tools.load_test --users 100000 --concurrency 8 32 128 --duration 20 --output load.json
+#   python -m tools.load_test --backend journal --users 1000 100000
+#   python -m tools.load_test --mode asgi --users 100000
+#
+# --mode asgi serves asgi.py on Hypercorn instead of app.py on the threaded
+# WSGI server; tools/bench_serving_modes.py compares the two.
+
+import argparse
+import base64
+import csv
+import hashlib
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+import cbor2
+import numpy as np
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from modules import user_store
+
+# Every pre-populated user shares these factors, so any of them can log in.
+CLICK_PROFILE = [{"x": 120.0, "y": 80.0}, {"x": 300.0, "y": 210.0}, {"x": 480.0, "y": 330.0}]
+TYPING_SAMPLES = [5.0, 5.2, 4.9, 5.1]
+PASSKEY = "moon-123"
+
+# Login routes whose p99 decides whether a level is sustainable.
+LOGIN_ROUTES = ('POST /login', 'POST /login/verify_clicks', 'POST /login/step_up')
+
+_OPTIONS_PATTERN = re.compile(r'<script id="webauthn-options" type="application/json">(.*?)</script>', re.S)
+
+
+# --- User Store ---
+
+def prepare_store(workdir: str, backend: str, n_users: int) -> dict:
+    """
+    Writes (or reuses) a store holding n_users users and returns the config
+    overrides that point the app at it.
+    """
+    base = os.path.join(workdir, f"{backend}-{n_users}")
+    csv_path = base + '.csv'
+    if not os.path.exists(csv_path):
+        started = time.perf_counter()
+        stats = json.dumps({"weight": 4.0, "mean": [5.05], "m2": [0.05]})
+        with open(csv_path + '.tmp', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(user_store.FIELDS)
+            fixed = {
+                'click_profile': json.dumps(CLICK_PROFILE),
+                'secret_passkey': PASSKEY,
+                'typing_samples': json.dumps(TYPING_SAMPLES),
+                'typing_average': sum(TYPING_SAMPLES) / len(TYPING_SAMPLES),
+                'typing_stats': stats,
+            }
+            for index in range(n_users):
+                writer.writerow([_email(index) if field == 'email' else fixed.get(field, '')
+                                 for field in user_store.FIELDS])
+        os.replace(csv_path + '.tmp', csv_path)
+        print(f"  wrote {n_users} users to '{csv_path}' in {time.perf_counter() - started:.1f}s")
+
+    sessions = {
+        'SESSION_BACKEND': 'sqlite', 'SESSION_STORE_PATH': base + '-sessions.db',
+        # Every simulated user comes from 127.0.0.1, and each user logs in far
+        # more often than a person would, so the limits are lifted (the checks
+        # themselves still run).
+        'RATE_LIMIT_BACKEND': 'sqlite', 'RATE_LIMIT_PATH': base + '-ratelimit.db',
+        'LOGIN_IP_BURST': 10 ** 9, 'LOGIN_IP_PER_MINUTE': 10 ** 9,
+        'LOGIN_EMAIL_BURST': 10 ** 9, 'LOGIN_EMAIL_PER_MINUTE': 10 ** 9,
+    }
+    if backend == 'journal':
+        return {'USER_STORE_BACKEND': 'journal', 'USER_DB_PATH': csv_path, **sessions}
+
+    db_path = base + '.db'
+    store = user_store.SQLiteUserStore(db_path)
+    if not store.get_meta('csv_imported'):
+        started = time.perf_counter()
+        store.import_csv(csv_path, batch_size=50000)
+        store.set_meta('csv_imported', os.path.abspath(csv_path))
+        print(f"  imported {store.count()} users into '{db_path}' in {time.perf_counter() - started:.1f}s")
+    return {'USER_STORE_BACKEND': 'sqlite', 'USER_STORE_PATH': db_path, 'USER_DB_PATH': csv_path, **sessions}
+
+
+def _email(index: int) -> str:
+    return f"load{index}@load.test"
+
+
+# --- Server ---
+
+def serve(port: int, overrides: dict, mode: str = 'sync'):
+    """
+    Runs app.py on a threaded HTTP/1.1 server (keep-alive), or asgi.py on
+    Hypercorn with mode 'asgi', until killed.
+    """
+    from app import app
+    from modules import rate_limit, session_store
+    app.config.update(overrides)
+    session_store.init_app(app)
+    rate_limit.init_app(app)
+
+    if mode == 'asgi':
+        import asyncio
+
+        from hypercorn.asyncio import serve as serve_asgi
+        from hypercorn.config import Config as HypercornConfig
+
+        import asgi
+        asgi.app.config.update(overrides)
+        config = HypercornConfig()
+        config.bind = [f'127.0.0.1:{port}']
+        config.accesslog = None
+        config.loglevel = 'WARNING'
+        asyncio.run(serve_asgi(asgi.app, config))
+        return
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_server(overrides: dict, mode: str = 'sync') -> tuple[subprocess.Popen, int]:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'tools.load_test', '--serve', str(port), '--overrides', json.dumps(overrides),
+         '--mode', mode],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        # Per-login INFO events would otherwise flood the report.
+        env={**os.environ, 'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING')},
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return process, port
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("the app server exited during start-up")
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("the app server did not start within 60s")
+
+
+# --- Simulated Users ---
+
+class SoftAuthenticator:
+    """
+    A software WebAuthn authenticator: it creates a P-256 key per credential
+    and answers ceremonies with real "none" attestations and signed
+    assertions, shaped like a browser's PublicKeyCredential.toJSON().
+    """
+
+    def __init__(self, origin: str = 'http://localhost:8501', rp_id: str = 'localhost'):
+        self.origin = origin
+        self.rp_id_hash = hashlib.sha256(rp_id.encode()).digest()
+        self.keys = {}
+        self.counters = {}
+
+    def create(self, options: dict) -> dict:
+        raw_id = os.urandom(16)
+        key = ec.generate_private_key(ec.SECP256R1())
+        self.keys[raw_id] = key
+        self.counters[raw_id] = 0
+        numbers = key.public_key().public_numbers()
+        cose_key = cbor2.dumps({1: 2, 3: -7, -1: 1, -2: numbers.x.to_bytes(32, 'big'), -3: numbers.y.to_bytes(32, 'big')})
+        # Flags: user present, user verified, attested credential data included.
+        auth_data = (self.rp_id_hash + bytes([0x45]) + struct.pack('>I', 0) + bytes(16)
+                     + struct.pack('>H', len(raw_id)) + raw_id + cose_key)
+        attestation = cbor2.dumps({'fmt': 'none', 'attStmt': {}, 'authData': auth_data})
+        credential = self._credential(raw_id, 'webauthn.create', options['challenge'])
+        credential['response'].update({'attestationObject': _b64url(attestation), 'transports': ['internal']})
+        return credential
+
+    def get(self, options: dict) -> dict:
+        credential_id = options['allowCredentials'][0]['id']
+        raw_id = base64.urlsafe_b64decode(credential_id + '=' * (-len(credential_id) % 4))
+        self.counters[raw_id] += 1
+        auth_data = self.rp_id_hash + bytes([0x05]) + struct.pack('>I', self.counters[raw_id])
+        credential = self._credential(raw_id, 'webauthn.get', options['challenge'])
+        client_data = base64.urlsafe_b64decode(credential['response']['clientDataJSON'] + '==')
+        signature = self.keys[raw_id].sign(auth_data + hashlib.sha256(client_data).digest(), ec.ECDSA(hashes.SHA256()))
+        credential['response'].update({
+            'authenticatorData': _b64url(auth_data),
+            'signature': _b64url(signature),
+            'userHandle': None,
+        })
+        return credential
+
+    def _credential(self, raw_id: bytes, kind: str, challenge: str) -> dict:
+        client_data = json.dumps({'type': kind, 'challenge': challenge, 'origin': self.origin})
+        return {
+            'id': _b64url(raw_id),
+            'rawId': _b64url(raw_id),
+            'type': 'public-key',
+            'authenticatorAttachment': 'platform',
+            'clientExtensionResults': {},
+            'response': {'clientDataJSON': _b64url(client_data.encode())},
+        }
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+class Client:
+    """One simulated browser: a keep-alive connection plus a cookie jar."""
+
+    def __init__(self, port: int, record):
+        self.port = port
+        self.record = record
+        self.cookies = {}
+        self.conn = None
+
+    def request(self, method: str, path: str, route: str, form: dict | None = None, body=None):
+        headers = {}
+        data = None
+        if form is not None:
+            data = urlencode(form, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            started = time.perf_counter()
+            try:
+                self.conn.request(method, path, body=data, headers=headers)
+                response = self.conn.getresponse()
+                payload = response.read()
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection; reconnect once.
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    self.record(route, time.perf_counter() - started, False)
+                    raise
+                continue
+            self.record(route, time.perf_counter() - started, response.status < 500)
+            for header in response.headers.get_all('Set-Cookie') or ():
+                name, _, rest = header.partition('=')
+                self.cookies[name.strip()] = rest.split(';', 1)[0]
+            return response.status, response.getheader('Location') or '', payload
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def register(client: Client, authenticator: SoftAuthenticator) -> bool:
+    email = f"reg-{uuid.uuid4().hex}@load.test"
+    client.request('POST', '/register', 'POST /register', form={'email': email})
+    _, _, page = client.request('GET', '/register/fingerprint', 'GET /register/fingerprint')
+    match = _OPTIONS_PATTERN.search(page.decode('utf-8'))
+    if not match:
+        return False
+    credential = authenticator.create(json.loads(match.group(1)))
+    client.request('POST', '/register/verify_fingerprint', 'POST /register/verify_fingerprint', body=credential)
+    client.request('POST', '/register/save_clicks', 'POST /register/save_clicks', body={'clicks': CLICK_PROFILE})
+    status, location, _ = client.request(
+        'POST', '/register/save_typing_baseline', 'POST /register/save_typing_baseline',
+        form={'durations': [str(d) for d in TYPING_SAMPLES]})
+    return status == 302 and location.endswith('/register/complete')
+
+
+def login(client: Client, n_users: int, rng: random.Random, click_success: float) -> bool:
+    client.cookies.clear()
+    email = _email(rng.randrange(n_users))
+    status, location, _ = client.request('POST', '/login', 'POST /login', form={'email': email})
+    if status != 302 or 'fingerprint' not in location:
+        return False
+    # Pre-populated users have no fingerprint, so the browser would be sent on to the clicks.
+    if rng.random() < click_success:
+        clicks = [{"x": p["x"] + rng.uniform(-10, 10), "y": p["y"] + rng.uniform(-10, 10)} for p in CLICK_PROFILE]
+    else:
+        clicks = [{"x": p["x"] + 200, "y": p["y"]} for p in CLICK_PROFILE]
+    _, _, payload = client.request('POST', '/login/verify_clicks', 'POST /login/verify_clicks', body={'clicks': clicks})
+    if json.loads(payload).get('success'):
+        return True
+    status, location, _ = client.request('POST', '/login/step_up', 'POST /login/step_up', form={
+        'passkey': PASSKEY, 'typing_duration': f"{rng.uniform(4.6, 5.4):.3f}",
+    })
+    return status == 302 and location.endswith('/dashboard')
+
+
+def _client_process(port, n_users, threads, duration, register_ratio, click_success, seed, results):
+    latencies, errors = {}, {}
+    counts = {'logins': 0, 'registrations': 0, 'failed_flows': 0}
+    lock = threading.Lock()
+
+    def record(route, seconds, ok):
+        with lock:
+            latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                errors[route] = errors.get(route, 0) + 1
+
+    def run(thread_seed):
+        rng = random.Random(thread_seed)
+        client = Client(port, record)
+        authenticator = SoftAuthenticator()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            try:
+                if rng.random() < register_ratio:
+                    client.cookies.clear()
+                    ok, key = register(client, authenticator), 'registrations'
+                else:
+                    ok, key = login(client, n_users, rng, click_success), 'logins'
+            except (http.client.HTTPException, OSError, ValueError):
+                ok = False
+            with lock:
+                counts[key if ok else 'failed_flows'] += 1
+        client.close()
+
+    workers = [threading.Thread(target=run, args=(seed * 1000 + t,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((latencies, errors, counts))
+
+
+def run_level(port: int, n_users: int, concurrency: int, processes: int, duration: float,
+              register_ratio: float, click_success: float) -> dict:
+    """Runs `concurrency` simulated users for `duration` seconds and summarizes the run."""
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    processes = max(1, min(processes, concurrency))
+    per_process = [concurrency // processes + (1 if i < concurrency % processes else 0) for i in range(processes)]
+    workers = [
+        ctx.Process(target=_client_process,
+                    args=(port, n_users, threads, duration, register_ratio, click_success, i, results))
+        for i, threads in enumerate(per_process)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    collected = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies, errors = {}, {}
+    counts = {'logins': 0, 'registrations': 0, 'failed_flows': 0}
+    for route_latencies, route_errors, process_counts in collected:
+        for route, values in route_latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, n in route_errors.items():
+            errors[route] = errors.get(route, 0) + n
+        for key, n in process_counts.items():
+            counts[key] += n
+
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        p50, p95, p99 = np.percentile(np.array(values) * 1e3, [50, 95, 99])
+        routes[route] = {
+            'requests': len(values), 'errors': errors.get(route, 0),
+            'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2), 'p99_ms': round(float(p99), 2),
+        }
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'logins_per_s': round(counts['logins'] / duration, 1),
+        'registrations_per_s': round(counts['registrations'] / duration, 1),
+        'failed_flows': counts['failed_flows'],
+        'routes': routes,
+    }
+
+
+def sustainable(levels: list, slo_ms: float) -> float:
+    """Highest login rate of a level without errors whose login routes all kept p99 within the SLO."""
+    best = 0.0
+    for level in levels:
+        routes = level['routes']
+        if level['failed_flows'] or any(r['errors'] for r in routes.values()):
+            continue
+        if any(routes[r]['p99_ms'] > slo_ms for r in LOGIN_ROUTES if r in routes):
+            continue
+        best = max(best, level['logins_per_s'])
+    return best
+
+
+def print_level(level: dict):
+    print(f"  concurrency {level['concurrency']}: {level['logins_per_s']} logins/s, "
+          f"{level['registrations_per_s']} registrations/s, {level['failed_flows']} failed flow(s)")
+    for route, r in level['routes'].items():
+        print(f"    {route:<38} {r['requests']:>7} req  p50 {r['p50_ms']:>8.2f}  p95 {r['p95_ms']:>8.2f}  "
+              f"p99 {r['p99_ms']:>8.2f} ms  {r['errors']} error(s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HTTP load test of the registration and login flows.")
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help="store sizes to test")
+    parser.add_argument('--backend', choices=['sqlite', 'journal'], default='sqlite')
+    parser.add_argument('--mode', choices=['sync', 'asgi'], default='sync',
+                        help="serve app.py (WSGI) or asgi.py (ASGI on Hypercorn)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 64],
+                        help="simulated users per level")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2,
+                        help="client processes the simulated users are spread over")
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds per level")
+    parser.add_argument('--register-ratio', type=float, default=0.1,
+                        help="fraction of flows that register a new user instead of logging in")
+    parser.add_argument('--click-success', type=float, default=0.7,
+                        help="fraction of logins whose clicks match (the rest go through step-up)")
+    parser.add_argument('--slo-ms', type=float, default=250.0, help="p99 limit for the login routes")
+    parser.add_argument('--workdir', default=os.path.join('data', 'loadtest'),
+                        help="where the pre-populated stores are kept between runs")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--overrides', default='{}', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, json.loads(args.overrides), args.mode)
+        sys.exit(0)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {'backend': args.backend, 'mode': args.mode, 'slo_ms': args.slo_ms, 'stores': []}
+    for n_users in args.users:
+        print(f"Store with {n_users} users ({args.backend}, {args.mode}):")
+        overrides = prepare_store(args.workdir, args.backend, n_users)
+        server, port = start_server(overrides, args.mode)
+        try:
+            levels = []
+            for concurrency in args.concurrency:
+                level = run_level(port, n_users, concurrency, args.processes, args.duration,
+                                  args.register_ratio, args.click_success)
+                print_level(level)
+                levels.append(level)
+        finally:
+            server.terminate()
+            server.wait()
+        best = sustainable(levels, args.slo_ms)
+        print(f"  max sustainable: {best} logins/s (p99 <= {args.slo_ms:g} ms, no errors)")
+        report['stores'].append({'users': n_users, 'max_sustainable_logins_per_s': best, 'levels': levels})
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to '{args.output}'.")
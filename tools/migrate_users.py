@@ -0,0 +1,165 @@
+# tools/migrate_users.py
+#
+# Copies users between the formats handled by modules/user_transfer.py:
+# users.csv (csv), app2.py's users.json or a user_db dump (json), JSON lines
+# (jsonl), the SQLite user store (sqlite) and the journal backend's snapshot
+# (journal). Formats are guessed from the file extensions (.csv, .json,
+# .jsonl/.ndjson, .db/.sqlite); the journal backend has to be named with
+# --from/--to since its snapshot is a .csv file.
+#
+# Records are streamed: the source is read one record at a time (users.json
+# included) and written --batch-size records at a time, so millions of users
+# are copied in a fixed amount of memory. Every record is normalized to the
+# current store schema on the way; records that fail validation are skipped,
+# counted by reason and, with --errors, listed in a JSON-lines file. Progress
+# goes to stderr; the summary reports throughput and peak memory.
+#
+# File destinations are written to a temporary file and renamed into place
+# at the end, and are not overwritten without --overwrite. An SQLite
+# destination is merged into: users it already has are left as they are.
+# File destinations do not look for duplicate emails in the source.
+#
+#   python -m tools.migrate_users data/users.json data/users.db
+#   python -m tools.migrate_users data/users.db export.jsonl --errors invalid.jsonl
+#   python -m tools.migrate_users data/users.db data/users.csv --to journal --overwrite
+#   python -m tools.migrate_users data/users.csv users_db.json --layout user_db
+#   python -m tools.migrate_users data/users.json --check --strict
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from modules import user_store, user_transfer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EXTENSIONS = {
+    '.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+    '.db': 'sqlite', '.sqlite': 'sqlite', '.sqlite3': 'sqlite',
+}
+FORMATS = ('csv', 'json', 'jsonl', 'sqlite', 'journal')
+SHOWN_ERRORS = 10
+
+
+def guess_format(path: str, given: str | None) -> str:
+    if given:
+        return given
+    kind = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if kind is None:
+        sys.exit(f"Cannot tell the format of '{path}' from its extension; use --from/--to.")
+    return kind
+
+
+def open_reader(kind: str, path: str, args):
+    if kind == 'csv':
+        return user_transfer.read_csv(path)
+    if kind == 'json':
+        return user_transfer.read_json(path, args.chunk_size)
+    if kind == 'jsonl':
+        return user_transfer.read_jsonl(path)
+    if kind == 'sqlite':
+        return user_transfer.read_sqlite(path, args.batch_size)
+    if args.compact and user_transfer.journal_pending(path):
+        # Compaction replays the journal over the whole snapshot in memory.
+        print(f"Compacting '{path}.journal' first...", file=sys.stderr)
+        user_store.JournalUserStore(path).compact()
+    return user_transfer.read_journal(path)
+
+
+def open_writer(kind: str, path: str, args):
+    if kind == 'sqlite':
+        return user_transfer.SQLiteWriter(path)
+    if kind == 'json':
+        return user_transfer.JsonWriter(path, args.overwrite, args.layout)
+    writer = {'csv': user_transfer.CsvWriter, 'jsonl': user_transfer.JsonlWriter,
+              'journal': user_transfer.JournalWriter}[kind]
+    return writer(path, args.overwrite)
+
+
+def peak_memory_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream users between the CSV, JSON and SQLite user formats.")
+    parser.add_argument('source', help="file or database to read")
+    parser.add_argument('destination', nargs='?', help="file or database to write (not needed with --check)")
+    parser.add_argument('--from', dest='source_format', choices=FORMATS, help="format of the source")
+    parser.add_argument('--to', dest='destination_format', choices=FORMATS, help="format of the destination")
+    parser.add_argument('--layout', choices=user_transfer.LAYOUTS, default='users.json',
+                        help="layout of a JSON destination: app2.py's users.json or user_db.USER_DATABASE")
+    parser.add_argument('--batch-size', type=int, default=10000, help="records per write (and per SQLite read)")
+    parser.add_argument('--chunk-size', type=int, default=1 << 20, help="characters per read of a JSON source")
+    parser.add_argument('--overwrite', action='store_true', help="replace an existing destination file")
+    parser.add_argument('--compact', action='store_true',
+                        help="compact a journal source with pending changes first (loads it in memory)")
+    parser.add_argument('--check', action='store_true', help="only validate the source")
+    parser.add_argument('--errors', help="write the invalid records (position, email, reason) to this JSON-lines file")
+    parser.add_argument('--strict', action='store_true', help="exit with status 1 if any record is invalid")
+    parser.add_argument('--progress', type=float, default=5.0, help="seconds between progress lines (0: none)")
+    args = parser.parse_args()
+
+    if args.destination is None and not args.check:
+        parser.error("a destination is required unless --check is given")
+    source_kind = guess_format(args.source, args.source_format)
+    destination_kind = None if args.check else guess_format(args.destination, args.destination_format)
+
+    shown = []
+    errors_file = open(args.errors, 'w', encoding='utf-8') if args.errors else None
+
+    def on_invalid(position, error):
+        if len(shown) < SHOWN_ERRORS:
+            shown.append((position, error))
+        if errors_file is not None:
+            errors_file.write(json.dumps({'position': position, 'email': error.email, 'reason': error.reason}) + '\n')
+
+    last_report = time.perf_counter()
+
+    def on_batch(stats):
+        nonlocal last_report
+        now = time.perf_counter()
+        if args.progress and now - last_report >= args.progress:
+            last_report = now
+            print(f"  {stats.read:>12,} read  {stats.invalid:>9,} invalid  {stats.rate:>10,.0f} records/s",
+                  file=sys.stderr)
+
+    try:
+        records = open_reader(source_kind, args.source, args)
+        writer = None if args.check else open_writer(destination_kind, args.destination, args)
+        stats = user_transfer.transfer(records, writer, args.batch_size, on_invalid, on_batch)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Migration failed: {e}")
+    finally:
+        if errors_file is not None:
+            errors_file.close()
+
+    target = 'validated' if args.check else f"into '{args.destination}' ({destination_kind})"
+    print(f"Read {stats.read:,} record(s) from '{args.source}' ({source_kind}), {target}.")
+    if not args.check:
+        print(f"  written:  {stats.written:,}")
+        print(f"  skipped:  {stats.skipped:,} (already in the destination)")
+    print(f"  invalid:  {stats.invalid:,}")
+    for reason, count in stats.reasons.most_common():
+        print(f"    {count:>10,}  {reason}")
+    for position, error in shown:
+        print(f"    at {position}: {error.email or '?'}: {error.reason}")
+    if stats.invalid > len(shown) and not args.errors:
+        print(f"    ({stats.invalid - len(shown):,} more; use --errors to list them all)")
+    memory = peak_memory_mb()
+    print(f"  {stats.elapsed:.2f}s, {stats.rate:,.0f} records/s"
+          + (f", peak memory {memory:.0f} MB" if memory is not None else ""))
+    if args.strict and stats.invalid:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
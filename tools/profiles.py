@@ -0,0 +1,123 @@
+# tools/profiles.py
+#
+# Works with the request profiles captured by modules/profiling.py.
+#
+#   python -m tools.profiles token --ttl 600
+#       prints an X-Profile header value, signed with SECRET_KEY, that makes
+#       the app profile every request carrying it for the next 10 minutes:
+#       curl -H "X-Profile: <value>" ...
+#
+#   python -m tools.profiles top [--route /login] [--match json] [--sort cumulative]
+#       aggregates every profile in PROFILE_DIR (or --dir) and prints the
+#       hottest functions across them. cProfile (.prof) and sampled
+#       (.sample.json) profiles are reported separately: the first are exact
+#       call counts and times, the second are estimates from stack samples.
+
+import argparse
+import glob
+import json
+import os
+import pstats
+import sys
+import time
+
+from config import DEV_SECRET_KEY, Config
+from modules import profiling
+
+
+def _route_matches(path: str, route: str | None) -> bool:
+    if route is None:
+        return True
+    if path.endswith('.sample.json'):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('route') == route
+    # <time>-<METHOD>-<route slug>-<ms>ms-<pid>.prof
+    return os.path.basename(path).split('-')[2] == profiling.route_slug(route)
+
+
+def _label(file: str, line: int, name: str) -> str:
+    if file == '~':
+        return name  # builtins, e.g. <method 'loads' of ...>
+    return f"{os.path.relpath(file) if file.startswith(os.getcwd()) else file}:{line}({name})"
+
+
+def report_cprofile(paths: list, sort: str, match: str | None, limit: int):
+    stats = pstats.Stats(*paths).stats
+    total = sum(tt for _, _, tt, _, _ in stats.values())
+    rows = []
+    for (file, line, name), (_, calls, tt, ct, _) in stats.items():
+        label = _label(file, line, name)
+        if match and match not in label:
+            continue
+        rows.append((label, calls, tt, ct))
+    rows.sort(key=lambda row: row[3] if sort == 'cumulative' else row[2], reverse=True)
+
+    print(f"cProfile: {len(paths)} profile(s), {total:.3f}s profiled")
+    print(f"{'calls':>10}  {'tottime':>9}  {'cumtime':>9}  {'per call':>9}  {'% total':>7}  function")
+    for label, calls, tt, ct in rows[:limit]:
+        per_call = (ct / calls) if calls else 0.0
+        share = tt / total if total else 0.0
+        print(f"{calls:>10}  {tt:>9.4f}  {ct:>9.4f}  {per_call * 1e3:>7.3f}ms  {share:>7.1%}  {label}")
+
+
+def report_samples(paths: list, sort: str, match: str | None, limit: int):
+    # Each profile's duration is shared out over its samples, so a function's
+    # time is the estimated wall time the request spent in it.
+    totals = {}
+    profiled = 0.0
+    with_samples = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+        if not profile['samples']:
+            continue
+        with_samples += 1
+        duration = profile['duration_ms'] / 1e3
+        profiled += duration
+        per_sample = duration / profile['samples']
+        for file, line, name, own, cumulative in profile['functions']:
+            key = _label(file, line, name)
+            own_total, cumulative_total = totals.get(key, (0.0, 0.0))
+            totals[key] = (own_total + own * per_sample, cumulative_total + cumulative * per_sample)
+    rows = [(label, own, cumulative) for label, (own, cumulative) in totals.items()
+            if not match or match in label]
+    rows.sort(key=lambda row: row[2] if sort == 'cumulative' else row[1], reverse=True)
+
+    print(f"Sampled: {with_samples} of {len(paths)} profile(s) caught samples, {profiled:.3f}s profiled (estimates)")
+    print(f"{'self':>9}  {'self %':>7}  {'cumtime':>9}  {'cum %':>7}  function")
+    for label, own, cumulative in rows[:limit]:
+        print(f"{own:>9.4f}  {own / profiled if profiled else 0:>7.1%}  "
+              f"{cumulative:>9.4f}  {cumulative / profiled if profiled else 0:>7.1%}  {label}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sign profiling requests and aggregate captured profiles.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    token = commands.add_parser('token', help="print a signed X-Profile header value")
+    token.add_argument('--ttl', type=int, default=600, help="seconds the value stays valid")
+
+    top = commands.add_parser('top', help="hottest functions across captured profiles")
+    top.add_argument('--dir', default=Config.PROFILE_DIR)
+    top.add_argument('--route', help="only profiles of this route, e.g. /login/verify_clicks")
+    top.add_argument('--match', help="only functions whose file:line(name) contains this, e.g. json")
+    top.add_argument('--sort', choices=('tottime', 'cumulative'), default='tottime')
+    top.add_argument('--limit', type=int, default=25)
+    args = parser.parse_args()
+
+    if args.command == 'token':
+        if Config.SECRET_KEY == DEV_SECRET_KEY:
+            sys.exit("SECRET_KEY is the development default, so the app does not profile; set SECRET_KEY first.")
+        print(profiling.sign(Config.SECRET_KEY, int(time.time()) + args.ttl))
+    else:
+        prof = [p for p in sorted(glob.glob(os.path.join(args.dir, '*.prof'))) if _route_matches(p, args.route)]
+        sampled = [p for p in sorted(glob.glob(os.path.join(args.dir, '*.sample.json')))
+                   if _route_matches(p, args.route)]
+        if not prof and not sampled:
+            print(f"No profiles in {args.dir}.")
+        if prof:
+            report_cprofile(prof, args.sort, args.match, args.limit)
+        if prof and sampled:
+            print()
+        if sampled:
+            report_samples(sampled, args.sort, args.match, args.limit)
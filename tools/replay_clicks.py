@@ -0,0 +1,100 @@
+# tools/replay_clicks.py
+#
+# Replays recorded click attempts against the users' stored baselines in one
+# batch and reports, for a range of tolerance radii, how many genuine attempts
+# would be accepted and how many impostor attempts would get through. Use it to
+# tune CLICK_TOLERANCE_RADIUS across the whole user base.
+#
+# The input is JSON lines, one attempt per line:
+#
+#   {"email": "a@b.c", "clicks": [{"x": 10, "y": 20}, ...], "genuine": true}
+#
+# ("genuine" defaults to true). Without an input file, --synthetic N generates
+# N random baselines with one genuine and one impostor attempt each.
+#
+#   python -m tools.replay_clicks attempts.jsonl --radii 15 25 35 45
+#   python -m tools.replay_clicks --synthetic 100000
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from config import Config
+from modules import click_matching, user_manager
+
+
+def load_attempts(path: str, n_points: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Returns (baselines, attempts, genuine, skipped) for the attempts in a JSONL file."""
+    baselines, attempts, genuine = [], [], []
+    skipped = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                user = user_manager.get_user(record['email'])
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+                continue
+            if user is None or not user.click_points:
+                skipped += 1
+                continue
+            baselines.append(user.click_points)
+            attempts.append(record.get('clicks'))
+            genuine.append(bool(record.get('genuine', True)))
+    return (click_matching.stack(baselines, n_points), click_matching.stack(attempts, n_points),
+            np.array(genuine, dtype=bool), skipped)
+
+
+def synthetic_attempts(n: int, n_points: int, jitter: float, seed: int = 0):
+    """Random 600x400 baselines, a jittered genuine attempt and a random impostor attempt for each."""
+    rng = np.random.default_rng(seed)
+    size = np.array([600.0, 400.0])
+    baselines = rng.uniform(0, 1, (n, n_points, 2)) * size
+    genuine_attempts = baselines + rng.normal(0, jitter, baselines.shape)
+    impostor_attempts = rng.uniform(0, 1, (n, n_points, 2)) * size
+    return (np.concatenate([baselines, baselines]),
+            np.concatenate([genuine_attempts, impostor_attempts]),
+            np.repeat([True, False], n))
+
+
+def report(baselines, attempts, genuine, radii) -> None:
+    started = time.perf_counter()
+    _, distances = click_matching.match_batch(baselines, attempts, click_matching.TOLERANCE_RADIUS)
+    genuine_rates = click_matching.acceptance_rates(distances[genuine], radii)
+    impostor_rates = click_matching.acceptance_rates(distances[~genuine], radii)
+    elapsed = time.perf_counter() - started
+
+    print(f"Replayed {len(attempts)} attempts ({int(genuine.sum())} genuine, "
+          f"{int((~genuine).sum())} impostor) at {len(radii)} radii in {elapsed * 1e3:.1f} ms.")
+    print(f"{'radius':>8}  {'genuine accepted':>17}  {'impostor accepted':>18}")
+    for radius, g, i in zip(radii, genuine_rates, impostor_rates):
+        print(f"{radius:>8g}  {g:>16.2%}  {i:>17.2%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay click attempts and sweep the tolerance radius.")
+    parser.add_argument('attempts', nargs='?', help="JSONL file of recorded attempts")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="generate N synthetic users instead")
+    parser.add_argument('--points', type=int, default=Config.CLICK_POINTS)
+    parser.add_argument('--jitter', type=float, default=12.0,
+                        help="--synthetic only: std dev (pixels) of genuine clicks around the baseline")
+    parser.add_argument('--radii', type=float, nargs='+', default=list(range(10, 85, 5)))
+    args = parser.parse_args()
+
+    if args.synthetic:
+        baselines, attempts, genuine = synthetic_attempts(args.synthetic, args.points, args.jitter)
+    elif args.attempts:
+        baselines, attempts, genuine, skipped = load_attempts(args.attempts, args.points)
+        if skipped:
+            print(f"Skipped {skipped} line(s): malformed or unknown user without a click baseline.")
+    else:
+        parser.error("give an attempts file or --synthetic N")
+    if len(attempts) == 0:
+        print("No attempts to replay.")
+        sys.exit(1)
+    report(baselines, attempts, genuine, args.radii)
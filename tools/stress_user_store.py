@@ -0,0 +1,95 @@
+# tools/stress_user_store.py
+#
+# Stress test for concurrent writers: N processes create and update users in
+# one shared store at the same time, then the store is checked for lost users
+# or lost updates. Exits with status 1 if anything is missing.
+#
+#   python -m tools.stress_user_store --backend sqlite --processes 8
+#   python -m tools.stress_user_store --backend journal --processes 8 --compact-threshold 50
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from modules import user_store
+
+
+def _email(worker: int, index: int) -> str:
+    return f"worker{worker}-user{index}@stress.test"
+
+
+def _worker(backend, path, compact_threshold, worker, users, updates, start_event):
+    options = {'compact_threshold': compact_threshold} if backend == 'journal' else {}
+    store = user_store.open_store(path, backend=backend, **options)
+    start_event.wait()
+    for index in range(users):
+        email = _email(worker, index)
+        store.create(email, {'click_profile': '[]', 'typing_samples': '[]'})
+        for update in range(updates):
+            store.update_field(email, 'typing_average', float(update))
+        store.update_field(email, 'secret_passkey', f"w{worker}-{index}")
+
+
+def run(backend: str, processes: int, users: int, updates: int, compact_threshold: int) -> list:
+    """Runs the stress test and returns a list of problems (empty on success)."""
+    workdir = tempfile.mkdtemp(prefix='user-store-stress-')
+    path = os.path.join(workdir, 'users.db' if backend == 'sqlite' else 'users.csv')
+
+    ctx = multiprocessing.get_context('spawn')
+    start_event = ctx.Event()
+    workers = [
+        ctx.Process(target=_worker, args=(backend, path, compact_threshold, w, users, updates, start_event))
+        for w in range(processes)
+    ]
+    for p in workers:
+        p.start()
+    started = time.perf_counter()
+    start_event.set()
+    for p in workers:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    problems = [f"worker {i} exited with code {p.exitcode}" for i, p in enumerate(workers) if p.exitcode]
+
+    # Check with a fresh store object so nothing comes from a writer's memory.
+    if backend == 'sqlite':
+        store = user_store.SQLiteUserStore(path)
+    else:
+        store = user_store.JournalUserStore(path, compact_threshold=compact_threshold)
+    for w in range(processes):
+        for index in range(users):
+            email = _email(w, index)
+            record = store.get(email)
+            if record is None:
+                problems.append(f"{email}: user lost")
+            elif record['typing_average'] != float(updates - 1) or record['secret_passkey'] != f"w{w}-{index}":
+                problems.append(f"{email}: update lost ({record['typing_average']}, {record['secret_passkey']})")
+    if store.count() != processes * users:
+        problems.append(f"expected {processes * users} users, found {store.count()}")
+
+    writes = processes * users * (updates + 2)
+    print(f"{backend}: {processes} processes, {writes} writes in {elapsed:.2f}s "
+          f"({writes / elapsed:.0f} writes/s), store at '{path}'")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent multi-process writes against the user store.")
+    parser.add_argument('--backend', choices=['sqlite', 'journal'], default='sqlite')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50, help="Users created by each process.")
+    parser.add_argument('--updates', type=int, default=5, help="Field updates per user.")
+    parser.add_argument('--compact-threshold', type=int, default=100,
+                        help="Journal backend only: compact often so compaction races with writers.")
+    args = parser.parse_args()
+
+    problems = run(args.backend, args.processes, args.users, args.updates, args.compact_threshold)
+    for problem in problems[:20]:
+        print(f"  FAIL {problem}")
+    if problems:
+        print(f"{len(problems)} problem(s) found.")
+        sys.exit(1)
+    print("OK: no lost users or updates.")